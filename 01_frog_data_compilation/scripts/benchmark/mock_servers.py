@@ -0,0 +1,375 @@
+'''
+Local stand-ins for the IUCN, AmphibiaWeb, CCKP and OpenAI APIs, for benchmarking the
+pipeline without live services or real spend.
+
+One threaded HTTP server answers all four APIs under their own path prefix:
+
+    /iucn/api/v4/...          taxa/scientific_name?genus_name=&species_name=, assessment/<id>,
+                              taxa/class/<name>?page=, taxa/family/<name>?page=
+    /amphibiaweb/amphib_ws    ?where-genus=&where-species=
+    /cckp/<dataset>/<code>    ?_format=json
+    /openai/v1/...            chat/completions
+
+Responses are generated deterministically from the species name, so every run sees the
+same data. Each service has its own latency, rate limit (token bucket, requests/sec)
+and 429 injection rate; the OpenAI stand-in can also enforce a tokens-per-minute limit and
+reports both budgets in x-ratelimit-* headers like the real API. GET /__stats returns request / 429 counts per service and
+POST /__reset clears them.
+
+Run standalone (from the repository root):
+    python 01_frog_data_compilation/scripts/benchmark/mock_servers.py --port 8765 --latency 0.02
+and point the pipeline at it with the environment printed on startup.
+'''
+
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import functools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SERVICES = ["iucn", "amphibiaweb", "cckp", "openai"]
+
+# Countries present in geonames.xlsx, so find_location resolves them to CCKP codes
+LOCATIONS = ["Costa Rica", "Panama", "Brazil", "Peru", "Colombia", "Ecuador", "Mexico", "Bolivia", "Argentina", "Chile",
+             "Guatemala", "Honduras", "Nicaragua", "Madagascar", "Cameroon", "India", "China", "Australia", "Indonesia"]
+
+# Share of species the APIs know nothing about
+UNKNOWN_SPECIES_RATE = 0.05
+
+# Synthetic species listed by the IUCN class endpoint, named like run_benchmark's species
+# (25 per genus); family FamilyNNN holds genera NNN*10 to NNN*10+9
+GROUP_SPECIES = 20000
+GROUP_PAGE_SIZE = 100
+
+# Stable pseudo-random generator for one key
+def _rng(*parts):
+    seed = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return random.Random(int(seed[:16], 16))
+
+# Tokens-per-minute reported when no limit is set
+UNLIMITED_TPM = 10_000_000
+
+# Per-service behaviour: added latency, token-bucket rate limit, 429 injection and (for
+# OpenAI) a tokens-per-minute budget
+class ServiceConfig:
+    def __init__(self, latency=0.0, rate_limit=None, error_rate=0.0, tpm=None):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.tokens = rate_limit or 0
+        self.updated = time.monotonic()
+        self.tpm = tpm
+        self.tpm_balance = tpm or 0
+        self.tpm_updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Charge a request's tokens against the per-minute budget. Returns (ok, remaining,
+    # seconds until the budget is full again).
+    def spend(self, tokens):
+        if not self.tpm:
+            return True, UNLIMITED_TPM - tokens, 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tpm_balance = min(self.tpm, self.tpm_balance + (now - self.tpm_updated) * self.tpm / 60)
+            self.tpm_updated = now
+            ok = self.tpm_balance >= tokens
+            if ok:
+                self.tpm_balance -= tokens
+            return ok, int(self.tpm_balance), (self.tpm - self.tpm_balance) * 60 / self.tpm
+
+    # Take one token from the bucket; False means the request should get a 429
+    def admit(self):
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.updated) * self.rate_limit)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+### RESPONSE BODIES ###
+
+def _scientific_name(genus, species):
+    return f"{genus.strip().capitalize()} {species.strip().lower()}"
+
+def _known(name):
+    return _rng(name, "known").random() >= UNKNOWN_SPECIES_RATE
+
+def _assessment_id(name):
+    return int(hashlib.sha256(name.encode("utf-8")).hexdigest()[:8], 16)
+
+def iucn_taxa(genus, species):
+    name = _scientific_name(genus, species)
+    if not _known(name):
+        return {"taxon": {"scientific_name": name}, "assessments": []}
+    return {
+        "taxon": {"scientific_name": name},
+        "assessments": [
+            {"assessment_id": _assessment_id(name) + 1, "latest": False, "year_published": "2004"},
+            {"assessment_id": _assessment_id(name), "latest": True, "year_published": "2020"},
+        ],
+    }
+
+# Known species of the class / family listings, built once
+@functools.lru_cache(maxsize=None)
+def _group_species():
+    return [n for n in (f"Genus{i // 25:04d} species{i:05d}" for i in range(GROUP_SPECIES)) if _known(n)]
+
+# One page of a class / family listing and its total page count
+def iucn_group(rank, group, page, latest_only):
+    names = _group_species()
+    if rank == "family":
+        match = re.fullmatch(r"Family(\d+)", group)
+        names = [n for n in names if match and int(n[5:9]) // 10 == int(match.group(1))]
+
+    per_page = GROUP_PAGE_SIZE if latest_only else GROUP_PAGE_SIZE // 2 # two assessments per species without latest=true
+    assessments = []
+    for name in names[(page - 1) * per_page:page * per_page]:
+        if not latest_only:
+            assessments.append({"taxon_scientific_name": name, "assessment_id": _assessment_id(name) + 1, "latest": False})
+        assessments.append({"taxon_scientific_name": name, "assessment_id": _assessment_id(name), "latest": True})
+    return {"assessments": assessments}, max(1, -(-len(names) // per_page))
+
+def iucn_assessment(assessment_id):
+    rng = _rng(assessment_id, "assessment")
+    lower = rng.randrange(0, 1500, 50)
+    return {
+        "assessment_id": assessment_id,
+        "supplementary_info": {"lower_elevation_limit": lower, "upper_elevation_limit": lower + rng.randrange(100, 2000, 50)},
+        "habitats": [{"code": f"{rng.choice([1, 3, 5, 14, 15])}_{rng.randint(1, 9)}"} for _ in range(rng.randint(1, 4))],
+        "locations": [{"description": {"en": loc}} for loc in rng.sample(LOCATIONS, rng.randint(1, 4))],
+        "documentation": {"range": "Synthetic benchmark assessment. " * 20, "habitats": "Forest and streams. " * 20},
+    }
+
+def amphibiaweb_xml(genus, species):
+    name = _scientific_name(genus, species)
+    if not _known(name):
+        return "<?xml version=\"1.0\"?><amphibiaweb><error>No species found</error></amphibiaweb>"
+    rng = _rng(name, "amphibiaweb")
+    male, female = rng.randint(20, 60), rng.randint(25, 80)
+    clutch = rng.randint(10, 300)
+    filler = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 30
+    return (
+        "<?xml version=\"1.0\"?><amphibiaweb><amphibian>"
+        f"<genus>{genus}</genus><species>{species}</species><common_name>Synthetic Frog</common_name>"
+        f"<description>Males measure {male}-{male + 6} mm SVL and females {female}-{female + 8} mm SVL. {filler}</description>"
+        f"<life_history>Clutches of {clutch}-{clutch * 2} eggs, {rng.randint(15, 40) / 10} mm in diameter, "
+        f"are laid {rng.choice(['in ponds', 'in leaf litter', 'on leaves above streams'])}. {filler}</life_history>"
+        f"<distribution>{filler}</distribution><comments>{filler}</comments>"
+        "</amphibian></amphibiaweb>"
+    )
+
+def cckp_climatology(code):
+    rng = _rng(code, "cckp")
+    periods = [f"{year}-07" for year in range(1995, 2015, 5)]
+    return {"data": {
+        "tas": {code: {p: round(rng.uniform(5, 30), 2) for p in periods}},
+        "pr": {code: {p: round(rng.uniform(200, 3000), 2) for p in periods}},
+    }}
+
+# Chat completion answering whatever the pipeline asked, with token usage
+def openai_completion(body):
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    rng = _rng(prompt)
+
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        measurement = lambda: {"avg": round(rng.uniform(1, 80), 1), "uncertainty": round(rng.uniform(0, 5), 1)}
+        content = json.dumps({
+            "male_svl": measurement(), "female_svl": measurement(), "avg_svl": measurement(),
+            "min_clutch_size": rng.randint(10, 100), "max_clutch_size": rng.randint(100, 400),
+            "egg_diameter": measurement(),
+        })
+    elif "reproductive style" in prompt:
+        content = f"{rng.randint(0, 2)}, {rng.randint(40, 100)}"
+    elif "+-" in prompt:
+        content = f"{rng.randint(20, 80)} +- {rng.randint(0, 6)}"
+    else:
+        content = str(rng.randint(1, 300))
+
+    prompt_tokens = len(prompt) // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-mock-{rng.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+### SERVER ###
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args): # keep benchmark output readable
+        pass
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else (body if isinstance(body, str) else json.dumps(body)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _service(self, path):
+        prefix = path.strip("/").split("/", 1)[0]
+        return prefix if prefix in SERVICES else None
+
+    # Apply the service's latency, rate limit and 429 injection; True if the request may proceed
+    def _admit(self, service):
+        config = self.server.configs[service]
+        self.server.count(service, "requests")
+        if config.latency:
+            time.sleep(config.latency)
+        if not config.admit() or random.random() < config.error_rate:
+            self.server.count(service, "rate_limited")
+            self._send(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error", "code": "rate_limit_exceeded"}},
+                       headers={"Retry-After": "1", "retry-after-ms": "100"})
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/__stats":
+            return self._send(200, self.server.snapshot())
+
+        service = self._service(url.path)
+        if service is None or service == "openai":
+            return self._send(404, {"error": "not found"})
+        if not self._admit(service):
+            return
+
+        if service == "iucn":
+            if url.path.endswith("/taxa/scientific_name"):
+                return self._send(200, iucn_taxa(query.get("genus_name", ""), query.get("species_name", "")))
+            match = re.search(r"/assessment/(\d+)$", url.path)
+            if match:
+                return self._send(200, iucn_assessment(int(match.group(1))))
+            match = re.search(r"/taxa/(class|family)/([^/]+)$", url.path)
+            if match:
+                body, total_pages = iucn_group(match.group(1), match.group(2), int(query.get("page", 1)), query.get("latest") == "true")
+                return self._send(200, body, headers={"total-pages": str(total_pages)})
+        elif service == "amphibiaweb":
+            # Pages carry an ETag so revalidation (cache TTL, --changed-only checks) gets a 304
+            page = amphibiaweb_xml(query.get("where-genus", ""), query.get("where-species", ""))
+            etag = '"' + hashlib.sha256(page.encode("utf-8")).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, b"", "text/xml", headers={"ETag": etag})
+            return self._send(200, page, "text/xml", headers={"ETag": etag})
+        elif service == "cckp":
+            return self._send(200, cckp_climatology(url.path.rstrip("/").rsplit("/", 1)[-1]))
+
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        if url.path == "/__reset":
+            self.server.reset()
+            return self._send(200, {"reset": True})
+
+        if self._service(url.path) != "openai" or not url.path.endswith("/chat/completions"):
+            return self._send(404, {"error": "not found"})
+        if not self._admit("openai"):
+            return
+
+        config = self.server.configs["openai"]
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        ok, remaining_tokens, reset_tokens = config.spend(len(prompt) // 4 + (body.get("max_tokens") or 256))
+        if not ok:
+            self.server.count("openai", "rate_limited")
+            return self._send(429, {"error": {"message": "Rate limit reached for tokens per min (mock)", "type": "tokens", "code": "rate_limit_exceeded"}},
+                              headers={"retry-after-ms": str(int(reset_tokens * 1000)), "x-ratelimit-remaining-tokens": "0"})
+
+        limit = int(config.rate_limit * 60) if config.rate_limit else 10000
+        headers = {
+            "x-ratelimit-limit-requests": str(limit),
+            "x-ratelimit-remaining-requests": str(max(0, int(config.tokens * 60)) if config.rate_limit else limit - 1),
+            "x-ratelimit-reset-requests": "1s",
+            "x-ratelimit-limit-tokens": str(config.tpm or UNLIMITED_TPM),
+            "x-ratelimit-remaining-tokens": str(remaining_tokens),
+            "x-ratelimit-reset-tokens": f"{reset_tokens:.3f}s",
+        }
+        self._send(200, openai_completion(body), headers=headers)
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, configs):
+        super().__init__(address, MockHandler)
+        self.configs = configs
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {service: {"requests": 0, "rate_limited": 0} for service in SERVICES}
+
+    def count(self, service, key):
+        with self.lock:
+            self.counts[service][key] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.counts))
+
+    # Environment pointing the pipeline's clients at this server
+    def environment(self):
+        base = f"http://{self.server_address[0]}:{self.server_address[1]}"
+        return {
+            "IUCN_API_URL": f"{base}/iucn/api/v4",
+            "AMPHIBIAWEB_API_URL": f"{base}/amphibiaweb/amphib_ws",
+            "CCKP_API_URL": f"{base}/cckp/cmip6-x0.25_climatology_tas,pr_climatology_annual_1995-2014_median_historical_ensemble_all_mean",
+            "OPENAI_BASE_URL": f"{base}/openai/v1",
+            "OPENAI_API_KEY": "mock-key",
+            "IUCN_API_KEY": "mock-key",
+        }
+
+# Start the mock server on a background thread; port 0 picks a free port
+def start_server(port=0, latency=0.0, rate_limit=None, error_rate=0.0, overrides=None, openai_tpm=None):
+    configs = {}
+    for service in SERVICES:
+        settings = {"latency": latency, "rate_limit": rate_limit, "error_rate": error_rate}
+        if service == "openai":
+            settings["tpm"] = openai_tpm
+        settings.update((overrides or {}).get(service, {}))
+        configs[service] = ServiceConfig(**settings)
+
+    server = MockServer(("127.0.0.1", port), configs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock IUCN / AmphibiaWeb / CCKP / OpenAI APIs.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests/sec allowed per service")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--openai-tpm", type=int, default=None, help="OpenAI tokens/minute budget")
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency, args.rate_limit, args.error_rate, openai_tpm=args.openai_tpm)
+    for key, value in server.environment().items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,198 @@
+'''
+Throughput benchmark for the pipeline stages against local mock APIs (mock_servers.py).
+
+For each scale (number of synthetic species) and stage, the stage runs in its own child
+process with cold caches: the IUCN store, AmphibiaWeb cache, CCKP table, LLM completion
+cache and journals all point into a fresh run directory. The report gives species/sec,
+requests per species for each mock API (and how many were rate limited), the child's
+peak memory and its token usage / estimated cost from metrics.py, so regressions show
+up without live APIs or spend. The fetch engine's client-side rate limits are switched off
+(server-side limits come from --rate-limit) unless FETCH_<SERVICE>_RATE is set.
+
+Usage (from the repository root):
+    python 01_frog_data_compilation/scripts/benchmark/run_benchmark.py
+    python 01_frog_data_compilation/scripts/benchmark/run_benchmark.py --scales 100 1000 10000 --latency 0.02
+    python 01_frog_data_compilation/scripts/benchmark/run_benchmark.py --stages altitude habitat --rate-limit 50 --error-rate 0.02
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import urllib.request
+from mock_servers import start_server, SERVICES
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FROGGY_VARS = os.path.join(SCRIPTS_DIR, "froggy_vars")
+GENERIC_SCRIPTS = os.path.join(SCRIPTS_DIR, "..", "..", "02_generic_data_compilation", "scripts")
+
+STAGES = ["egg_analysis", "temp_and_rainfall", "habitat", "altitude", "generic_info_retrieval"]
+DEFAULT_SCALES = [100, 1000]
+REPORT_FILE = "benchmark_report.json"
+
+# Deterministic synthetic "Genus species" names, 25 species per genus
+def synthetic_species(count):
+    return [f"Genus{i // 25:04d} species{i:05d}" for i in range(count)]
+
+# Run one stage over the names in this (child) process
+def run_child_stage(stage, names):
+    if stage == "generic_info_retrieval":
+        sys.path.append(GENERIC_SCRIPTS)
+        from generic_info_retrieval import retrieve_info
+        return retrieve_info(names)
+
+    sys.path.append(FROGGY_VARS)
+    from metrics import scope
+    module = __import__(stage)
+    with scope(stage=stage):
+        return module.run_stage(names)
+
+# Child entry point: run the stage and write timing / memory to result_file
+def child_main(stage, names_file, result_file):
+    with open(names_file, encoding="utf-8") as f:
+        names = json.load(f)
+
+    start = time.perf_counter()
+    df = run_child_stage(stage, names)
+    elapsed = time.perf_counter() - start
+
+    import metrics # importable once the stage has put froggy_vars on the path
+    from dead_letter import failed_species
+    llm = metrics.write_report(stage)["llm"]["totals"]
+
+    result = {
+        "rows": len(df),
+        "seconds": elapsed,
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # KiB on Linux
+        "tokens": llm["prompt_tokens"] + llm["completion_tokens"],
+        "cost_usd": llm["cost_usd"],
+        "failed_species": len(failed_species(stage)),
+    }
+    with open(result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+def _server_stats(server, reset=False):
+    base = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    if reset:
+        urllib.request.urlopen(urllib.request.Request(f"{base}/__reset", data=b"{}", method="POST")).read()
+    with urllib.request.urlopen(f"{base}/__stats") as response:
+        return json.load(response)
+
+# Environment giving a child its own cold caches and pointing it at the mock server
+def _stage_environment(server, run_dir):
+    env = dict(os.environ)
+    env.update(server.environment())
+    env.update({
+        "IUCN_STORE_PATH": os.path.join(run_dir, "iucn_assessments.sqlite"),
+        "AMPHIBIAWEB_CACHE_DIR": os.path.join(run_dir, "amphibiaweb"),
+        "CCKP_TABLE_PATH": os.path.join(run_dir, "cckp_climatology.sqlite"),
+        "LLM_CACHE_PATH": os.path.join(run_dir, "llm_completions.sqlite"),
+        "JOURNAL_DIR": os.path.join(run_dir, "journals"),
+        "METRICS_DIR": os.path.join(run_dir, "metrics"),
+        "DEAD_LETTER_PATH": os.path.join(run_dir, "dead_letter.jsonl"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    for service in ("IUCN", "AMPHIBIAWEB", "CCKP"):
+        env.setdefault(f"FETCH_{service}_RATE", "0")
+    return env
+
+# Run one stage at one scale in a child process and collect its measurements
+def bench_stage(server, stage, names, work_dir):
+    run_dir = os.path.join(work_dir, f"{stage}_{len(names)}")
+    os.makedirs(run_dir, exist_ok=True)
+    names_file = os.path.join(run_dir, "names.json")
+    result_file = os.path.join(run_dir, "result.json")
+    log_file = os.path.join(run_dir, "stage.log")
+    with open(names_file, "w", encoding="utf-8") as f:
+        json.dump(names, f)
+
+    _server_stats(server, reset=True)
+    with open(log_file, "w", encoding="utf-8") as log:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", stage, names_file, result_file],
+            env=_stage_environment(server, run_dir), stdout=log, stderr=subprocess.STDOUT,
+        )
+    counts = _server_stats(server)
+
+    if completed.returncode != 0 or not os.path.exists(result_file):
+        print(f"  {stage}: FAILED (exit {completed.returncode}), see {log_file}")
+        return {"stage": stage, "species": len(names), "failed": True, "log": log_file}
+
+    with open(result_file, encoding="utf-8") as f:
+        result = json.load(f)
+
+    requests = {service: counts[service]["requests"] for service in SERVICES}
+    rate_limited = {service: counts[service]["rate_limited"] for service in SERVICES}
+    return {
+        "stage": stage,
+        "species": len(names),
+        "seconds": round(result["seconds"], 3),
+        "species_per_sec": round(len(names) / result["seconds"], 2) if result["seconds"] else None,
+        "requests_per_species": round(sum(requests.values()) / len(names), 3),
+        "requests": requests,
+        "rate_limited": rate_limited,
+        "peak_memory_mb": round(result["peak_memory_mb"], 1),
+        "tokens_per_species": round(result["tokens"] / len(names), 1),
+        "estimated_cost_usd": round(result["cost_usd"], 4),
+        "failed_species": result["failed_species"],
+    }
+
+def print_report(results):
+    header = f"{'stage':<24}{'species':>8}{'sec':>10}{'sp/s':>10}{'req/sp':>8}{'429s':>7}{'peak MB':>9}{'tok/sp':>9}{'est $':>9}  requests by API"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        if r.get("failed"):
+            print(f"{r['stage']:<24}{r['species']:>8}  FAILED ({r['log']})")
+            continue
+        by_api = ", ".join(f"{s}={n}" for s, n in r["requests"].items() if n)
+        print(f"{r['stage']:<24}{r['species']:>8}{r['seconds']:>10.2f}{r['species_per_sec']:>10.1f}{r['requests_per_species']:>8.2f}"
+              f"{sum(r['rate_limited'].values()):>7}{r['peak_memory_mb']:>9.1f}{r['tokens_per_species']:>9.1f}{r['estimated_cost_usd']:>9.4f}  {by_api}")
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        child_main(*sys.argv[2:])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages against local mock APIs.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="synthetic species counts (e.g. 100 1000 10000)")
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every mock response")
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests/sec allowed per mock API")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of mock requests answered with 429")
+    parser.add_argument("--openai-tpm", type=int, default=None, help="tokens/minute the mock OpenAI API allows")
+    parser.add_argument("--report", default=REPORT_FILE, help=f"JSON report path (default {REPORT_FILE})")
+    parser.add_argument("--keep", action="store_true", help="keep the per-run cache directories")
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, rate_limit=args.rate_limit, error_rate=args.error_rate, openai_tpm=args.openai_tpm)
+    work_dir = tempfile.mkdtemp(prefix="frog_benchmark_")
+    print(f"Mock APIs on port {server.server_address[1]}; run directories in {work_dir}")
+
+    results = []
+    try:
+        for scale in args.scales:
+            names = synthetic_species(scale)
+            for stage in args.stages:
+                print(f"Running {stage} on {scale} species...")
+                results.append(bench_stage(server, stage, names, work_dir))
+    finally:
+        server.shutdown()
+        if not args.keep and not any(r.get("failed") for r in results): # keep logs of failed runs
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_report(results)
+
+    report = {
+        "settings": {"latency": args.latency, "rate_limit": args.rate_limit, "error_rate": args.error_rate, "openai_tpm": args.openai_tpm},
+        "results": results,
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to {args.report}")
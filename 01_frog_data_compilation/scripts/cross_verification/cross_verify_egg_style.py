@@ -1,22 +1,12 @@
+import os
+import sys
 import pandas as pd
-from openpyxl import load_workbook
 
-# Extract names of green-highlighted rows from reference spreadsheet
-def get_green_highlighted_names(filepath, sheet_name="All Frogs"):
-    wb = load_workbook(filename=filepath, data_only=True)
-    ws = wb[sheet_name]
-
-    green_rows = []
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=1):
-        for cell in row:
-            if cell.fill.start_color.index == "FF92D050": # Hex for green
-                green_rows.append(cell.row)
-
-    df = pd.read_excel(filepath, sheet_name=sheet_name)
-    df_filtered = df.iloc[[r - 2 for r in green_rows]]  # Adjust index for header
-
-    df_filtered["Name"] = df_filtered["Name"].astype(str).str.strip()
-    return set(df_filtered["Name"].tolist())
+# Shared pipeline modules live in froggy_vars, which import each other as siblings
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "froggy_vars"))
+from results_store import read_columns
+from reference_sheet import load_reference, highlighted_names
+from reproductive_style import matches_reference
 
 # Initialize confidence tracking lists
 correct_confidences = []
@@ -24,23 +14,23 @@ incorrect_confidences = []
 
 # Load spreadsheets for cross-checking
 cross_df = pd.read_csv("01_frog_data_compilation/results/cross_verification_results.csv")
-ref_df = pd.read_excel("01_frog_data_compilation/data/Reference_Froggy_Spreadsheet.xlsx")
-analysis_df = pd.read_csv("01_frog_data_compilation/results/froggy_analysis_results.csv")
+ref_df = load_reference(columns=["Egg Style"])
+analysis_df = read_columns(["Egg Style"])
 confidence_df = pd.read_csv("01_frog_data_compilation/results/egg_style_confidence.csv")
 
 # Standardize and clean 'Name' and 'Egg Style' fields
 ref_df["Name"] = ref_df["Name"].astype(str).str.strip()
-ref_df["Egg Style"] = ref_df["Egg Style"].fillna("-").astype(str).str.strip()
+ref_df["Egg Style"] = ref_df["Egg Style"].astype("string").fillna("-").str.strip()
 
 analysis_df["Name"] = analysis_df["Name"].astype(str).str.strip()
-analysis_df["Egg Style"] = analysis_df["Egg Style"].fillna("-").astype(str).str.strip()
+analysis_df["Egg Style"] = analysis_df["Egg Style"].astype("string").fillna("-").str.strip()
 
 cross_df["Name"] = cross_df["Name"].astype(str).str.strip()
 if "Egg Style" not in cross_df.columns:
     cross_df["Egg Style"] = "-"
 
 # Filter analysis to only green-highlighted names
-green_names = get_green_highlighted_names("01_frog_data_compilation/data/Reference_Froggy_Spreadsheet.xlsx")
+green_names = highlighted_names("01_frog_data_compilation/data/Reference_Froggy_Spreadsheet.xlsx", "All Frogs") # cached name -> fill index
 analysis_df = analysis_df[analysis_df["Name"].isin(green_names)]
 
 # Build lookup dictionaries for reference, analysis, and confidence
@@ -68,7 +58,7 @@ def determine_egg_style(name):
     confidence = confidence_dict.get(name, None)
 
     # Consider slight off-by-one misclassifications as acceptable
-    if (analysis_int == 0 and ref_int == 1) or (analysis_int == 1 and ref_int == 2):
+    if matches_reference(analysis_int, ref_int):
         if confidence is not None and confidence != "-":
             correct_confidences.append(int(confidence))
         return str(analysis_int)
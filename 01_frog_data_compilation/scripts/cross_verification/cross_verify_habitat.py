@@ -1,42 +1,71 @@
+import os
+import sys
+import numpy as np
 import pandas as pd
 
+# Shared pipeline modules live in froggy_vars, which import each other as siblings
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "froggy_vars"))
+from results_store import read_columns
+from reference_sheet import load_reference
+
 # File paths
 reference_path = '01_frog_data_compilation/data/Reference_Froggy_Spreadsheet.xlsx'
-analysis_path = '01_frog_data_compilation/results/froggy_analysis_results.csv'
 cross_verification_path = '01_frog_data_compilation/results/cross_verification_results.csv'
 
 # Habitat columns to check (IUCN top-level codes)
 columns_to_check = ['1', '2', '3', '4', '5', '6', '7', '8', '9', '13', '14', '15', '16']
 
+confusion_path = '01_frog_data_compilation/results/habitat_confusion.csv'
+
 # Load reference, analysis, and cross-verification dataframes
-df_reference = pd.read_excel(reference_path, dtype=str)
-df_analysis = pd.read_csv(analysis_path, dtype=str)
+df_reference = load_reference(reference_path, columns=columns_to_check)
+df_analysis = read_columns(columns_to_check)
 df_cross = pd.read_csv(cross_verification_path, dtype=str)
 
-# Use species name as index for fast lookup
-df_reference.set_index('Name', inplace=True)
-df_analysis.set_index('Name', inplace=True)
+# Align both sides to the cross-verification rows as (species x code) float matrices, NaN = missing
+def habitat_matrix(df, names):
+    df = df.drop_duplicates("Name").set_index("Name").reindex(names)
+    return df[columns_to_check].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+names = df_cross["Name"].str.strip()
+ref = habitat_matrix(df_reference, names)
+ours = habitat_matrix(df_analysis, names)
+
+# Compare every species/code cell at once
+compared = ~(np.isnan(ref) | np.isnan(ours))
+mismatch = compared & (ref != ours)
+ref_present, ours_present = compared & (ref == 1), compared & (ours == 1)
+
+# Cell results as before: '-' if either side is missing, the shared value if equal, else 'invalid'
+cells = np.where(compared, ref, np.nan).astype(object)
+cells[np.isnan(ref) | np.isnan(ours)] = "-"
+cells[mismatch] = "invalid"
+for j, col in enumerate(columns_to_check):
+    df_cross[col] = [v if isinstance(v, str) else str(int(v)) for v in cells[:, j]]
 
-# Compare individual habitat column values between reference and analysis
-def compare_values(name, col):
-    val_ref = df_reference.at[name, int(col)] if name in df_reference.index and int(col) in df_reference.columns else "-" # stores it as nums not str
-    val_analysis = df_analysis.at[name, col] if name in df_analysis.index and col in df_analysis.columns else "-"
+# Per-species bitmask of mismatched codes (bit j = columns_to_check[j]), '-' if nothing was comparable
+bits = mismatch.astype(np.int64) @ (np.int64(1) << np.arange(len(columns_to_check), dtype=np.int64))
+df_cross["Habitat Mismatch Mask"] = np.where(compared.any(axis=1), bits.astype(str), "-")
 
-    val_ref = val_ref.strip() if isinstance(val_ref, str) else "-"
-    val_analysis = val_analysis.strip() if isinstance(val_analysis, str) else "-"
+# Per-code confusion counts, treating the reference as ground truth
+tp = (ref_present & ours_present).sum(axis=0)
+fp = (~ref_present & ours_present).sum(axis=0)
+fn = (ref_present & ~ours_present).sum(axis=0)
+tn = (compared & ~ref_present & ~ours_present).sum(axis=0)
 
-    # Handle missing or empty values
-    if val_ref == "-" or val_ref == "" or val_analysis == "-" or val_analysis == "":
-        print("BREH")
-        return "-"
-    elif val_ref == val_analysis:
-        return val_ref
-    else:
-        return "invalid"
+with np.errstate(divide="ignore", invalid="ignore"):
+    df_confusion = pd.DataFrame({
+        "Code": columns_to_check,
+        "Compared": compared.sum(axis=0),
+        "TP": tp, "FP": fp, "FN": fn, "TN": tn,
+        "Precision": np.round(tp / (tp + fp), 3),
+        "Recall": np.round(tp / (tp + fn), 3),
+        "Missing": (~compared).sum(axis=0),
+    })
 
-# Apply comparison to each species for each habitat code
-for col in columns_to_check:
-    df_cross[col] = df_cross['Name'].apply(lambda name: compare_values(name, col))
+print(df_confusion.to_string(index=False))
+print(f"Species with at least one habitat mismatch: {int(mismatch.any(axis=1).sum())} of {int(compared.any(axis=1).sum())} compared")
 
-# Save updated cross-verification file with habitat comparisons
+# Save updated cross-verification file with habitat comparisons, plus the per-code statistics
 df_cross.to_csv(cross_verification_path, index=False)
+df_confusion.to_csv(confusion_path, index=False, na_rep="-")
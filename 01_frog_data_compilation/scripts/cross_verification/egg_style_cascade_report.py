@@ -0,0 +1,90 @@
+'''
+Escalation rate and accuracy impact of the egg style model cascade (reproductive_style.py
+run with EGG_STYLE_CASCADE=1), measured on the green-highlighted reference rows that
+cross_verify_egg_style.py checks.
+
+The cascade run keeps the first model's answer next to the final one in
+egg_style_confidence.csv, so the accuracy of the first model alone, and of every threshold
+up to the one used, is computed without new API calls. A single-model run's confidence
+CSV (e.g. gpt-4o on every species) can be passed as a baseline.
+
+Usage (from the repository root):
+    python 01_frog_data_compilation/scripts/cross_verification/egg_style_cascade_report.py
+    python 01_frog_data_compilation/scripts/cross_verification/egg_style_cascade_report.py --baseline gpt4o_egg_style_confidence.csv
+'''
+
+import os
+import sys
+import argparse
+import pandas as pd
+
+# Shared pipeline modules live in froggy_vars, which import each other as siblings
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "froggy_vars"))
+from reference_sheet import load_reference, highlighted_names
+from reproductive_style import confident, matches_reference, CONFIDENCE_SPREADSHEET, CASCADE_THRESHOLD
+
+REFERENCE_FILE = "01_frog_data_compilation/data/Reference_Froggy_Spreadsheet.xlsx"
+OUTPUT_FILE = "01_frog_data_compilation/results/egg_style_cascade_report.csv"
+
+# Whether each answer matches the reference; answers that don't parse count as wrong
+def correct(styles, refs):
+    def check(style, ref):
+        try:
+            return matches_reference(style, ref)
+        except ValueError:
+            return False
+    return pd.Series([check(s, r) for s, r in zip(styles, refs)], index=styles.index, dtype=bool)
+
+# Green-highlighted species with a numeric reference style, joined to a confidence CSV
+def scored_rows(confidence_file):
+    ref_df = load_reference(columns=["Egg Style"]).drop_duplicates("Name")
+    ref_df["Name"] = ref_df["Name"].astype(str).str.strip()
+    ref_df["Reference Egg Style"] = pd.to_numeric(ref_df["Egg Style"], errors="coerce")
+    ref_df = ref_df[ref_df["Name"].isin(highlighted_names(REFERENCE_FILE, "All Frogs")) & ref_df["Reference Egg Style"].notna()]
+
+    df = pd.read_csv(confidence_file, dtype=str, keep_default_na=False)
+    df["Name"] = df["Name"].str.strip()
+    df = df[df["Model"] != "-"] if "Model" in df.columns else df[df["Egg Style"] != "-"] # species never asked
+    return df.merge(ref_df[["Name", "Reference Egg Style"]], on="Name", how="inner")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the egg style model cascade against the reference sheet.")
+    parser.add_argument("--confidence", default=CONFIDENCE_SPREADSHEET, help="confidence CSV from a cascade run")
+    parser.add_argument("--baseline", default=None, help="confidence CSV from a single-model run to compare against")
+    args = parser.parse_args()
+
+    df = scored_rows(args.confidence)
+    if "First Egg Style" not in df.columns:
+        sys.exit(f"{args.confidence} is not from a cascade run (no First Egg Style column); rerun with EGG_STYLE_CASCADE=1")
+    if df.empty:
+        sys.exit("No green-highlighted reference rows with an egg style were classified")
+
+    refs = df["Reference Egg Style"].astype(int)
+    escalated = df["Escalated"] == "True"
+    first_correct = correct(df["First Egg Style"], refs)
+    final_correct = correct(df["Egg Style"], refs)
+
+    # Escalated rows hold the final model's answer, so any lower threshold is a subset of them
+    first_kept = pd.Series([confident(s, c, 0) for s, c in zip(df["First Egg Style"], df["First Confidence"])], index=df.index)
+    rows = [{"Setting": "first model only", "Escalation Rate": 0.0, "Accuracy": first_correct.mean()}]
+    confidences = pd.to_numeric(df["First Confidence"], errors="coerce")
+    for t in range(10, int(CASCADE_THRESHOLD), 10):
+        escalate_t = escalated & (~first_kept | (confidences < t))
+        rows.append({"Setting": f"cascade < {t}", "Escalation Rate": escalate_t.mean(), "Accuracy": final_correct.where(escalate_t, first_correct).mean()})
+    rows.append({"Setting": f"cascade < {CASCADE_THRESHOLD:g} (run)", "Escalation Rate": escalated.mean(), "Accuracy": final_correct.mean()})
+
+    if args.baseline:
+        baseline = scored_rows(args.baseline)
+        baseline = baseline[baseline["Name"].isin(df["Name"])]
+        rows.append({"Setting": f"baseline ({os.path.basename(args.baseline)})", "Escalation Rate": None,
+                     "Accuracy": correct(baseline["Egg Style"], baseline["Reference Egg Style"].astype(int)).mean()})
+
+    report = pd.DataFrame(rows)
+    report.insert(1, "Species", len(df))
+    print(f"Egg style cascade on {len(df)} green-highlighted reference species "
+          f"({escalated.sum()} escalated, {(~first_correct & final_correct & escalated).sum()} fixed, "
+          f"{(first_correct & ~final_correct & escalated).sum()} broken by escalation):")
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+    report.to_csv(OUTPUT_FILE, index=False)
+    print(f"Report saved to {OUTPUT_FILE}")
@@ -0,0 +1,67 @@
+'''
+Vectorized interval-overlap comparison between our results and the reference sheet.
+
+Each field group is a pair of columns describing an interval, either
+value / uncertainty (interval = value ± uncertainty) or min / max. Both sides are
+coerced to float arrays once and every row is classified with NumPy masks:
+
+    exact    both numbers equal               -> the reference values
+    overlap  intervals intersect              -> "overlap"
+    invalid  intervals are disjoint           -> "invalid"
+    missing  any of the four numbers absent   -> "-"
+'''
+
+import numpy as np
+import pandas as pd
+
+VALUE_UNCERTAINTY = "value_uncertainty"
+MIN_MAX = "min_max"
+
+# Coerce a column to a float array; '-', blanks, text and nulls become NaN
+def to_float(values):
+    return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+
+# Classify every row of one field group; returns two object arrays (one per column)
+def compare_intervals(ref_a, ref_b, my_a, my_b, kind):
+    ref_a, ref_b, my_a, my_b = (to_float(v) for v in (ref_a, ref_b, my_a, my_b))
+
+    valid = ~(np.isnan(ref_a) | np.isnan(ref_b) | np.isnan(my_a) | np.isnan(my_b))
+    exact = valid & (ref_a == my_a) & (ref_b == my_b)
+
+    if kind == VALUE_UNCERTAINTY:
+        ref_low, ref_high = ref_a - ref_b, ref_a + ref_b
+        my_low, my_high = my_a - my_b, my_a + my_b
+    elif kind == MIN_MAX:
+        ref_low, ref_high = ref_a, ref_b
+        my_low, my_high = my_a, my_b
+    else:
+        raise ValueError(f"Unknown comparison type: {kind}")
+
+    overlap = valid & ~exact & (ref_low <= my_high) & (my_low <= ref_high)
+    invalid = valid & ~exact & ~overlap
+
+    out_a = np.full(len(ref_a), "-", dtype=object)
+    out_b = np.full(len(ref_a), "-", dtype=object)
+    out_a[exact], out_b[exact] = ref_a[exact], ref_b[exact]
+    out_a[overlap] = out_b[overlap] = "overlap"
+    out_a[invalid] = out_b[invalid] = "invalid"
+    return out_a, out_b
+
+# Join reference and our results on Name and compare each field group.
+# groups: [{"columns": [col_a, col_b], "type": VALUE_UNCERTAINTY | MIN_MAX}, ...]
+def compare_groups(df_ref, df_my, groups, how="left"):
+    df_ref = df_ref.drop_duplicates("Name")
+    df_my = df_my.drop_duplicates("Name")
+    df_merged = pd.merge(df_ref, df_my, on="Name", suffixes=("_ref", "_my"), how=how)
+
+    df_comparison = pd.DataFrame({"Name": df_merged["Name"]})
+    for group in groups:
+        col_a, col_b = group["columns"]
+        out_a, out_b = compare_intervals(
+            df_merged[f"{col_a}_ref"], df_merged[f"{col_b}_ref"],
+            df_merged[f"{col_a}_my"], df_merged[f"{col_b}_my"],
+            group["type"],
+        )
+        df_comparison[col_a] = out_a
+        df_comparison[col_b] = out_b
+    return df_comparison
@@ -1,23 +1,17 @@
-import os
 import pandas as pd
 from dotenv import load_dotenv
-from temp_and_rainfall import get_assessment_id, get_species_assessment
+from assessment_store import get_assessment_id, get_species_assessment, prefetch_assessments, assessment_provenance
+from provenance import SOURCE_CHECK_AGE
+from journal import journal_path, load_journal, append_record
+from metrics import scope
 
 load_dotenv()
 
-# Load frog results spreadsheet into DataFrame
-results_spreadsheet = "01_frog_data_compilation/results/froggy_analysis_results.csv"
-df_ref = pd.read_csv(results_spreadsheet)
+ALTITUDE_COLUMNS = ["Min Altitude", "Max Altitude"]
 
-# Add new columns for altitude limits
-df_ref["Min Altitude"] = None
-df_ref["Max Altitude"] = None
-
-# Loop through each species and extract altitude from IUCN data
-for i, row in df_ref.iterrows():
-    genus, species = row["Name"].split(' ')
-
-    print(f"Processing {i}: {genus} {species}")
+# Extract altitude limits for one species from IUCN data, '-' where missing
+def get_altitude(genus, species):
+    min_altitude, max_altitude = None, None
 
     assessment_id = get_assessment_id(genus, species)
     if assessment_id:
@@ -26,18 +20,46 @@ for i, row in df_ref.iterrows():
             supplementary_info = species_info.get("supplementary_info", {})
             min_altitude = supplementary_info.get("lower_elevation_limit", None)
             max_altitude = supplementary_info.get("upper_elevation_limit", None)
-        else:
-            min_altitude, max_altitude = None, None
-    else:
-        min_altitude, max_altitude = None, None
 
-    # Store altitude values or dash if missing
-    df_ref.at[i, "Min Altitude"] = min_altitude if min_altitude is not None else "-"
-    df_ref.at[i, "Max Altitude"] = max_altitude if max_altitude is not None else "-"
+    return [min_altitude if min_altitude is not None else "-", max_altitude if max_altitude is not None else "-"]
+
+# Altitude limits of one "Genus species" name (used by run_stage and by work_queue.py workers)
+def process_species(name):
+    genus, species = name.split(' ')
+    with scope(species=name): # failed lookups are recorded against this species
+        return get_altitude(genus, species)
+
+# Provenance of one species' row, compared by stage_runner.py --changed-only
+def provenance(name):
+    with scope(species=name):
+        return assessment_provenance(name, max_age=SOURCE_CHECK_AGE)
+
+# One row per species name from {name: altitude limits}, '-' for species not processed
+def results_frame(names, done):
+    return pd.DataFrame([[name, *done.get(name, ["-", "-"])] for name in names], columns=["Name"] + ALTITUDE_COLUMNS)
+
+# Altitude stage: one row of altitude limits per species name
+def run_stage(names):
+    # Fill the IUCN store once so the loop below reads assessments locally
+    prefetch_assessments(names)
+
+    # Journal each species so an interrupted run resumes where it stopped
+    journal = journal_path("altitude")
+    done = load_journal(journal)
+
+    # Loop through each species and extract altitude from IUCN data
+    for i, name in enumerate(names):
+        if name in done:
+            continue
+
+        print(f"Processing {i}: {name}")
+
+        done[name] = process_species(name)
+        append_record(journal, name, done[name])
 
-# Overwrite existing file with updated altitude data
-if os.path.exists("01_frog_data_compilation/results/froggy_analysis_results.csv"):
-    os.remove("01_frog_data_compilation/results/froggy_analysis_results.csv")
+    return results_frame(names, done)
 
-df_ref.to_csv("01_frog_data_compilation/results/froggy_analysis_results.csv", index=False)
-print("Updated file saved to 01_frog_data_compilation/results/froggy_analysis_results.xlsx")
\ No newline at end of file
+if __name__ == "__main__":
+    # Run this stage through the stage runner, which stores its columns in the results store
+    from stage_runner import run_stages
+    run_stages(["altitude"])
@@ -0,0 +1,143 @@
+'''
+Local on-disk cache for AmphibiaWeb XML pages, keyed by genus/species.
+
+Page bodies are stored once under their SHA-256 content hash (blobs/), and a small
+index entry per species (index/) points at the current body together with the
+ETag / Last-Modified validators needed to revalidate it once the TTL expires.
+
+Environment:
+    AMPHIBIAWEB_CACHE_DIR   cache location (default 01_frog_data_compilation/cache/amphibiaweb)
+    AMPHIBIAWEB_CACHE_TTL   seconds before an entry is revalidated (default 30 days)
+    AMPHIBIAWEB_OFFLINE     set to 1 to serve only from the cache and never touch the network
+'''
+
+import os
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+from fetch_engine import http_get, fetch_all
+
+load_dotenv()
+
+CACHE_DIR = os.getenv("AMPHIBIAWEB_CACHE_DIR", "01_frog_data_compilation/cache/amphibiaweb")
+CACHE_TTL = float(os.getenv("AMPHIBIAWEB_CACHE_TTL", 30 * 24 * 3600))
+OFFLINE = os.getenv("AMPHIBIAWEB_OFFLINE", "0") == "1"
+
+# Hit/miss counters for the current process
+stats = {"hits": 0, "revalidated": 0, "misses": 0, "offline_misses": 0}
+
+# Derive the cache key ("genus species") from an AmphibiaWeb query URL
+def cache_key(url):
+    params = parse_qs(urlparse(url).query)
+    genus = params.get("where-genus", [""])[0].strip().lower()
+    species = params.get("where-species", [""])[0].strip().lower()
+    if genus and species:
+        return f"{genus} {species}"
+    return url
+
+def _index_path(key):
+    return os.path.join(CACHE_DIR, "index", hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+def _blob_path(digest):
+    return os.path.join(CACHE_DIR, "blobs", digest + ".xml")
+
+# Write a file atomically so an interrupted run never leaves a truncated entry
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Load the index entry and body for a key, or (None, None) if not cached
+def _load(key):
+    index_path = _index_path(key)
+    if not os.path.exists(index_path):
+        return None, None
+
+    with open(index_path, encoding="utf-8") as f:
+        entry = json.load(f)
+
+    blob_path = _blob_path(entry["sha256"])
+    if not os.path.exists(blob_path):
+        return None, None
+
+    with open(blob_path, encoding="utf-8") as f:
+        return entry, f.read()
+
+# Store a page body under its content hash and point the key's index entry at it
+def _store(key, url, text, headers):
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    blob_path = _blob_path(digest)
+    if not os.path.exists(blob_path):
+        _atomic_write(blob_path, text)
+
+    entry = {
+        "key": key,
+        "url": url,
+        "sha256": digest,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+    }
+    _atomic_write(_index_path(key), json.dumps(entry))
+    return entry
+
+# Return the page text for an AmphibiaWeb URL, serving from the cache where possible.
+# Returns None only in offline mode when the page has never been cached.
+def cached_get(url, offline=None, ttl=None):
+    offline = OFFLINE if offline is None else offline
+    ttl = CACHE_TTL if ttl is None else ttl
+
+    key = cache_key(url)
+    entry, text = _load(key)
+
+    if entry and (offline or time.time() - entry["fetched_at"] < ttl):
+        stats["hits"] += 1
+        return text
+
+    if offline:
+        stats["offline_misses"] += 1
+        return None
+
+    # Stale entry: revalidate with the stored validators instead of re-downloading
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = http_get("amphibiaweb", url, headers=headers)
+
+    if entry and response.status_code == 304:
+        entry["fetched_at"] = time.time()
+        _atomic_write(_index_path(key), json.dumps(entry))
+        stats["revalidated"] += 1
+        return text
+
+    response.raise_for_status()
+    _store(key, url, response.text, response.headers)
+    stats["misses"] += 1
+    return response.text
+
+# Fill the cache for a list of page URLs concurrently through the fetch engine, so the
+# per-species loop that follows reads every page locally
+def prefetch_pages(urls):
+    urls = list(dict.fromkeys(urls))
+    for i, (url, _, error) in enumerate(fetch_all(cached_get, urls), 1):
+        if error is not None:
+            print(f"AmphibiaWeb cache: {cache_key(url)} failed ({error})")
+        if i % 100 == 0:
+            print(f"AmphibiaWeb cache: {i}/{len(urls)} pages ready")
+
+# One-line summary of cache activity, printed at the end of a run
+def cache_summary():
+    total = sum(stats.values())
+    hit_rate = (stats["hits"] + stats["revalidated"]) / total if total else 0.0
+    return (f"AmphibiaWeb cache: {stats['hits']} hits, {stats['revalidated']} revalidated, "
+            f"{stats['misses']} misses, {stats['offline_misses']} offline misses "
+            f"({hit_rate:.1%} served locally)")
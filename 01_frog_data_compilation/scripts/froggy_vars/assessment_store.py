@@ -0,0 +1,259 @@
+'''
+Local IUCN Red List assessment store shared by the altitude, habitat and climate stages
+(and by 02_generic_data_compilation through species_info_utils).
+
+Each assessment JSON is fetched once and kept in a SQLite file, indexed both by
+scientific name (name -> latest assessment_id) and by assessment_id (zlib-compressed JSON).
+Entries older than IUCN_STORE_MAX_AGE seconds (default 7 days) are refetched.
+
+The name -> assessment_id map can be filled for a whole class or family up front, from
+the API's paged listing of latest assessments (100 per page). A few hundred requests
+then replace one taxa lookup per species, leaving one request per species (its
+assessment) for the stages:
+
+    python 01_frog_data_compilation/scripts/froggy_vars/assessment_store.py --class Amphibia
+    python 01_frog_data_compilation/scripts/froggy_vars/assessment_store.py --family Ranidae
+
+Names missing from the listing (synonyms, unassessed species) are still looked up one
+by one.
+'''
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import argparse
+from contextlib import closing
+import requests
+from dotenv import load_dotenv
+from fetch_engine import http_get, fetch_all
+from dead_letter import record_failure
+
+load_dotenv()
+
+# Base URL can point at a stand-in server (see scripts/benchmark)
+IUCN_API_URL = os.getenv("IUCN_API_URL", "https://api.iucnredlist.org/api/v4").rstrip("/")
+TAXA_API_URL = f"{IUCN_API_URL}/taxa/scientific_name"
+ASSESSMENT_API_URL = f"{IUCN_API_URL}/assessment"
+GROUP_API_URL = f"{IUCN_API_URL}/taxa" # /class/<name>, /family/<name>
+
+API_KEY = os.getenv("IUCN_API_KEY")
+
+STORE_PATH = os.getenv("IUCN_STORE_PATH", "01_frog_data_compilation/cache/iucn_assessments.sqlite")
+STORE_MAX_AGE = float(os.getenv("IUCN_STORE_MAX_AGE", 7 * 24 * 3600))
+
+# Open the store, creating the tables on first use
+def connect(path=None):
+    path = path or STORE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("CREATE TABLE IF NOT EXISTS taxa (scientific_name TEXT PRIMARY KEY, assessment_id INTEGER, fetched_at REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS assessments (assessment_id INTEGER PRIMARY KEY, body BLOB, fetched_at REAL)")
+    conn.execute("CREATE TABLE IF NOT EXISTS groups (rank TEXT, name TEXT, species INTEGER, fetched_at REAL, PRIMARY KEY (rank, name))")
+    return conn
+
+def _scientific_name(genus, species):
+    return f"{genus.strip().capitalize()} {species.strip().lower()}"
+
+def _is_fresh(fetched_at, max_age=None):
+    return fetched_at is not None and time.time() - fetched_at < (STORE_MAX_AGE if max_age is None else max_age)
+
+### NETWORK LOOKUPS ###
+
+def _headers():
+    return {
+        "accept": "application/json",
+        "Authorization": API_KEY
+    }
+
+# Ask the IUCN API for the latest assessment ID of a species.
+# Returns (ok, assessment_id): ok is False when the request itself failed (after the
+# fetch engine's retries), in which case it is recorded as a dead letter.
+def fetch_assessment_id(genus, species):
+    url = f"{TAXA_API_URL}?genus_name={genus}&species_name={species}"
+
+    # Get information for genus and species
+    try:
+        response = http_get("iucn", url, headers=_headers())
+    except requests.exceptions.RequestException as e:
+        record_failure(f"IUCN taxa {genus} {species}: {e}")
+        return False, None
+
+    if response.status_code == 200:
+        data = response.json()
+        assessments = data.get("assessments", []) # Locate assessment id
+        if assessments:
+            latest_assessment = next((a for a in assessments if a["latest"]), None)
+            if latest_assessment:
+                return True, latest_assessment["assessment_id"]
+
+    if response.status_code in (200, 404): # 404: the Red List doesn't know the species
+        print(f"No assessments found for {genus} {species}.")
+        return True, None
+
+    record_failure(f"IUCN taxa {genus} {species}: status {response.status_code}")
+    return False, None
+
+# Fetch full assessment data from the IUCN API using an assessment ID
+def fetch_species_assessment(assessment_id):
+    url = f"{ASSESSMENT_API_URL}/{assessment_id}"
+
+    # Get species info from assessment id
+    try:
+        response = http_get("iucn", url, headers=_headers())
+    except requests.exceptions.RequestException as e:
+        record_failure(f"IUCN assessment {assessment_id}: {e}")
+        return None
+
+    if response.status_code == 200:
+        return response.json()
+
+    record_failure(f"IUCN assessment {assessment_id}: status {response.status_code}")
+    return None
+
+# Fetch one page (1-based) of the latest assessments in a class or family.
+# Returns (assessments, total_pages); total_pages is None when the API doesn't say, and
+# assessments is None when the request failed.
+def fetch_group_page(rank, group, page):
+    url = f"{GROUP_API_URL}/{rank}/{group}?latest=true&page={page}"
+
+    try:
+        response = http_get("iucn", url, headers=_headers())
+    except requests.exceptions.RequestException as e:
+        record_failure(f"IUCN {rank} {group} page {page}: {e}")
+        return None, None
+
+    if response.status_code != 200:
+        record_failure(f"IUCN {rank} {group} page {page}: status {response.status_code}")
+        return None, None
+
+    try:
+        total_pages = int(response.headers.get("total-pages"))
+    except (TypeError, ValueError):
+        total_pages = None
+    return response.json().get("assessments", []), total_pages
+
+### STORE-BACKED LOOKUPS ###
+
+# Record a name -> assessment_id mapping (None means the API has no assessment)
+def put_assessment_id(conn, scientific_name, assessment_id):
+    conn.execute("INSERT OR REPLACE INTO taxa VALUES (?, ?, ?)", (scientific_name, assessment_id, time.time()))
+    conn.commit()
+
+# Record many name -> assessment_id mappings in one transaction
+def put_assessment_ids(conn, assessment_ids):
+    now = time.time()
+    conn.executemany("INSERT OR REPLACE INTO taxa VALUES (?, ?, ?)", [(name, i, now) for name, i in assessment_ids.items()])
+    conn.commit()
+
+# Record a full assessment JSON
+def put_assessment(conn, assessment_id, assessment):
+    body = zlib.compress(json.dumps(assessment).encode("utf-8"))
+    conn.execute("INSERT OR REPLACE INTO assessments VALUES (?, ?, ?)", (assessment_id, body, time.time()))
+    conn.commit()
+
+# Get the latest assessment ID for a given species, from the store if possible (asking
+# the API again once the stored mapping is older than max_age, default IUCN_STORE_MAX_AGE)
+def get_assessment_id(genus, species, max_age=None):
+    scientific_name = _scientific_name(genus, species)
+    with closing(connect()) as conn:
+        row = conn.execute("SELECT assessment_id, fetched_at FROM taxa WHERE scientific_name = ?", (scientific_name,)).fetchone()
+        if row and _is_fresh(row[1], max_age):
+            return row[0]
+
+        ok, assessment_id = fetch_assessment_id(genus, species)
+        if ok:
+            put_assessment_id(conn, scientific_name, assessment_id)
+        return assessment_id
+
+# Get full assessment data for an assessment ID, from the store if possible
+def get_species_assessment(assessment_id):
+    with closing(connect()) as conn:
+        row = conn.execute("SELECT body, fetched_at FROM assessments WHERE assessment_id = ?", (assessment_id,)).fetchone()
+        if row and _is_fresh(row[1]):
+            return json.loads(zlib.decompress(row[0]))
+
+        assessment = fetch_species_assessment(assessment_id)
+        if assessment is not None:
+            put_assessment(conn, assessment_id, assessment)
+        return assessment
+
+# Get the latest full assessment for a species, or None if unavailable
+def get_assessment(genus, species):
+    assessment_id = get_assessment_id(genus, species)
+    if assessment_id:
+        return get_species_assessment(assessment_id)
+    return None
+
+# Provenance of a species' IUCN-derived rows: its latest assessment_id, rechecked
+# against the API when the stored mapping is older than max_age
+def assessment_provenance(name, max_age=None):
+    return {"Assessment ID": get_assessment_id(*name.split()[:2], max_age=max_age)}
+
+def _get_assessment_for(name):
+    return get_assessment(*name.split()[:2])
+
+# Fill the store for a list of "Genus species" names before a stage's main loop, fetching
+# concurrently through the fetch engine, so the per-species lookups that follow are
+# local reads. A species that fails here is simply retried by that lookup.
+def prefetch_assessments(names):
+    names = list(dict.fromkeys(str(n).strip() for n in names if len(str(n).strip().split()) >= 2))
+    for i, (name, _, error) in enumerate(fetch_all(_get_assessment_for, names), 1):
+        if error is not None:
+            print(f"IUCN store: {name} failed ({error})")
+        if i % 100 == 0:
+            print(f"IUCN store: {i}/{len(names)} species ready")
+
+# Fill the name -> latest assessment_id map for a whole class or family from the API's
+# paged listing, unless that group was listed within IUCN_STORE_MAX_AGE (or force).
+# Pages are stored as they arrive, so a listing that fails part way keeps what it got.
+# Returns the number of species stored.
+def prefetch_group(rank, group, force=False):
+    with closing(connect()) as conn:
+        row = conn.execute("SELECT species, fetched_at FROM groups WHERE rank = ? AND name = ?", (rank, group)).fetchone()
+        if row and _is_fresh(row[1]) and not force:
+            print(f"IUCN store: {rank} {group} was listed recently ({row[0]} species), skipping")
+            return row[0]
+
+        assessment_ids = {}
+        page = 1
+        while True:
+            assessments, total_pages = fetch_group_page(rank, group, page)
+            if assessments is None:
+                print(f"IUCN store: {rank} {group} listing stopped at page {page}, {len(assessment_ids)} species stored")
+                return len(assessment_ids)
+
+            # Species-level names only; the first latest assessment per name wins, as in fetch_assessment_id
+            new = {}
+            for a in assessments:
+                parts = str(a.get("taxon_scientific_name") or "").split()
+                name = _scientific_name(*parts) if len(parts) == 2 else None
+                if name and a.get("latest", True) and name not in assessment_ids and name not in new:
+                    new[name] = a["assessment_id"]
+            put_assessment_ids(conn, new)
+            assessment_ids.update(new)
+
+            if page % 50 == 0:
+                print(f"IUCN store: {rank} {group} page {page}/{total_pages or '?'}, {len(assessment_ids)} species")
+            if not assessments or (total_pages is not None and page >= total_pages):
+                break
+            page += 1
+
+        conn.execute("INSERT OR REPLACE INTO groups VALUES (?, ?, ?, ?)", (rank, group, len(assessment_ids), time.time()))
+        conn.commit()
+        print(f"IUCN store: {len(assessment_ids)} {rank} {group} species from {page} pages")
+        return len(assessment_ids)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill the IUCN store's name -> latest assessment_id map for a whole class or family.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--class", dest="class_name", metavar="NAME", help="e.g. Amphibia")
+    target.add_argument("--family", metavar="NAME", help="e.g. Ranidae")
+    parser.add_argument("--force", action="store_true", help="list the group again even if it was listed recently")
+    args = parser.parse_args()
+
+    if args.class_name:
+        prefetch_group("class", args.class_name, force=args.force)
+    else:
+        prefetch_group("family", args.family, force=args.force)
@@ -0,0 +1,233 @@
+'''
+OpenAI Batch API execution for the trait extractors.
+
+Full-catalogue runs don't need real-time answers. So instead of one synchronous
+chat.completions call per prompt, the requests are written to JSONL files and submitted
+as batches. The batches are polled until finished, and the answers are merged back into
+the results CSV by species name.
+
+Requests already answered in the completion cache (completion_cache.py) are not sent
+again. The rest are split into batches within the API's per-file limits (request count
+and file size). OPENAI_BATCH_MAX_ENQUEUED_TOKENS optionally also bounds the estimated
+tokens queued at once; further batches wait until earlier ones finish. Every submitted
+batch id is recorded in BATCH_DIR/<name>_pending.json until its answers are stored in the
+completion cache. A run that is killed while batches are in flight therefore resumes
+polling those batches on restart instead of submitting (and paying for) them again.
+
+Environment:
+    OPENAI_BATCH_POLL_INTERVAL         seconds between status polls (default 60)
+    OPENAI_BATCH_MAX_REQUESTS          requests per batch (default 50000, the API limit)
+    OPENAI_BATCH_MAX_BYTES             input file size per batch (default 190 MB; the API allows 200 MB)
+    OPENAI_BATCH_MAX_ENQUEUED_TOKENS   estimated tokens in flight across batches (default 0: no bound)
+
+The client is pluggable: anything exposing the OpenAI `files.create`, `files.content`,
+`batches.create` and `batches.retrieve` calls works, e.g. OpenAI(base_url=...) pointed
+at a local stand-in batch server.
+'''
+
+import os
+import json
+import time
+import pandas as pd
+from openai import OpenAI
+from dotenv import load_dotenv
+from metrics import sleep, record_completion
+from llm_engine import estimate_tokens
+from completion_cache import body_key, get_cached, put_cached
+
+load_dotenv()
+
+BATCH_DIR = "01_frog_data_compilation/cache/batches"
+POLL_INTERVAL = float(os.getenv("OPENAI_BATCH_POLL_INTERVAL", 60))
+TERMINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+MAX_REQUESTS = int(os.getenv("OPENAI_BATCH_MAX_REQUESTS", 50000))
+MAX_BYTES = int(os.getenv("OPENAI_BATCH_MAX_BYTES", 190 * 1024 * 1024))
+MAX_ENQUEUED_TOKENS = int(os.getenv("OPENAI_BATCH_MAX_ENQUEUED_TOKENS", 0))
+
+# Separator between species name and request key in custom_id
+ID_SEPARATOR = "::"
+
+def make_custom_id(name, key):
+    return f"{name}{ID_SEPARATOR}{key}"
+
+def split_custom_id(custom_id):
+    name, key = custom_id.rsplit(ID_SEPARATOR, 1)
+    return name, key
+
+def _request_line(custom_id, body):
+    return json.dumps({"custom_id": custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}) + "\n"
+
+# Write (custom_id, body) pairs as a Batch API input file
+def write_requests(requests, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests:
+            f.write(_request_line(custom_id, body))
+    return path
+
+# Split (custom_id, body) pairs into chunks within MAX_REQUESTS and MAX_BYTES per input
+# file (and MAX_ENQUEUED_TOKENS estimated tokens, when set)
+def chunk_requests(requests):
+    chunks, chunk, size, tokens = [], [], 0, 0
+    for custom_id, body in requests:
+        line_size = len(_request_line(custom_id, body).encode("utf-8"))
+        line_tokens = estimate_tokens(body)
+        if chunk and (len(chunk) >= MAX_REQUESTS or size + line_size > MAX_BYTES
+                      or (MAX_ENQUEUED_TOKENS and tokens + line_tokens > MAX_ENQUEUED_TOKENS)):
+            chunks.append(chunk)
+            chunk, size, tokens = [], 0, 0
+        chunk.append((custom_id, body))
+        size += line_size
+        tokens += line_tokens
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+### SUBMITTED BATCHES ###
+
+def pending_path(name):
+    return os.path.join(BATCH_DIR, f"{name}_pending.json")
+
+# Batches submitted under this name whose answers aren't stored yet:
+# [{batch_id, path, tokens, requests: {custom_id: [cache key, model]}}]
+def load_pending(name):
+    path = pending_path(name)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_pending(name, entries):
+    path = pending_path(name)
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entries, f)
+    os.replace(tmp_path, path)
+
+def add_pending(name, entry):
+    _save_pending(name, load_pending(name) + [entry])
+
+def remove_pending(name, batch_id):
+    _save_pending(name, [e for e in load_pending(name) if e["batch_id"] != batch_id])
+
+# Upload an input file and start a batch
+def submit(client, path):
+    with open(path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(input_file_id=input_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+    print(f"Submitted batch {batch.id} ({path})")
+    return batch
+
+# Poll a batch until it reaches a terminal state
+def wait_for_batch(client, batch_id, poll_interval=None):
+    poll_interval = POLL_INTERVAL if poll_interval is None else poll_interval
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = getattr(batch, "request_counts", None)
+        if counts:
+            print(f"Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+        else:
+            print(f"Batch {batch_id}: {batch.status}")
+
+        if batch.status in TERMINAL_STATES:
+            return batch
+        sleep("openai_batch", poll_interval, reason="poll")
+
+# Read a finished batch's output file into {custom_id: message content}.
+# Requests that errored are simply absent from the result.
+def read_results(client, batch):
+    results = {}
+    if not batch.output_file_id:
+        return results
+
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") == 200:
+            results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            name, key = split_custom_id(record["custom_id"])
+            record_completion(response["body"].get("model"), response["body"].get("usage"), species=name, trait=key, batch=True)
+        else:
+            print(f"Batch request {record['custom_id']} failed: {record.get('error') or response.get('status_code')}")
+    return results
+
+# Wait for a submitted batch, store its answers in the completion cache and forget it.
+# Returns {cache key: content}. Requests of a batch that failed or expired get no
+# answer, so the next run submits them again.
+def collect(client, name, entry, poll_interval=None):
+    batch = wait_for_batch(client, entry["batch_id"], poll_interval)
+    if batch.status != "completed":
+        print(f"Batch {batch.id} ended with status {batch.status}")
+    answers = read_results(client, batch)
+
+    stored = {}
+    for custom_id, content in answers.items():
+        if custom_id in entry["requests"] and content is not None:
+            key, model = entry["requests"][custom_id]
+            stored[key] = (model, content)
+    put_cached(stored)
+    remove_pending(name, entry["batch_id"])
+    return {key: content for key, (_, content) in stored.items()}
+
+# Answer (custom_id, body) requests through the Batch API and return {custom_id: content}.
+# First any batches a killed run left pending under this name are waited for. Then
+# requests the completion cache already answers are skipped. The rest are submitted in
+# chunks, each recorded as pending until its answers are stored.
+def run_batch(requests, name, client=None, poll_interval=None):
+    if not requests:
+        return {}
+    client = client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    keys = {custom_id: body_key(body) for custom_id, body in requests}
+
+    contents = {}
+    for entry in load_pending(name):
+        print(f"Resuming batch {entry['batch_id']} submitted by an earlier run")
+        contents.update(collect(client, name, entry, poll_interval))
+    contents.update(get_cached([key for key in keys.values() if key not in contents]))
+
+    # Identical request bodies are sent once
+    todo, queued = [], set()
+    for custom_id, body in requests:
+        if keys[custom_id] not in contents and keys[custom_id] not in queued:
+            queued.add(keys[custom_id])
+            todo.append((custom_id, body))
+    answered = sum(1 for key in keys.values() if key in contents)
+    print(f"Batch {name}: {answered}/{len(requests)} requests already answered, {len(todo)} to submit")
+
+    in_flight = []
+    for i, chunk in enumerate(chunk_requests(todo), 1):
+        tokens = sum(estimate_tokens(body) for _, body in chunk)
+        while in_flight and MAX_ENQUEUED_TOKENS and sum(e["tokens"] for e in in_flight) + tokens > MAX_ENQUEUED_TOKENS:
+            contents.update(collect(client, name, in_flight.pop(0), poll_interval))
+
+        path = write_requests(chunk, os.path.join(BATCH_DIR, f"{name}_{int(time.time())}_{i}.jsonl"))
+        batch = submit(client, path)
+        entry = {"batch_id": batch.id, "path": path, "tokens": tokens,
+                 "requests": {custom_id: [keys[custom_id], body.get("model")] for custom_id, body in chunk}}
+        add_pending(name, entry)
+        in_flight.append(entry)
+
+    for entry in in_flight:
+        contents.update(collect(client, name, entry, poll_interval))
+    return {custom_id: contents[key] for custom_id, key in keys.items() if key in contents}
+
+# Merge new per-species columns into a results CSV by Name, replacing older values
+# of the same columns and keeping every other column as it was
+def merge_results(output_file, new_df):
+    if os.path.exists(output_file):
+        existing = pd.read_csv(output_file)
+        new_columns = [c for c in new_df.columns if c != "Name"]
+        existing = existing.drop(columns=[c for c in new_columns if c in existing.columns])
+        merged = existing.merge(new_df, on="Name", how="left")
+        extra = new_df[~new_df["Name"].isin(existing["Name"])]
+        if not extra.empty:
+            merged = pd.concat([merged, extra], ignore_index=True)
+    else:
+        merged = new_df
+
+    merged.to_csv(output_file, index=False)
+    print(f"Merged {len(new_df)} rows into {output_file}")
+    return merged
@@ -0,0 +1,100 @@
+'''
+Local CCKP climatology table (location code -> tas, pr series).
+
+Most species share the same handful of countries, so instead of calling the CCKP API
+for every location of every species, prefetch_codes() collects the distinct codes of a
+whole run and downloads each one once, concurrently through the fetch engine.
+Per-species statistics are then computed from the local table.
+'''
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+from contextlib import closing
+from dotenv import load_dotenv
+import requests
+from fetch_engine import http_get, fetch_all
+from dead_letter import record_failure
+
+load_dotenv()
+
+CCKP_API_URL = os.getenv("CCKP_API_URL", "https://cckpapi.worldbank.org/cckp/v1/cmip6-x0.25_climatology_tas,pr_climatology_annual_1995-2014_median_historical_ensemble_all_mean").rstrip("/")
+
+TABLE_PATH = os.getenv("CCKP_TABLE_PATH", "01_frog_data_compilation/cache/cckp_climatology.sqlite")
+
+# Retrieve climate data from World Bank CCKP API for a given location code. 429s and
+# errors are retried (with a bounded backoff) by the fetch engine; what still fails is
+# recorded as a dead letter and returns None.
+def get_data(code):
+    url = f"{CCKP_API_URL}/{code}?_format=json"
+    try:
+        response = http_get("cckp", url)
+    except requests.exceptions.RequestException as e:
+        record_failure(f"CCKP {code}: {e}")
+        return None
+
+    if response.status_code == 200:
+        data = response.json()
+        return data
+    else:
+        record_failure(f"CCKP {code}: status {response.status_code}")
+        return None
+
+# Open the climatology table, creating it on first use
+def connect(path=None):
+    path = path or TABLE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("CREATE TABLE IF NOT EXISTS climatology (code TEXT PRIMARY KEY, tas TEXT, pr TEXT, payload BLOB, fetched_at REAL)")
+    return conn
+
+# Store one CCKP payload with its tas/pr series pulled out for quick lookups
+def put_climatology(conn, code, data):
+    tas = data["data"]["tas"].get(code, {})
+    pr = data["data"]["pr"].get(code, {})
+    payload = zlib.compress(json.dumps(data).encode("utf-8"))
+    conn.execute("INSERT OR REPLACE INTO climatology VALUES (?, ?, ?, ?, ?)", (code, json.dumps(tas), json.dumps(pr), payload, time.time()))
+
+# Download every code not yet in the table, each exactly once. Concurrency and rate are
+# bounded by the fetch engine's CCKP limits (CCKP_MAX_WORKERS / FETCH_CCKP_*).
+def prefetch_codes(codes, max_workers=None):
+    codes = sorted({c for c in codes if c})
+    with closing(connect()) as conn:
+        known = {row[0] for row in conn.execute("SELECT code FROM climatology")}
+        missing = [c for c in codes if c not in known]
+        print(f"CCKP: {len(codes)} distinct codes, {len(missing)} to download")
+
+        # Results are stored from this thread; sqlite connections stay on the thread that opened them
+        for code, data, error in fetch_all(get_data, missing, max_workers):
+            if error is not None:
+                print(f"CCKP: {code} failed ({error})")
+            elif data:
+                put_climatology(conn, code, data)
+        conn.commit()
+
+# Full CCKP payload for a code, downloading it only if the table doesn't have it yet
+def get_climatology(code):
+    with closing(connect()) as conn:
+        row = conn.execute("SELECT payload FROM climatology WHERE code = ?", (code,)).fetchone()
+        if row:
+            return json.loads(zlib.decompress(row[0]))
+
+        data = get_data(code)
+        if data:
+            put_climatology(conn, code, data)
+            conn.commit()
+        return data
+
+# (tas, pr) series for a code as {period: value} dicts, or (None, None) if unavailable
+def get_series(code):
+    with closing(connect()) as conn:
+        row = conn.execute("SELECT tas, pr FROM climatology WHERE code = ?", (code,)).fetchone()
+    if row:
+        return json.loads(row[0]), json.loads(row[1])
+
+    data = get_climatology(code)
+    if data:
+        return data["data"]["tas"].get(code, {}), data["data"]["pr"].get(code, {})
+    return None, None
@@ -0,0 +1,129 @@
+'''
+Content-addressed cache for LLM completions.
+
+Every extraction call runs at temperature 0, so a completion is fully determined by its
+request. Answers are stored in SQLite under a hash of (model, messages, temperature,
+max_tokens, response_format); changing one trait's prompt therefore only re-queries that
+trait. The store is size-bounded and evicts least-recently-used entries.
+
+Environment:
+    LLM_CACHE_PATH       cache file (default 01_frog_data_compilation/cache/llm_completions.sqlite)
+    LLM_CACHE_MAX_BYTES  size bound for stored answers (default 500 MB)
+    LLM_CACHE_BYPASS     set to 1 to always call the model (answers are still stored)
+'''
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from contextlib import closing
+from dotenv import load_dotenv
+from metrics import record_completion
+
+load_dotenv()
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "01_frog_data_compilation/cache/llm_completions.sqlite")
+MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 500 * 1024 * 1024))
+BYPASS = os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+
+# Hit/miss counters for the current process
+stats = {"hits": 0, "misses": 0, "bypassed": 0}
+
+def connect(path=None):
+    path = path or CACHE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, model TEXT, content TEXT, size INTEGER, last_used REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+    return conn
+
+# Hash of everything that determines a temperature-0 completion
+def completion_key(model, messages, temperature=None, max_tokens=None, response_format=None):
+    payload = json.dumps({
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "response_format": response_format,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# Drop least-recently-used answers until the stored size is within the bound
+def _evict(conn, max_bytes):
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+    if total <= max_bytes:
+        return
+
+    for key, size in conn.execute("SELECT key, size FROM completions ORDER BY last_used").fetchall():
+        conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+        total -= size
+        if total <= max_bytes:
+            break
+
+# Cache key of a chat.completions request body
+def body_key(body):
+    return completion_key(body.get("model"), body.get("messages"), body.get("temperature"), body.get("max_tokens"), body.get("response_format"))
+
+# Stored answers for these keys as {key: content}, counted as hits (none when bypassing)
+def get_cached(keys, bypass=None):
+    bypass = BYPASS if bypass is None else bypass
+    keys = list(dict.fromkeys(keys))
+    if bypass or not keys:
+        return {}
+
+    found = {}
+    with closing(connect()) as conn:
+        for i in range(0, len(keys), 500): # stay under SQLite's bound-parameter limit
+            chunk = keys[i:i + 500]
+            rows = conn.execute(f"SELECT key, content FROM completions WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            found.update(rows)
+        conn.executemany("UPDATE completions SET last_used = ? WHERE key = ?", [(time.time(), key) for key in found])
+        conn.commit()
+    stats["hits"] += len(found)
+    return found
+
+# Store answers obtained outside cached_completion (Batch API results), {key: (model, content)},
+# counted as misses
+def put_cached(answers):
+    if not answers:
+        return
+    with closing(connect()) as conn:
+        conn.executemany("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)",
+                         [(key, model, content, len(content.encode("utf-8")), time.time()) for key, (model, content) in answers.items() if content is not None])
+        _evict(conn, MAX_BYTES)
+        conn.commit()
+    stats["misses"] += len(answers)
+
+# Return the message content for a chat.completions request, calling `create(**body)`
+# (normally llm_engine.complete) only on a cache miss (or when bypassing the cache)
+def cached_completion(create, bypass=None, **body):
+    bypass = BYPASS if bypass is None else bypass
+    key = body_key(body)
+
+    with closing(connect()) as conn:
+        if not bypass:
+            row = conn.execute("SELECT content FROM completions WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                stats["hits"] += 1
+                return row[0]
+
+        response = create(**body)
+        content = response.choices[0].message.content
+        record_completion(body.get("model"), getattr(response, "usage", None))
+        stats["bypassed" if bypass else "misses"] += 1
+
+        if content is not None:
+            conn.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?)", (key, body.get("model"), content, len(content.encode("utf-8")), time.time()))
+            _evict(conn, MAX_BYTES)
+            conn.commit()
+        return content
+
+# One-line summary of cache activity, printed at the end of a run
+def completion_cache_summary():
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups else 0.0
+    return (f"LLM completion cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['bypassed']} bypassed ({hit_rate:.1%} hit rate)")
@@ -0,0 +1,103 @@
+'''
+Persisted dead-letter file of species lookups that failed for good.
+
+When a request still fails after the fetch engine's retries, or an LLM call errors out,
+the stage fills the species' columns with '-' as before. It now also appends a JSON line
+{species, stage, error, time} here, recording what went wrong. A later
+`stage_runner.py --retry-failed` run reprocesses just those species for each stage in
+bulk and removes their entries, without rerunning the species that succeeded.
+
+Lines are appended and fsync'd one at a time (like journal.py), so the file survives
+crashes. Stages running in parallel processes share it under a file lock.
+
+Environment:
+    DEAD_LETTER_PATH   file location (default 01_frog_data_compilation/cache/dead_letter.jsonl)
+'''
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from collections import Counter
+from metrics import current_scope
+
+try:
+    import fcntl
+except ImportError: # Windows: only threads of one process are serialised
+    fcntl = None
+
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "01_frog_data_compilation/cache/dead_letter.jsonl")
+
+_lock = threading.Lock()
+
+# Hold the file for this thread and, where supported, against other processes
+@contextmanager
+def _locked():
+    with _lock:
+        os.makedirs(os.path.dirname(DEAD_LETTER_PATH) or ".", exist_ok=True)
+        with open(DEAD_LETTER_PATH + ".lock", "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+# Record a failed lookup for a species and stage (taken from the metrics scope when not
+# given). Failures outside any species (bulk prefetches) are only printed: the
+# per-species lookup that follows retries them and records them if they fail again.
+def record_failure(error, species=None, stage=None):
+    current = current_scope()
+    species = species or current["species"]
+    stage = stage or current["stage"] or "-"
+    if species is None:
+        print(f"[{stage}] {error}")
+        return
+
+    line = json.dumps({"species": species, "stage": stage, "error": str(error), "time": time.time()})
+    with _locked():
+        with open(DEAD_LETTER_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+# Every recorded failure, oldest first (optionally for one stage); torn lines are ignored
+def load_failures(stage=None):
+    failures = []
+    if not os.path.exists(DEAD_LETTER_PATH):
+        return failures
+
+    with open(DEAD_LETTER_PATH, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if stage is None or entry["stage"] == stage:
+                failures.append(entry)
+    return failures
+
+# Distinct species with a recorded failure in a stage, in the order they first failed
+def failed_species(stage):
+    return list(dict.fromkeys(entry["species"] for entry in load_failures(stage)))
+
+# Drop a stage's entries for the given species (all if None) that were recorded before
+# `before` (failures of a retry pass itself are kept)
+def clear_failures(stage, names, before):
+    names = None if names is None else set(names)
+    with _locked():
+        if not os.path.exists(DEAD_LETTER_PATH):
+            return
+        kept = [e for e in load_failures() if not (e["stage"] == stage and (names is None or e["species"] in names) and e["time"] < before)]
+        tmp_path = f"{DEAD_LETTER_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in kept:
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, DEAD_LETTER_PATH)
+
+# Print how many species failed per stage
+def failure_summary():
+    counts = Counter()
+    for stage, species in {(e["stage"], e["species"]) for e in load_failures()}:
+        counts[stage] += 1
+    if counts:
+        print(f"Dead letters in {DEAD_LETTER_PATH}: " + ", ".join(f"{stage}={n}" for stage, n in sorted(counts.items())))
+    return dict(counts)
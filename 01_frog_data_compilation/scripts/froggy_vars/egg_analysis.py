@@ -3,65 +3,188 @@ https://amphibiaweb.org/api/ws.html
 '''
 
 import os
+import sys
+import json
 from bs4 import BeautifulSoup
 import requests
-from openai import OpenAI
 import pandas as pd
 from dotenv import load_dotenv
+from amphibiaweb_cache import cached_get, prefetch_pages, cache_summary
+from xml_sections import prune, TRAIT_SECTIONS, PRUNE_ENABLED
+from provenance import fingerprint, SOURCE_CHECK_AGE, PLACEHOLDER_PAGE
+from completion_cache import cached_completion, completion_cache_summary
+from metrics import scope
+from fetch_engine import fetch_all
+from llm_engine import complete, engine_status, is_billing_error, MAX_CONCURRENCY
+from dead_letter import record_failure
+from journal import journal_path, load_journal, append_record, finish_journal
+from batch_runner import run_batch, make_custom_id, split_custom_id, merge_results
 
 load_dotenv()
 
+AMPHIBIAWEB_API_URL = os.getenv("AMPHIBIAWEB_API_URL", "https://amphibiaweb.org/cgi/amphib_ws")
+
 # Construct AmphibiaWeb query URL from genus and species
 def get_url(genus, species):
-    base_url = "https://amphibiaweb.org/cgi/amphib_ws"
-    return f"{base_url}?where-genus={genus}&where-species={species}&src=amphibiaweb"
+    return f"{AMPHIBIAWEB_API_URL}?where-genus={genus}&where-species={species}&src=amphibiaweb"
 
-# Fetch XML data from AmphibiaWeb and check for error tags
-def get_xml(url):
+# Fetch XML data from AmphibiaWeb (through the local page cache, revalidated once older
+# than max_age, default AMPHIBIAWEB_CACHE_TTL) and check for error tags
+def get_xml(url, max_age=None):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        text = cached_get(url, ttl=max_age)
+        if text is None: # offline mode and page was never cached
+            return None
 
-        soup = BeautifulSoup(response.text, 'lxml-xml')
+        soup = BeautifulSoup(text, 'lxml-xml')
         error_tag = soup.find("error")
         if error_tag:
             return "NONEXISTENT PAGE"
 
-        return response.text
+        return text
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data: {e}")
+        record_failure(f"AmphibiaWeb: {e}")
         return None
 
-# Use GPT-4o to extract biological trait data from XML text
-def query_page(text):
+# Download the AmphibiaWeb pages of every species concurrently before a stage's main loop
+def prefetch_xml(names):
+    prefetch_pages([get_url(*name.split(" ", 1)) for name in names])
+
+# "structured" asks for every trait in one JSON-schema response; "per_prompt" runs the
+# original one-prompt-per-trait extraction (kept for accuracy comparisons)
+EXTRACTION_MODE = os.getenv("EGG_EXTRACTION_MODE", "structured")
+
+# Order of the values returned by query_page / run_all
+RESULT_FIELDS = ["male_svl", "male_svl_uncert", "female_svl", "female_svl_uncert", "avg_svl", "avg_svl_uncert", "min_clutch_size", "max_clutch_size", "egg_diameter", "egg_diameter_uncert"]
+
+# Define prompts for each target trait
+PROMPTS = {
+    "male_svl": "Extract and return only the Male SVL (snout-vent length) from the following text, measured in **millimeters (mm)**. If a range is provided, return it in the format `avg` +- `uncertainty` (where the first value is the average and the second is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
+    "female_svl": "Extract and return only the Female SVL (snout-vent length) from the following text, measured in **millimeters (mm)**. If a range is provided, return it in the format `avg` +- `uncertainty` (where the first value is the average and the second is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
+    "avg_svl": "Extract and return only the **average SVL (snout-vent length)** from the following text, measured in **millimeters (mm)**. If separate values for males and females are provided, compute their **overall average** and return it in the format `avg` +- `uncertainty` (where `avg` is the mean of all values and `uncertainty` is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
+    "min_clutch_size": "Extract and return only the **minimum** egg clutch size from the following text. This refers to the **number of eggs laid per clutch**, given as a **whole number** or the **lower value of a range** (e.g., '50 eggs' from '50-200 eggs'). If only a single value is present, return that value. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
+    "max_clutch_size": "Extract and return only the **maximum** egg clutch size from the following text. This refers to the **number of eggs laid per clutch**, given as a **whole number** or the **higher value of a range** (e.g., '200 eggs' from '50-200 eggs'). If only a single value is present, return that value. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
+    "egg_diameter": "Extract and return only the average egg diameter from the following text, measured in **millimeters (mm)**. If a range is provided, return it in the format `avg` +- `uncertainty` (where the first value is the average and the second is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:"
+}
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Which XML sections each per-trait prompt needs (see xml_sections.TRAIT_SECTIONS)
+PROMPT_SECTIONS = {
+    "male_svl": "svl",
+    "female_svl": "svl",
+    "avg_svl": "svl",
+    "min_clutch_size": "eggs",
+    "max_clutch_size": "eggs",
+    "egg_diameter": "eggs",
+}
 
-    # Define prompts for each target trait
-    prompts = {
-        "male_svl": "Extract and return only the Male SVL (snout-vent length) from the following text, measured in **millimeters (mm)**. If a range is provided, return it in the format `avg` +- `uncertainty` (where the first value is the average and the second is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
-        "female_svl": "Extract and return only the Female SVL (snout-vent length) from the following text, measured in **millimeters (mm)**. If a range is provided, return it in the format `avg` +- `uncertainty` (where the first value is the average and the second is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
-        "avg_svl": "Extract and return only the **average SVL (snout-vent length)** from the following text, measured in **millimeters (mm)**. If separate values for males and females are provided, compute their **overall average** and return it in the format `avg` +- `uncertainty` (where `avg` is the mean of all values and `uncertainty` is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
-        "min_clutch_size": "Extract and return only the **minimum** egg clutch size from the following text. This refers to the **number of eggs laid per clutch**, given as a **whole number** or the **lower value of a range** (e.g., '50 eggs' from '50-200 eggs'). If only a single value is present, return that value. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
-        "max_clutch_size": "Extract and return only the **maximum** egg clutch size from the following text. This refers to the **number of eggs laid per clutch**, given as a **whole number** or the **higher value of a range** (e.g., '200 eggs' from '50-200 eggs'). If only a single value is present, return that value. If not available, respond with '-'.\n\nText: {text}\n\nResponse:",
-        "egg_diameter": "Extract and return only the average egg diameter from the following text, measured in **millimeters (mm)**. If a range is provided, return it in the format `avg` +- `uncertainty` (where the first value is the average and the second is half the range). If only a single value is present, return it in the format `avg` +- `0`. If not available, respond with '-'.\n\nText: {text}\n\nResponse:"
+# Single prompt covering every trait, answered against TRAIT_SCHEMA
+STRUCTURED_PROMPT = (
+    "Extract the following traits from the text below and return them as JSON.\n"
+    "- male_svl, female_svl: Male / Female SVL (snout-vent length) in **millimeters (mm)**.\n"
+    "- avg_svl: the **average SVL** in mm; if separate values for males and females are provided, use their **overall average**.\n"
+    "- egg_diameter: the average egg diameter in mm.\n"
+    "For each of these, `avg` is the value (the midpoint if a range is given) and `uncertainty` is half the range, or 0 if only a single value is present.\n"
+    "- min_clutch_size / max_clutch_size: the **number of eggs laid per clutch**, as whole numbers; the lower and higher value of a range "
+    "(e.g., 50 and 200 from '50-200 eggs'). If only a single value is present, use it for both.\n"
+    "Use null for anything that is not available in the text.\n\n"
+    "Text: {text}"
+)
+
+def _measurement_schema():
+    return {
+        "type": "object",
+        "properties": {
+            "avg": {"type": ["number", "null"]},
+            "uncertainty": {"type": ["number", "null"]}
+        },
+        "required": ["avg", "uncertainty"],
+        "additionalProperties": False
+    }
+
+TRAIT_SCHEMA = {
+    "name": "frog_traits",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "male_svl": _measurement_schema(),
+            "female_svl": _measurement_schema(),
+            "avg_svl": _measurement_schema(),
+            "min_clutch_size": {"type": ["integer", "null"]},
+            "max_clutch_size": {"type": ["integer", "null"]},
+            "egg_diameter": _measurement_schema()
+        },
+        "required": ["male_svl", "female_svl", "avg_svl", "min_clutch_size", "max_clutch_size", "egg_diameter"],
+        "additionalProperties": False
     }
+}
+
+# Build the chat.completions request bodies for one page, keyed by request name.
+# Used both for synchronous calls and for Batch API input files.
+def request_bodies(text, mode=None):
+    mode = mode or EXTRACTION_MODE
+    if mode == "per_prompt": # one GPT-4o call per trait
+        return {
+            key: {
+                "model": "gpt-4o",
+                "messages": [{"role": "system", "content": prompt.format(text=prune(text, PROMPT_SECTIONS[key]))}],
+                "max_tokens": 50,
+                "temperature": 0.0,
+            }
+            for key, prompt in PROMPTS.items()
+        }
+    if mode == "structured": # one GPT-4o call returning every trait as typed JSON fields
+        return {
+            "traits": {
+                "model": "gpt-4o",
+                "messages": [{"role": "system", "content": STRUCTURED_PROMPT.format(text=prune(text, "all_traits"))}],
+                "response_format": {"type": "json_schema", "json_schema": TRAIT_SCHEMA},
+                "max_tokens": 200,
+                "temperature": 0.0,
+            }
+        }
+    raise ValueError(f"Unknown extraction mode: {mode}")
 
+# Hash of everything that shapes a page's requests apart from the page itself: prompts,
+# schema, model, parameters and the sections kept by pruning
+def prompt_version(mode=None):
+    return fingerprint({"bodies": request_bodies(PLACEHOLDER_PAGE, mode), "sections": TRAIT_SECTIONS, "prune": PRUNE_ENABLED})
 
+# Provenance of one species' row, compared by stage_runner.py --changed-only: hash of its
+# AmphibiaWeb page (revalidated with a conditional request), prompt version and model
+def provenance(name, mode=None):
+    genus, species = name.split(" ", 1)
+    with scope(species=name):
+        xml_data = get_xml(get_url(genus, species), max_age=SOURCE_CHECK_AGE)
+    models = sorted({body["model"] for body in request_bodies(PLACEHOLDER_PAGE, mode).values()})
+    return {"XML SHA-256": fingerprint(xml_data) if xml_data else None, "Prompt Version": prompt_version(mode), "Model": ",".join(models)}
+
+# Turn a TRAIT_SCHEMA response into the flat results dict, using '-' for nulls
+def parse_structured(content):
+    data = json.loads(content)
     results = {}
+    for field in ["male_svl", "female_svl", "avg_svl", "egg_diameter"]:
+        value = data.get(field) or {}
+        avg, uncertainty = value.get("avg"), value.get("uncertainty")
+        results[field] = avg if avg is not None else '-'
+        results[field + "_uncert"] = (uncertainty if uncertainty is not None else 0) if avg is not None else '-'
+    for field in ["min_clutch_size", "max_clutch_size"]:
+        results[field] = data.get(field) if data.get(field) is not None else '-'
+    return results
+
+# Turn the response text of each request in request_bodies() into the flat results dict.
+# A missing response (None) is treated as '-'.
+def parse_responses(contents, mode=None):
+    mode = mode or EXTRACTION_MODE
+    if mode == "structured":
+        try:
+            return parse_structured(contents["traits"])
+        except (json.JSONDecodeError, TypeError, AttributeError) as e:
+            print(f"ERROR parsing structured response: {e}")
+            return {field: '-' for field in RESULT_FIELDS}
+
+    results = {key: (contents.get(key) or '-').strip() for key in PROMPTS}
 
-    # Run each prompt through GPT-4o and store results
-    for key, prompt in prompts.items():
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": prompt.format(text=text)}
-            ],
-            max_tokens=50,
-            temperature=0.0,
-        )
-        results[key] = response.choices[0].message.content.strip()
-    
     # Parse SVL and egg diameter fields to separate average and uncertainty
     for field in ["male_svl", "female_svl", "avg_svl", "egg_diameter"]:
         if "+-" in results[field]:
@@ -78,7 +201,25 @@ def query_page(text):
             results[field] = '-'
             results[field + "_uncert"] = '-'
 
-    return results["male_svl"], results["male_svl_uncert"], results["female_svl"], results["female_svl_uncert"], results["avg_svl"], results["avg_svl_uncert"], results["min_clutch_size"], results["max_clutch_size"], results["egg_diameter"], results["egg_diameter_uncert"]
+    return results
+
+# Use GPT-4o to extract biological trait data from XML text. The page's requests are
+# submitted to the LLM engine together (one per trait in per_prompt mode).
+def query_page(text, mode=None):
+    bodies = request_bodies(text, mode)
+
+    def ask(key):
+        with scope(trait=key):
+            return cached_completion(complete, **bodies[key])
+
+    contents = {}
+    for key, content, error in fetch_all(ask, bodies, workers=len(bodies)):
+        if error is not None:
+            raise error
+        contents[key] = content
+
+    results = parse_responses(contents, mode)
+    return tuple(results[field] for field in RESULT_FIELDS)
 
 # Run entire pipeline for a given genus/species
 def run_all(genus, species):
@@ -93,46 +234,117 @@ def run_all(genus, species):
     
     return "-", "-", "-", "-", "-", "-", "-", "-", "-", "-"
 
-# Process input Excel file and apply extraction logic to each species
-def process_excel(file_path, output_file):
-    try:
-        xls = pd.ExcelFile(file_path)
+# Output columns, in the same order as RESULT_FIELDS
+RESULT_COLUMNS = ["SVL Male (mm)", "+/- SVL Male (mm)", "SVL Female (mm)", "+/- SVL Female (mm)", "Avg SVL Adult (mm)", "+/- SVL Adult (mm)", "Min Egg Clutch", "Max Egg Clutch", "Avg Egg Diameter (mm)", "+/- Egg Diameter (mm)"]
+
+# Read the "All Frogs" sheet and return every valid "Genus species" name
+def load_species(file_path):
+    xls = pd.ExcelFile(file_path)
+
+    if "All Frogs" not in xls.sheet_names:
+        raise ValueError("The 'All Frogs' sheet was not found in the Excel file.")
+
+    df = xls.parse("All Frogs", header=1)
+
+    if "Name" not in df.columns:
+        raise ValueError("Could not find the 'Name' column under 'Name Stuff'.")
+
+    names = [str(name).strip() for name in df["Name"]]
+    return [name for name in names if " " in name] # Skip entries without a valid genus-species pair
 
-        if "All Frogs" not in xls.sheet_names:
-            raise ValueError("The 'All Frogs' sheet was not found in the Excel file.")
+# Run data retrieval for one frog (used by extract_sync and by work_queue.py workers)
+def process_species(name):
+    genus, species = name.split(" ", 1)
+    print(f"Processing Genus={genus}, Species={species}")
+    with scope(species=name):
+        return list(run_all(genus, species))
 
-        df = xls.parse("All Frogs", header=1)
+# One row of traits per species name from {name: values}, '-' for species not processed
+def results_frame(names, done):
+    return pd.DataFrame([[name, *done.get(name, ["-"] * len(RESULT_COLUMNS))] for name in names], columns=["Name"] + RESULT_COLUMNS)
 
-        if "Name" not in df.columns:
-            raise ValueError("Could not find the 'Name' column under 'Name Stuff'.")
-        
-        results_df = pd.DataFrame(columns=["Name", "SVL Male (mm)", "+/- SVL Male (mm)", "SVL Female (mm)", "+/- SVL Female (mm)", "Avg SVL Adult (mm)", "+/- SVL Adult (mm)", "Min Egg Clutch", "Max Egg Clutch", "Avg Egg Diameter (mm)", "+/- Egg Diameter (mm)"])
+# Extract traits for each species, with many species in flight at once through the LLM
+# engine. Results are journaled per species as they complete, so a rerun after a crash
+# resumes where it stopped (unless the prompt version changed since). A species whose
+# requests still fail gets '-' and a dead letter, and is left out of the journal.
+def extract_sync(names):
+    journal = journal_path("egg_analysis")
+    version = prompt_version()
+    done = load_journal(journal, version)
 
-        i = 1
+    pending = [name for name in dict.fromkeys(names) if name not in done]
+    for i, (name, values, error) in enumerate(fetch_all(process_species, pending, MAX_CONCURRENCY), 1):
+        if is_billing_error(error):
+            raise RuntimeError(f"Billing error after {len(done)} species; rerun to resume") from error
+        if error is not None:
+            record_failure(error, species=name)
+            done[name] = ["-"] * len(RESULT_COLUMNS)
+            continue
+        done[name] = values
+        append_record(journal, name, values, version)
+        if i % 100 == 0:
+            print(f"{i}/{len(pending)} species done ({engine_status()})")
 
-        # Loop through each frog and run data retrieval
-        for index, row in df.iterrows():
-            name = str(row["Name"]).strip()
+    return results_frame(names, done)
 
-            if " " not in name: # Skip entries without a valid genus-species pair
-                continue
+# Same extraction as extract_sync, but all prompts go through one OpenAI Batch API job
+def extract_batch(names, client=None, mode=None):
+    requests_list = []
+    for i, name in enumerate(names, 1):
+        genus, species = name.split(" ", 1)
+        print(f"Preparing {i}: Genus={genus}, Species={species}")
 
-            genus, species = name.split(" ", 1)
-            print(f"Processing {i}: Genus={genus}, Species={species}")
+        with scope(species=name):
+            xml_data = get_xml(get_url(genus, species))
+        if xml_data and "NONEXISTENT PAGE" not in xml_data:
+            for key, body in request_bodies(xml_data, mode).items():
+                requests_list.append((make_custom_id(name, key), body))
 
-            male_svl, male_svl_uncert, female_svl, female_svl_uncert, avg_svl, avg_svl_uncert, min_clutch_size, max_clutch_size, egg_diameter, egg_diameter_uncert = run_all(genus, species)
+    answers = run_batch(requests_list, "egg_analysis", client=client)
 
-            results_df.loc[len(results_df)] = [name, male_svl, male_svl_uncert, female_svl, female_svl_uncert, avg_svl, avg_svl_uncert, min_clutch_size, max_clutch_size, egg_diameter, egg_diameter_uncert]
-            i += 1
+    # Regroup answers per species; species without a page or answer get '-'
+    contents = {}
+    for custom_id, content in answers.items():
+        name, key = split_custom_id(custom_id)
+        contents.setdefault(name, {})[key] = content
 
+    asked = {split_custom_id(custom_id)[0] for custom_id, _ in requests_list}
+    rows = []
+    for name in names:
+        if name in contents:
+            results = parse_responses(contents[name], mode)
+            rows.append([name] + [results[field] for field in RESULT_FIELDS])
+        else:
+            if name in asked:
+                record_failure("no answer in the Batch API results", species=name)
+            rows.append([name] + ["-"] * len(RESULT_FIELDS))
+
+    return pd.DataFrame(rows, columns=["Name"] + RESULT_COLUMNS)
+
+# Egg/SVL stage: one row of extracted traits per species name
+def run_stage(names, batch=False):
+    prefetch_xml(names)
+    results_df = extract_batch(names) if batch else extract_sync(names)
+    print(cache_summary())
+    print(completion_cache_summary())
+    return results_df
+
+# Process input Excel file and write the extracted traits to output_file
+def process_excel(file_path, output_file):
+    try:
+        results_df = run_stage(load_species(file_path))
         results_df.to_csv(output_file, index=False)
+        finish_journal(journal_path("egg_analysis"))
         print(f"Results saved to {output_file}")
 
     except Exception as e:
         print(f"Error processing Excel file: {e}")
-        
-# Set input/output paths and trigger the pipeline
-input_file = "01_frog_data_compilation/data/Froggy_Spreadsheet.xlsx"
-output_file = "01_frog_data_compilation/results/froggy_analysis_results.csv"
 
-process_excel(input_file, output_file)
+# Batch API variant of process_excel; answers are merged into output_file by species name
+def process_excel_batch(file_path, output_file, client=None, mode=None):
+    merge_results(output_file, extract_batch(load_species(file_path), client, mode))
+
+if __name__ == "__main__":
+    # Run this stage through the stage runner, which stores its columns in the results store
+    from stage_runner import run_stages
+    run_stages(["egg_analysis"], batch="--batch" in sys.argv)
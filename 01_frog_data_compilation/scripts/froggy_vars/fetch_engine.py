@@ -0,0 +1,231 @@
+'''
+Shared HTTP fetch engine for the IUCN, AmphibiaWeb and CCKP APIs.
+
+Every request goes through one pooled requests.Session, so connections are kept alive
+and reused. Each service has its own cap on requests in flight and its own token-bucket
+rate limit. Many threads can therefore fetch at once without overrunning any one API.
+The limits are per process: separate processes calling the same API each get the full
+limits unless FETCH_PROCESSES says how many of them share it. Each process then takes
+that share of every cap and rate. work_queue.py sets it to its --processes count.
+stage_runner.py instead fills the IUCN store once before it starts parallel stages.
+fetch_all() is the batch entry point: give it a per-item function and a list of species
+names or location codes, and it yields the results as they complete.
+
+Failed requests (connection errors, timeouts, 429 and 5xx responses) are retried a
+bounded number of times with jittered exponential backoff, honouring Retry-After. Each
+service also has a circuit breaker. After FETCH_BREAKER_THRESHOLD connection errors,
+timeouts or 5xx responses in a row, every request to that service waits out
+FETCH_BREAKER_COOLDOWN seconds instead of hammering an API that is down. 429s don't
+count, since they signal pacing rather than an outage. A request that still fails is
+handed back to the caller, which records it in the dead-letter file (dead_letter.py).
+
+Environment (SERVICE is IUCN, AMPHIBIAWEB or CCKP):
+    FETCH_<SERVICE>_CONCURRENCY   requests in flight at once for that API
+    FETCH_<SERVICE>_RATE          requests per second allowed (0 disables the limit)
+    FETCH_PROCESSES               processes sharing those limits (default 1)
+    FETCH_TIMEOUT                 seconds before a request times out (default 60)
+    FETCH_WORKERS                 threads used by fetch_all (default: sum of the caps)
+    FETCH_MAX_RETRIES             retries per request (default 5)
+    FETCH_BACKOFF_BASE            seconds before the first retry, doubled per attempt (default 1)
+    FETCH_BREAKER_THRESHOLD       consecutive failures that open a service's breaker (default 5)
+    FETCH_BREAKER_COOLDOWN        seconds an open breaker pauses the service (default 60)
+'''
+
+import os
+import time
+import random
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from metrics import observe_http, record_retry, sleep
+
+load_dotenv()
+
+# Service -> (requests in flight, requests/sec) unless overridden from the environment
+DEFAULT_LIMITS = {
+    "iucn": (8, 10.0),
+    "amphibiaweb": (4, 5.0),
+    "cckp": (int(os.getenv("CCKP_MAX_WORKERS", 4)), 10.0),
+}
+DEFAULT_CONCURRENCY = 4
+
+TIMEOUT = float(os.getenv("FETCH_TIMEOUT", 60))
+WORKERS = int(os.getenv("FETCH_WORKERS", 0))
+MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", 5))
+BACKOFF_BASE = float(os.getenv("FETCH_BACKOFF_BASE", 1.0))
+BREAKER_THRESHOLD = int(os.getenv("FETCH_BREAKER_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.getenv("FETCH_BREAKER_COOLDOWN", 60))
+
+# Responses worth another attempt; anything else (200, 304, 404, ...) goes to the caller
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Jittered exponential backoff for retry number `attempt` (0-based), capped at `cap` seconds
+def backoff(attempt, base=BACKOFF_BASE, cap=60):
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+# Seconds asked for by a numeric Retry-After header, if any
+def retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+# Token bucket holding up to `burst` tokens, refilled at `rate` tokens per second
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Take a token and return how long the caller must wait before using it. The balance
+    # may go negative, which queues callers in the order they arrived.
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+# (requests in flight, requests/sec) for a service in this process: the configured
+# limits divided between the FETCH_PROCESSES processes sharing them
+def service_limits(service):
+    concurrency, rate = DEFAULT_LIMITS.get(service, (DEFAULT_CONCURRENCY, 0.0))
+    prefix = f"FETCH_{service.upper()}"
+    concurrency, rate = int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)), float(os.getenv(f"{prefix}_RATE", rate))
+    processes = max(1, int(os.getenv("FETCH_PROCESSES", 1)))
+    return max(1, concurrency // processes), rate / processes
+
+# Counts consecutive failed attempts against a service and, past the threshold, keeps
+# it paused (open) for the cooldown; any success closes it again
+class CircuitBreaker:
+    def __init__(self, service):
+        self.service = service
+        self.failures = 0
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+
+    # Seconds left before the service may be called again
+    def wait(self):
+        with self.lock:
+            return max(0.0, self.open_until - time.monotonic())
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= BREAKER_THRESHOLD:
+                self.failures = 0
+                self.open_until = time.monotonic() + BREAKER_COOLDOWN
+                print(f"{self.service}: {BREAKER_THRESHOLD} failures in a row, pausing requests for {BREAKER_COOLDOWN:g}s")
+
+# Concurrency slots, rate limiter and circuit breaker for one service
+class Host:
+    def __init__(self, service):
+        self.concurrency, rate = service_limits(service)
+        self.slots = threading.BoundedSemaphore(self.concurrency)
+        self.bucket = TokenBucket(rate) if rate > 0 else None
+        self.breaker = CircuitBreaker(service)
+
+_lock = threading.Lock()
+_state = {"pid": None, "session": None, "hosts": {}}
+
+# Per-process session and hosts; a forked stage worker must not reuse its parent's sockets
+def _process_state():
+    with _lock:
+        if _state["pid"] != os.getpid():
+            pool_size = max(10, max(service_limits(s)[0] for s in DEFAULT_LIMITS))
+            adapter = HTTPAdapter(pool_connections=len(DEFAULT_LIMITS), pool_maxsize=pool_size)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _state.update(pid=os.getpid(), session=session, hosts={})
+        return _state
+
+def _host(service):
+    state = _process_state()
+    with _lock:
+        if service not in state["hosts"]:
+            state["hosts"][service] = Host(service)
+        return state["hosts"][service]
+
+# One attempt, within the service's concurrency cap and rate limit
+def _attempt(service, host, url, kwargs):
+    with host.slots:
+        if host.bucket:
+            wait = host.bucket.reserve()
+            if wait > 0:
+                sleep(service, wait, reason="throttle")
+
+        start = time.perf_counter()
+        try:
+            response = _state["session"].get(url, **kwargs)
+        except requests.exceptions.RequestException:
+            observe_http(service, time.perf_counter() - start, "error")
+            raise
+
+    observe_http(service, time.perf_counter() - start, response.status_code)
+    return response
+
+# GET through the shared session, retrying errors, 429s and 5xx responses with backoff
+# and respecting the service's circuit breaker. Returns the last response (which may
+# still be a 429/5xx) or raises the last RequestException once the retries run out.
+# Latency and status of every attempt are recorded in the run metrics under `service`.
+def http_get(service, url, **kwargs):
+    host = _host(service)
+    kwargs.setdefault("timeout", TIMEOUT)
+
+    for attempt in range(MAX_RETRIES + 1):
+        paused = host.breaker.wait()
+        if paused > 0:
+            sleep(service, paused, reason="circuit_open")
+
+        try:
+            response = _attempt(service, host, url, kwargs)
+        except requests.exceptions.RequestException:
+            host.breaker.failure()
+            if attempt == MAX_RETRIES:
+                raise
+            wait = backoff(attempt)
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                host.breaker.success()
+                return response
+            if response.status_code != 429:
+                host.breaker.failure()
+            if attempt == MAX_RETRIES:
+                return response
+            wait = max(retry_after(response) or 0, backoff(attempt))
+
+        record_retry(service)
+        sleep(service, wait)
+
+# Run fn(item) for every item on a thread pool and yield (item, result, error) as each
+# one finishes; error is None on success. The per-service caps in http_get bound what
+# actually reaches each API, so the pool only needs to be large enough to fill them.
+# Each call runs in a copy of the caller's context (metrics scopes carry over), and
+# items not yet started are cancelled if the caller stops iterating early.
+def fetch_all(fn, items, workers=None):
+    items = list(items)
+    if not items:
+        return
+
+    workers = workers or WORKERS or sum(service_limits(s)[0] for s in DEFAULT_LIMITS)
+    pool = ThreadPoolExecutor(max_workers=min(workers, len(items)))
+    try:
+        futures = {pool.submit(contextvars.copy_context().run, fn, item): item for item in items}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,92 @@
+'''
+Precompiled lookup index for geonames.xlsx.
+
+The Countries and Subnationals sheets are parsed once into hash maps keyed by the
+lowercased name and pickled next to the other caches. The pickle is rebuilt whenever
+the workbook's mtime changes, so find_location never parses Excel per species.
+'''
+
+import os
+import pickle
+import pandas as pd
+
+GEONAMES_PATH = "01_frog_data_compilation/data/geonames.xlsx"
+INDEX_PATH = os.getenv("GEONAMES_INDEX_PATH", "01_frog_data_compilation/cache/geonames_index.pkl")
+
+# In-process copies of loaded indexes, keyed by workbook path
+_loaded = {}
+
+def _normalize(name):
+    return name.strip().lower() if isinstance(name, str) else None
+
+# Parse both sheets into {name: (subnational code, country code)} and {name: ISO3 code}.
+# The first row wins for duplicate names, matching the old iloc[0] behaviour.
+def build_index(file_path=GEONAMES_PATH):
+    xls = pd.ExcelFile(file_path)
+    countries_df = pd.read_excel(xls, sheet_name="Countries")
+    subnationals_df = pd.read_excel(xls, sheet_name="Subnationals")
+
+    subnationals = {}
+    for name, code, country in zip(subnationals_df["Subnational Name"], subnationals_df["Subnational Code"], subnationals_df["Country Code"]):
+        key = _normalize(name)
+        if key and key not in subnationals:
+            subnationals[key] = (code, country)
+
+    countries = {}
+    for name, code in zip(countries_df["Name"], countries_df["ISO3 Code"]):
+        key = _normalize(name)
+        if key and key not in countries:
+            countries[key] = code
+
+    return {"subnationals": subnationals, "countries": countries}
+
+# Load the index from the pickle cache, rebuilding it if the workbook changed
+def load_index(file_path=GEONAMES_PATH, index_path=INDEX_PATH):
+    mtime = os.path.getmtime(file_path)
+
+    cached = _loaded.get(file_path)
+    if cached and cached["mtime"] == mtime:
+        return cached
+
+    if os.path.exists(index_path):
+        with open(index_path, "rb") as f:
+            cached = pickle.load(f)
+        if cached.get("source") == os.path.abspath(file_path) and cached.get("mtime") == mtime:
+            _loaded[file_path] = cached
+            return cached
+
+    cached = build_index(file_path)
+    cached["source"] = os.path.abspath(file_path)
+    cached["mtime"] = mtime
+
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, index_path)
+
+    _loaded[file_path] = cached
+    return cached
+
+# Match IUCN location names to standardized location codes.
+# Subnational matches come first; a country is skipped if one of its subnationals matched.
+def find_location(locations, file_path=GEONAMES_PATH):
+    index = load_index(file_path)
+    subnationals, countries = index["subnationals"], index["countries"]
+
+    region_codes = []
+    region_countries = []
+    country_codes = []
+
+    for name in locations:
+        match = subnationals.get(_normalize(name))
+        if match:
+            region_codes.append(match[0])
+            region_countries.append(match[1])
+
+    for name in locations:
+        code = countries.get(_normalize(name))
+        if code and code not in region_countries:
+            country_codes.append(code)
+
+    return region_codes + country_codes
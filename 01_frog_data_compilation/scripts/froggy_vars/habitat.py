@@ -2,9 +2,14 @@
 From IUCN: Preferred Habitat (IUCN Habitat Categories) and one preferred habitat if available
 '''
 
-import os
 import pandas as pd
-from temp_and_rainfall import get_assessment_id, get_species_assessment
+from assessment_store import get_assessment_id, get_species_assessment, prefetch_assessments, assessment_provenance
+from provenance import SOURCE_CHECK_AGE
+from journal import journal_path, load_journal, append_record
+from metrics import scope
+
+# IUCN top-level habitat categories, one-hot encoded as columns "1"–"16"
+HABITAT_COLUMNS = [str(i) for i in range(1, 17)]
 
 # Extract top-level habitat codes
 def habitat_codes(json_data):
@@ -20,41 +25,64 @@ def habitat_codes(json_data):
 
     return list(codes)
 
-# Load frog dataset
-df = pd.read_csv("01_frog_data_compilation/results/froggy_analysis_results.csv")
+# Top-level habitat codes of one species name (used by run_stage and by work_queue.py workers)
+def process_species(name):
+    name_parts = str(name).strip().split()
+    if len(name_parts) < 2:
+        return []
 
-# Initialize habitat columns 1–16 with zeros (one-hot style encoding)
-for i in range(1, 17):
-    df[str(i)] = 0
+    genus, species = name_parts[0], name_parts[1]
 
-# Process each species row to extract and encode IUCN habitat categories
-for index, row in df.iterrows():
+    codes = []
 
-    name_parts = row["Name"].strip().split()
-    if len(name_parts) < 2:
-        continue
+    with scope(species=name): # failed lookups are recorded against this species
+        assessment_id = get_assessment_id(genus, species)
 
-    print("Processing {}: {}".format(index, row["Name"]))
+        if assessment_id:
+            assessment_info = get_species_assessment(assessment_id)
 
-    genus, species = name_parts[0], name_parts[1]
+            if assessment_info:
+                codes = habitat_codes(assessment_info)
 
-    codes = []
+    return codes
+
+# Provenance of one species' row, compared by stage_runner.py --changed-only
+def provenance(name):
+    with scope(species=name):
+        return assessment_provenance(name, max_age=SOURCE_CHECK_AGE)
+
+# One row per species name from {name: habitat codes}, marking each top-level code with 1
+def results_frame(names, done):
+    rows = []
+    for name in names:
+        codes = set(done.get(name, []))
+        rows.append([name] + [1 if column in codes else 0 for column in HABITAT_COLUMNS])
+
+    return pd.DataFrame(rows, columns=["Name"] + HABITAT_COLUMNS)
+
+# Habitat stage: one-hot IUCN habitat categories per species name
+def run_stage(names):
+    # Fill the IUCN store once so the loop below reads assessments locally
+    prefetch_assessments(names)
 
-    assessment_id = get_assessment_id(genus, species)
+    # Journal each species' codes so an interrupted run resumes where it stopped
+    journal = journal_path("habitat")
+    done = load_journal(journal)
 
-    if assessment_id:
-        assessment_info = get_species_assessment(assessment_id)
+    # Process each species to extract IUCN habitat categories
+    for index, name in enumerate(names):
+        name_parts = str(name).strip().split()
+        if len(name_parts) < 2 or name in done:
+            continue
 
-        if assessment_info:
-            codes = habitat_codes(assessment_info)
+        print("Processing {}: {}".format(index, name))
 
-    # Mark presence of each top-level habitat code with 1
-    for code in codes:
-        if code in df.columns:
-            df.at[index, code] = 1
+        done[name] = process_species(name)
+        append_record(journal, name, done[name])
 
-# Overwrite old Excel file with updated habitat columns
-if os.path.exists("01_frog_data_compilation/results/froggy_analysis_results.csv"):
-    os.remove("01_frog_data_compilation/results/froggy_analysis_results.csv")
+    return results_frame(names, done)
 
-df.to_csv("01_frog_data_compilation/results/froggy_analysis_results.csv", index=False)
+if __name__ == "__main__":
+    # Run this stage through the stage runner, which stores its columns in the results store
+    from stage_runner import run_stages
+    run_stages(["habitat"])
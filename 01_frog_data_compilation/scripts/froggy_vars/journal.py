@@ -0,0 +1,76 @@
+'''
+Append-only, crash-safe journal of per-species results for long extraction runs.
+
+Each finished species is appended as one JSON line and fsync'd before the loop moves
+on, so an exception or a killed process loses at most the species in flight. On restart
+a stage loads the journal, skips every species already recorded and rebuilds its final
+output from the journal. The journal is removed once that output has been written.
+
+LLM stages pass the version of their prompts and model (e.g. egg_analysis.prompt_version()).
+It is written as the journal's first line. A journal written under a different version is
+discarded on load rather than resumed, so answers to an older prompt or model never end up
+in rows recorded under the new one.
+'''
+
+import os
+import json
+
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "01_frog_data_compilation/cache/journals")
+
+# Journal file for a stage (e.g. "egg_analysis", "altitude")
+def journal_path(stage):
+    return os.path.join(JOURNAL_DIR, f"{stage}.jsonl")
+
+def _same_version(a, b):
+    return json.dumps(a, sort_keys=True, default=str) == json.dumps(b, sort_keys=True, default=str)
+
+# Load {name: values} from a journal; a torn final line from a crash is ignored. With a
+# version, a journal written under another version (or none) is deleted and nothing is resumed.
+def load_journal(path, version=None):
+    records = {}
+    if not os.path.exists(path):
+        return records
+
+    # Cut off a partially written last line so the next append starts on a fresh line
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+    header = None
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "name" in record:
+                records[record["name"]] = record["values"]
+            elif i == 0:
+                header = record
+
+    if version is not None and (header is None or not _same_version(header.get("version"), version)):
+        print(f"Discarding {path}: written for a different prompt or model version")
+        os.remove(path)
+        return {}
+
+    if records:
+        print(f"Resuming from {path}: {len(records)} species already done")
+    return records
+
+# Append one species' results and force them to disk before returning. A new journal
+# starts with a line recording the version its results belong to.
+def append_record(path, name, values, version=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = json.dumps({"name": name, "values": values}, default=str)
+    if version is not None and (not os.path.exists(path) or os.path.getsize(path) == 0):
+        line = json.dumps({"version": version}, default=str) + "\n" + line
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+# Remove a journal once the stage's final output has been written from it
+def finish_journal(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,297 @@
+'''
+Asynchronous OpenAI chat-completion engine shared by every extraction call.
+
+Each process has one AsyncOpenAI client on a background event loop. Synchronous stage
+code submits requests with complete(**body), usable as the `create` of
+cached_completion, and many of them can be in flight at once. Every response's rate-limit
+headers steer the engine:
+
+- x-ratelimit-remaining-requests / -tokens: while both budgets have headroom, the number
+  of requests in flight grows (by one per response until the first sign of pressure,
+  then by about one per round trip). It shrinks when a budget runs low and is halved
+  on a 429.
+- x-ratelimit-limit-requests / -tokens: size a requests-per-minute and a tokens-per-minute
+  budget. They hold back requests (estimated at prompt + max_tokens tokens) that would
+  overdraw either one.
+- retry-after / x-ratelimit-reset-*: after a 429, or when a budget is exhausted, nothing
+  is sent until the reset time. The request that got the 429 also backs off
+  exponentially, with jitter, before its next attempt.
+
+The SDK's own retries are disabled, so the engine sees, counts and paces every 429.
+
+Environment:
+    LLM_INITIAL_CONCURRENCY   requests in flight before any headers are seen (default 8)
+    LLM_MIN_CONCURRENCY       floor for the in-flight limit (default 1)
+    LLM_MAX_CONCURRENCY       ceiling for the in-flight limit (default 64)
+    LLM_HEADROOM              share of each budget kept in reserve (default 0.1)
+    LLM_MAX_RETRIES           retries per request on 429 / 5xx / timeouts (default 8)
+    LLM_BACKOFF_BASE          seconds before the first retry, doubled per attempt (default 0.5)
+'''
+
+import os
+import re
+import time
+import asyncio
+import threading
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from metrics import observe_http, record_retry, record_sleep
+from fetch_engine import backoff as _backoff
+
+load_dotenv()
+
+INITIAL_CONCURRENCY = int(os.getenv("LLM_INITIAL_CONCURRENCY", 8))
+MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", 1))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 64))
+HEADROOM = float(os.getenv("LLM_HEADROOM", 0.1))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 8))
+
+# First retry waits up to this many seconds, doubling with every further attempt
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+
+# Minimum seconds between two decreases, so one burst of low-budget responses counts once
+DECREASE_COOLDOWN = 1.0
+
+# Parse an OpenAI reset duration such as "1s", "6m0s" or "20ms" into seconds
+def parse_duration(value):
+    if not value:
+        return None
+    seconds = 0.0
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value):
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+def _int_header(headers, name):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+# Seconds a 429 asks us to wait: retry-after-ms, retry-after, or the sooner budget reset
+def retry_after(headers):
+    if headers is None:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    if headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    resets = [parse_duration(headers.get(h)) for h in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")]
+    resets = [r for r in resets if r is not None]
+    return min(resets) if resets else None
+
+# Jittered exponential backoff for retry number `attempt` (0-based), capped at a minute
+def backoff(attempt):
+    return _backoff(attempt, base=BACKOFF_BASE)
+
+# Whether an error means the account is out of credit (retrying later won't help)
+def is_billing_error(error):
+    message = str(error).lower()
+    return isinstance(error, (openai.AuthenticationError, openai.RateLimitError)) and ("billing" in message or "insufficient_quota" in message)
+
+# Rough token count of a request: prompt characters / 4 plus the completion allowance
+def estimate_tokens(body):
+    chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+    return chars // 4 + (body.get("max_tokens") or 256)
+
+# Per-minute budget (requests or tokens) refilled continuously, with a reserve of
+# HEADROOM kept back; unknown (no limit) until the first response headers arrive
+class Budget:
+    def __init__(self):
+        self.limit = None
+        self.balance = 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.limit:
+            self.balance = min(self.limit * (1 - HEADROOM), self.balance + (now - self.updated) * self.limit / 60)
+        self.updated = now
+
+    # Seconds until `amount` fits (an oversized amount waits for a full budget)
+    def wait(self, amount, now):
+        if not self.limit:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.limit * (1 - HEADROOM))
+        return 0.0 if self.balance >= amount else (amount - self.balance) * 60 / self.limit
+
+    def spend(self, amount):
+        if self.limit:
+            self.balance -= amount
+
+    # Take the limit from the headers and never assume more than the server says remains
+    def sync(self, limit, remaining, now):
+        if not limit:
+            return
+        if self.limit is None:
+            self.balance = limit * (1 - HEADROOM)
+        self.limit = limit
+        self._refill(now)
+        if remaining is not None:
+            self.balance = min(self.balance, remaining - limit * HEADROOM)
+
+    def low(self, remaining):
+        return bool(self.limit) and remaining is not None and remaining < self.limit * HEADROOM
+
+# In-flight limit plus request and token budgets, adjusted from response headers
+# (lives on the engine loop)
+class AdaptiveLimiter:
+    def __init__(self):
+        self.limit = float(INITIAL_CONCURRENCY)
+        self.slow_start = True
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.requests = Budget()
+        self.tokens = Budget()
+
+    # Wait for an in-flight slot, any pause and room in both budgets, then take them
+    async def acquire(self, tokens):
+        while True:
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+                now = time.monotonic()
+                wait = max(self.paused_until - now, self.requests.wait(1, now), self.tokens.wait(tokens, now))
+                if wait <= 0:
+                    self.in_flight += 1
+                    self.requests.spend(1)
+                    self.tokens.spend(tokens)
+                    return
+            record_sleep("openai", wait, reason="throttle")
+            await asyncio.sleep(wait)
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def _decrease(self, factor):
+        now = time.monotonic()
+        self.slow_start = False
+        if now - self.last_decrease >= DECREASE_COOLDOWN:
+            self.limit = max(MIN_CONCURRENCY, self.limit * factor)
+            self.last_decrease = now
+
+    def _pause(self, seconds):
+        if seconds:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # Adjust from a successful response's rate-limit headers
+    async def update(self, headers):
+        remaining_requests = _int_header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _int_header(headers, "x-ratelimit-remaining-tokens")
+
+        async with self.condition:
+            now = time.monotonic()
+            self.requests.sync(_int_header(headers, "x-ratelimit-limit-requests"), remaining_requests, now)
+            self.tokens.sync(_int_header(headers, "x-ratelimit-limit-tokens"), remaining_tokens, now)
+
+            if self.requests.low(remaining_requests) or self.tokens.low(remaining_tokens):
+                self._decrease(0.75)
+                if remaining_requests == 0:
+                    self._pause(parse_duration(headers.get("x-ratelimit-reset-requests")))
+                if remaining_tokens == 0:
+                    self._pause(parse_duration(headers.get("x-ratelimit-reset-tokens")))
+            elif self.slow_start:
+                self.limit = min(MAX_CONCURRENCY, self.limit + 1)
+            else:
+                self.limit = min(MAX_CONCURRENCY, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    # After a 429: halve the in-flight limit, pause everything until the server's reset
+    # time, and return how long this request should back off before retrying
+    async def throttled(self, headers, attempt):
+        wait = retry_after(headers)
+        async with self.condition:
+            self._decrease(0.5)
+            self._pause(wait)
+            self.condition.notify_all()
+        return max(wait or 0, backoff(attempt))
+
+_lock = threading.Lock()
+_state = {"pid": None}
+
+async def _create_limiter():
+    return AdaptiveLimiter()
+
+# Per-process client, event loop thread and limiter (a forked worker starts its own)
+def _engine():
+    with _lock:
+        if _state["pid"] != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-engine", daemon=True).start()
+            _state.update(
+                pid=os.getpid(),
+                loop=loop,
+                client=AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0),
+                limiter=asyncio.run_coroutine_threadsafe(_create_limiter(), loop).result(),
+            )
+        return _state
+
+# Send one request with adaptive pacing and retries; returns the parsed ChatCompletion
+async def _complete(state, body):
+    client, limiter = state["client"], state["limiter"]
+    tokens = estimate_tokens(body)
+
+    for attempt in range(MAX_RETRIES + 1):
+        await limiter.acquire(tokens)
+        start = time.perf_counter()
+        try:
+            raw = await client.chat.completions.with_raw_response.create(**body)
+        except openai.RateLimitError as e:
+            observe_http("openai", time.perf_counter() - start, 429)
+            await limiter.release()
+            if getattr(e, "code", None) == "insufficient_quota" or attempt == MAX_RETRIES:
+                raise
+            wait = await limiter.throttled(e.response.headers, attempt)
+            record_retry("openai")
+            record_sleep("openai", wait)
+            await asyncio.sleep(wait)
+            continue
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            observe_http("openai", time.perf_counter() - start, getattr(e, "status_code", None) or "error")
+            await limiter.release()
+            if attempt == MAX_RETRIES:
+                raise
+            record_retry("openai")
+            wait = backoff(attempt)
+            record_sleep("openai", wait)
+            await asyncio.sleep(wait)
+            continue
+        except Exception as e:
+            observe_http("openai", time.perf_counter() - start, getattr(e, "status_code", None) or "error")
+            await limiter.release()
+            raise
+
+        observe_http("openai", time.perf_counter() - start, raw.http_response.status_code)
+        await limiter.release()
+        await limiter.update(raw.headers)
+        return raw.parse()
+
+# Submit one chat.completions request from any thread; returns a concurrent.futures.Future
+def submit(**body):
+    state = _engine()
+    return asyncio.run_coroutine_threadsafe(_complete(state, body), state["loop"])
+
+# Blocking drop-in for client.chat.completions.create, e.g. cached_completion(complete, **body)
+def complete(**body):
+    return submit(**body).result()
+
+# The same from code already running on an event loop
+async def acomplete(**body):
+    return await asyncio.wrap_future(submit(**body))
+
+# Current in-flight limit and token budget, for progress output
+def engine_status():
+    if _state["pid"] != os.getpid():
+        return "LLM engine: idle"
+    limiter = _state["limiter"]
+    budgets = "".join(f", {b.limit} {unit}/min" for b, unit in ((limiter.requests, "requests"), (limiter.tokens, "tokens")) if b.limit)
+    return f"LLM engine: {int(limiter.limit)} requests in flight allowed{budgets}"
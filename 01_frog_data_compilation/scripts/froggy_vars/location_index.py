@@ -0,0 +1,78 @@
+'''
+Location -> species inverted index built from the local IUCN assessment store.
+
+Every stored assessment's location descriptions (e.g. "Costa Rica", "Panama") are
+written to a location_index table next to the assessments themselves, so "which
+species occur here" and "where does this species occur" are indexed SQL lookups with
+no network access. Only assessments stored or refreshed since the last build are
+re-read, so keeping the index current is cheap.
+'''
+
+import json
+import zlib
+from contextlib import closing
+import pandas as pd
+from assessment_store import connect
+
+# Create the index tables alongside the assessment store's own
+def _ensure_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS location_index (assessment_id INTEGER, location TEXT)")
+    conn.execute("CREATE INDEX IF NOT EXISTS location_index_location ON location_index (location)")
+    conn.execute("CREATE INDEX IF NOT EXISTS location_index_assessment ON location_index (assessment_id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS location_indexed (assessment_id INTEGER PRIMARY KEY, fetched_at REAL)")
+
+# Location descriptions listed in one assessment
+def assessment_locations(assessment):
+    locations = []
+    for loc in assessment.get("locations", []):
+        description = (loc.get("description") or {}).get("en")
+        if description and description not in locations:
+            locations.append(description)
+    return locations
+
+# Index every assessment stored or refreshed since the last build; returns how many were (re)indexed
+def update_index(path=None):
+    with closing(connect(path)) as conn:
+        _ensure_tables(conn)
+        stale = conn.execute(
+            "SELECT a.assessment_id, a.body, a.fetched_at FROM assessments a "
+            "LEFT JOIN location_indexed i ON i.assessment_id = a.assessment_id "
+            "WHERE i.fetched_at IS NULL OR i.fetched_at < a.fetched_at"
+        ).fetchall()
+
+        for assessment_id, body, fetched_at in stale:
+            locations = assessment_locations(json.loads(zlib.decompress(body)))
+            conn.execute("DELETE FROM location_index WHERE assessment_id = ?", (assessment_id,))
+            conn.executemany("INSERT INTO location_index VALUES (?, ?)", [(assessment_id, loc) for loc in locations])
+            conn.execute("INSERT OR REPLACE INTO location_indexed VALUES (?, ?)", (assessment_id, fetched_at))
+        conn.commit()
+
+    if stale:
+        print(f"Location index: indexed {len(stale)} assessments")
+    return len(stale)
+
+# (Name, Location) pairs for the given species names (all stored species if None),
+# from the index only. Names without a stored assessment are simply absent.
+def species_locations(names=None, path=None):
+    update_index(path)
+    with closing(connect(path)) as conn:
+        df = pd.read_sql_query(
+            "SELECT t.scientific_name AS Name, l.location AS Location FROM taxa t "
+            "JOIN location_index l ON l.assessment_id = t.assessment_id",
+            conn,
+        )
+
+    if names is not None:
+        df = df[df["Name"].isin({str(n).strip() for n in names})]
+    return df.reset_index(drop=True)
+
+# Species recorded at one location
+def location_species(location, path=None):
+    update_index(path)
+    with closing(connect(path)) as conn:
+        rows = conn.execute(
+            "SELECT t.scientific_name FROM location_index l "
+            "JOIN taxa t ON t.assessment_id = l.assessment_id WHERE l.location = ? ORDER BY 1",
+            (location,),
+        ).fetchall()
+    return [row[0] for row in rows]
@@ -0,0 +1,227 @@
+'''
+Run metrics for outbound API traffic: HTTP latency histograms per service, retries and
+time spent sleeping on rate limits, and OpenAI token usage with estimated cost per
+species and per trait.
+
+HTTP calls are recorded by fetch_engine.http_get() and OpenAI calls by llm_engine; other
+call sites go through sleep() / record_completion(). The species and trait being worked
+on are attached with `with scope(species=..., trait=...)`.
+Metrics are per process. write_report(stage) writes them as a JSON run report and a
+Prometheus textfile (node_exporter textfile collector format) under METRICS_DIR.
+
+Environment:
+    METRICS_DIR   output directory (default 01_frog_data_compilation/results/metrics)
+'''
+
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_DIR = os.getenv("METRICS_DIR", "01_frog_data_compilation/results/metrics")
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implicit
+BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+# USD per 1M (prompt, completion) tokens; Batch API requests are billed at half price
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+BATCH_DISCOUNT = 0.5
+
+_lock = threading.Lock()
+_species = contextvars.ContextVar("metrics_species", default=None)
+_trait = contextvars.ContextVar("metrics_trait", default=None)
+_stage = contextvars.ContextVar("metrics_stage", default=None)
+
+def _usage_totals():
+    return {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+
+# Clear everything recorded so far (the stage runner does this before each stage)
+def reset():
+    global _http, _retries, _sleeps, _by_trait, _by_species, _started
+    with _lock:
+        _http = defaultdict(lambda: {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "status": defaultdict(int)})
+        _retries = defaultdict(int)
+        _sleeps = defaultdict(float)
+        _by_trait = defaultdict(_usage_totals)
+        _by_species = defaultdict(_usage_totals)
+        _started = time.time()
+
+reset()
+
+# Attribute LLM usage (and failed lookups, see dead_letter.py) inside the block to a
+# species, trait and/or stage
+@contextmanager
+def scope(species=None, trait=None, stage=None):
+    tokens = []
+    for var, value in ((_species, species), (_trait, trait), (_stage, stage)):
+        if value is not None:
+            tokens.append((var, var.set(value)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+# The species, trait and stage currently in scope (None where unset)
+def current_scope():
+    return {"species": _species.get(), "trait": _trait.get(), "stage": _stage.get()}
+
+### RECORDING ###
+
+# Record one outbound call's latency and outcome (HTTP status, or "error")
+def observe_http(service, seconds, status):
+    with _lock:
+        entry = _http[service]
+        entry["sum"] += seconds
+        entry["count"] += 1
+        entry["status"][str(status)] += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry["buckets"][i] += 1
+
+def record_retry(service):
+    with _lock:
+        _retries[service] += 1
+
+# Account time spent waiting to a service and reason (rate_limit, throttle, poll, ...)
+def record_sleep(service, seconds, reason="rate_limit"):
+    with _lock:
+        _sleeps[(service, reason)] += seconds
+
+# time.sleep that is accounted to a service and reason
+def sleep(service, seconds, reason="rate_limit"):
+    record_sleep(service, seconds, reason)
+    time.sleep(seconds)
+
+# Estimated USD cost of one completion
+def completion_cost(model, prompt_tokens, completion_tokens, batch=False):
+    prices = next((PRICES[m] for m in sorted(PRICES, key=len, reverse=True) if model and model.startswith(m)), None)
+    if prices is None:
+        return 0.0
+    cost = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+# Record token usage of one completion (an SDK usage object or a plain dict), attributed
+# to the current scope unless species / trait are given
+def record_completion(model, usage, species=None, trait=None, batch=False):
+    if usage is None:
+        return
+    if isinstance(usage, dict):
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    else:
+        prompt_tokens, completion_tokens = usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+    cost = completion_cost(model, prompt_tokens, completion_tokens, batch)
+    species = species or _species.get() or "-"
+    trait = trait or _trait.get() or "-"
+
+    with _lock:
+        for totals in (_by_trait[(model, trait)], _by_species[species]):
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost_usd"] += cost
+
+### EXPORT ###
+
+# Everything recorded so far as a JSON-serialisable dict
+def report(stage=None):
+    with _lock:
+        http = {
+            service: {
+                "count": entry["count"],
+                "total_seconds": round(entry["sum"], 3),
+                "mean_seconds": round(entry["sum"] / entry["count"], 4) if entry["count"] else None,
+                "buckets": {str(bound): n for bound, n in zip(BUCKETS, entry["buckets"])},
+                "status": dict(entry["status"]),
+            }
+            for service, entry in _http.items()
+        }
+        traits = [{"model": model, "trait": trait, **totals} for (model, trait), totals in _by_trait.items()]
+        species = dict(_by_species)
+        llm_totals = _usage_totals()
+        for totals in _by_trait.values():
+            for key in llm_totals:
+                llm_totals[key] += totals[key]
+
+        return {
+            "stage": stage,
+            "started_at": _started,
+            "finished_at": time.time(),
+            "http": http,
+            "retries": dict(_retries),
+            "sleep_seconds": {f"{service}:{reason}": round(s, 3) for (service, reason), s in _sleeps.items()},
+            "llm": {"totals": llm_totals, "by_trait": traits, "by_species": species},
+        }
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in labels.items() if v is not None) + "}"
+
+# Prometheus text exposition of the same metrics (species are left out to bound cardinality)
+def prometheus_text(stage=None):
+    data = report(stage)
+    lines = [
+        "# HELP frog_http_request_duration_seconds Latency of outbound API calls.",
+        "# TYPE frog_http_request_duration_seconds histogram",
+    ]
+    for service, entry in data["http"].items():
+        for bound in BUCKETS: # observe_http already counts each call in every bucket it fits
+            lines.append(f"frog_http_request_duration_seconds_bucket{_labels(stage=stage, service=service, le=bound)} {entry['buckets'][str(bound)]}")
+        lines.append(f"frog_http_request_duration_seconds_bucket{_labels(stage=stage, service=service, le='+Inf')} {entry['count']}")
+        lines.append(f"frog_http_request_duration_seconds_sum{_labels(stage=stage, service=service)} {entry['total_seconds']}")
+        lines.append(f"frog_http_request_duration_seconds_count{_labels(stage=stage, service=service)} {entry['count']}")
+
+    lines += ["# HELP frog_http_responses_total Outbound API calls by response status.", "# TYPE frog_http_responses_total counter"]
+    for service, entry in data["http"].items():
+        for status, n in entry["status"].items():
+            lines.append(f"frog_http_responses_total{_labels(stage=stage, service=service, status=status)} {n}")
+
+    lines += ["# HELP frog_retries_total Calls retried after a rate limit or error.", "# TYPE frog_retries_total counter"]
+    for service, n in data["retries"].items():
+        lines.append(f"frog_retries_total{_labels(stage=stage, service=service)} {n}")
+
+    lines += ["# HELP frog_sleep_seconds_total Time spent sleeping before retries or between polls.", "# TYPE frog_sleep_seconds_total counter"]
+    for key, seconds in data["sleep_seconds"].items():
+        service, reason = key.split(":", 1)
+        lines.append(f"frog_sleep_seconds_total{_labels(stage=stage, service=service, reason=reason)} {seconds}")
+
+    lines += ["# HELP frog_llm_tokens_total OpenAI tokens used.", "# TYPE frog_llm_tokens_total counter"]
+    for entry in data["llm"]["by_trait"]:
+        for kind in ("prompt", "completion"):
+            lines.append(f"frog_llm_tokens_total{_labels(stage=stage, model=entry['model'], trait=entry['trait'], kind=kind)} {entry[kind + '_tokens']}")
+
+    lines += ["# HELP frog_llm_cost_usd_total Estimated OpenAI spend.", "# TYPE frog_llm_cost_usd_total counter"]
+    for entry in data["llm"]["by_trait"]:
+        lines.append(f"frog_llm_cost_usd_total{_labels(stage=stage, model=entry['model'], trait=entry['trait'])} {entry['cost_usd']:.6f}")
+
+    return "\n".join(lines) + "\n"
+
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Write <stage>.json and <stage>.prom under METRICS_DIR and print a one-line summary
+def write_report(stage, directory=None):
+    directory = directory or METRICS_DIR
+    data = report(stage)
+    _atomic_write(os.path.join(directory, f"{stage}.json"), json.dumps(data, indent=2))
+    _atomic_write(os.path.join(directory, f"{stage}.prom"), prometheus_text(stage))
+
+    calls = sum(entry["count"] for entry in data["http"].values())
+    totals = data["llm"]["totals"]
+    print(f"Metrics [{stage}]: {calls} API calls, {sum(data['retries'].values())} retries, "
+          f"{sum(data['sleep_seconds'].values()):.1f}s sleeping, {totals['prompt_tokens']} + {totals['completion_tokens']} tokens "
+          f"(~${totals['cost_usd']:.4f}) -> {directory}")
+    return data
@@ -0,0 +1,77 @@
+'''
+Provenance of each stored result row: which upstream source and prompt it came from.
+
+Every stage module has a provenance(name) function. It returns the cheap metadata its
+row depends on:
+- IUCN stages: the species' latest IUCN assessment_id.
+- LLM stages: a hash of the AmphibiaWeb XML, the prompt version and the model.
+The prompt version hashes everything that shapes the requests apart from the page
+itself. The stage runner records these per species in
+results/store/provenance/<stage>.parquet. With --changed-only it recomputes the metadata
+and reruns only the species whose metadata differs, has no record yet, or has a dead
+letter.
+
+The checks are cheap:
+- The IUCN assessment_id comes from the store's taxa table. It is re-asked from the
+  API (one small request) once older than SOURCE_CHECK_AGE.
+- AmphibiaWeb pages older than SOURCE_CHECK_AGE are revalidated with a conditional
+  request, which answers 304 when the page hasn't changed.
+
+Environment:
+    SOURCE_CHECK_AGE   seconds before a source's metadata is rechecked upstream (default 1 hour)
+'''
+
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+from dotenv import load_dotenv
+from results_store import STORE_DIR
+
+load_dotenv()
+
+SOURCE_CHECK_AGE = float(os.getenv("SOURCE_CHECK_AGE", 3600))
+
+PROVENANCE_DIR = os.path.join(STORE_DIR, "provenance")
+
+# Stand-in page for building a stage's requests without a real page (prompt version hashes)
+PLACEHOLDER_PAGE = "{page}"
+
+# Short SHA-256 of a string or any JSON-serialisable value
+def fingerprint(value):
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+def provenance_path(stage):
+    return os.path.join(PROVENANCE_DIR, f"{stage}.parquet")
+
+# {name: {column: value}} recorded for a stage (values as strings), empty if none yet
+def read_provenance(stage):
+    path = provenance_path(stage)
+    if not os.path.exists(path):
+        return {}
+    df = pd.read_parquet(path)
+    columns = [c for c in df.columns if c not in ("Name", "Recorded At")]
+    return {row["Name"]: {c: row[c] for c in columns} for row in df.to_dict("records")}
+
+# Record {name: {column: value}} for these species, replacing their older records
+def update_provenance(stage, records):
+    if not records:
+        return
+    new = pd.DataFrame([{"Name": name, **record, "Recorded At": time.time()} for name, record in records.items()])
+
+    path = provenance_path(stage)
+    if os.path.exists(path):
+        existing = pd.read_parquet(path)
+        new = pd.concat([existing[~existing["Name"].isin(new["Name"])], new], ignore_index=True)
+
+    os.makedirs(PROVENANCE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    new.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+# A provenance record with every value as a string, the form it is stored and compared in
+def as_record(values):
+    return {column: str(value) for column, value in values.items()}
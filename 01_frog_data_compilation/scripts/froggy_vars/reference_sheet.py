@@ -0,0 +1,154 @@
+'''
+Single-pass reader and parsed cache for the reference workbook.
+
+Reviewers mark rows of Reference_Froggy_Spreadsheet.xlsx by filling the Name cell
+(green FF92D050 = verified). The sheet is streamed once in openpyxl read-only mode,
+collecting cell values and Name-cell fills together. The typed sheet, fills included,
+is cached as <sha>.<sheet>.parquet under the workbook's SHA-256, so verifiers neither
+open nor parse the workbook again until it changes: load_reference() returns the
+parsed columns and highlighted_names() the names with a given fill. The hash is
+only recomputed when the file's mtime or size differs from the last recorded stamp.
+
+Environment:
+    REFERENCE_CACHE_DIR   cache location (default 01_frog_data_compilation/cache/reference)
+'''
+
+import os
+import json
+import hashlib
+import pandas as pd
+from openpyxl import load_workbook
+from dotenv import load_dotenv
+from results_store import normalize
+
+load_dotenv()
+
+REFERENCE_FILE = "01_frog_data_compilation/data/Reference_Froggy_Spreadsheet.xlsx"
+REFERENCE_SHEET = "All Frogs"
+CACHE_DIR = os.getenv("REFERENCE_CACHE_DIR", "01_frog_data_compilation/cache/reference")
+
+GREEN_FILL = "FF92D050"
+NO_FILL = "00000000"
+
+# Extra column in the Parquet cache holding each row's Name-cell fill
+FILL_COLUMN = "Name Fill"
+
+# SHA-256 of the workbook file, the cache key for everything derived from it
+def workbook_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _frame_path(digest, sheet_name):
+    return os.path.join(CACHE_DIR, f"{digest}.{sheet_name}.parquet")
+
+def _stamp_path(file_path):
+    key = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, "stamps", key + ".json")
+
+# Workbook hash, reusing the last one recorded while the file's mtime and size are unchanged
+def workbook_digest(file_path):
+    stat = os.stat(file_path)
+    stamp_path = _stamp_path(file_path)
+    if os.path.exists(stamp_path):
+        with open(stamp_path, encoding="utf-8") as f:
+            stamp = json.load(f)
+        if stamp["mtime_ns"] == stat.st_mtime_ns and stamp["size"] == stat.st_size:
+            return stamp["sha256"]
+
+    digest = workbook_hash(file_path)
+    _atomic_write(stamp_path, json.dumps({"path": file_path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest}))
+    return digest
+
+# Integral floats come back as ints, matching pandas.read_excel
+def _cell_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+# Column labels as pandas.read_excel gives them: integral numbers as ints and
+# repeated labels suffixed ".1", ".2", ...
+def _header(labels):
+    header, seen = [], {}
+    for label in labels:
+        label = _cell_value(label)
+        if label in seen:
+            seen[label] += 1
+            label = f"{label}.{seen[label]}"
+        else:
+            seen[label] = 0
+        header.append(label)
+    return header
+
+# Stream one sheet in a single read-only pass; returns the sheet as a DataFrame
+# (header row = columns) and the Name-cell fill colour of each data row
+def stream_sheet(file_path=REFERENCE_FILE, sheet_name=REFERENCE_SHEET):
+    wb = load_workbook(filename=file_path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows()
+        header = _header([cell.value for cell in next(rows)])
+
+        values, fills = [], []
+        for row in rows:
+            row_values = [_cell_value(cell.value) for cell in row]
+            if all(v is None for v in row_values):
+                continue
+            fill = getattr(row[0], "fill", None) # empty cells carry no style
+            values.append(row_values + [None] * (len(header) - len(row_values)))
+            fills.append(fill.start_color.index if fill is not None else NO_FILL)
+    finally:
+        wb.close()
+
+    df = pd.DataFrame(values, columns=header).infer_objects()
+    return df, fills
+
+# Write a file atomically so an interrupted run never leaves a truncated entry
+def _atomic_write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# Name -> fill colour for every row of the sheet, from the cached parse
+def fill_index(file_path=REFERENCE_FILE, sheet_name=REFERENCE_SHEET):
+    df = load_reference(file_path, sheet_name, columns=["Name"], fills=True)
+    return build_fill_index(df, df[FILL_COLUMN])
+
+# Build the name -> fill index from a streamed sheet (first fill wins for repeated names)
+def build_fill_index(df, fills):
+    index = {}
+    for name, fill in zip(df["Name"], fills):
+        if pd.isna(name):
+            continue
+        index.setdefault(str(name).strip(), fill)
+    return index
+
+# Names whose Name cell has the given fill colour (green by default)
+def highlighted_names(file_path=REFERENCE_FILE, sheet_name=REFERENCE_SHEET, color=GREEN_FILL):
+    return {name for name, fill in fill_index(file_path, sheet_name).items() if fill == color}
+
+# Typed reference sheet (all columns, or just the requested ones), parsed from the
+# workbook only when its cached Parquet copy is missing. Column labels are strings
+# (habitat codes "1".."16"); with fills=True the Name-cell fill comes as FILL_COLUMN.
+def load_reference(file_path=REFERENCE_FILE, sheet_name=REFERENCE_SHEET, columns=None, fills=False):
+    path = _frame_path(workbook_digest(file_path), sheet_name)
+    if not os.path.exists(path):
+        df, row_fills = stream_sheet(file_path, sheet_name)
+        df.columns = [str(c) for c in df.columns]
+        df = normalize(df)
+        df[FILL_COLUMN] = row_fills
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    if columns is not None:
+        columns = ["Name"] + [c for c in columns if c != "Name"] + ([FILL_COLUMN] if fills else [])
+    df = pd.read_parquet(path, columns=columns)
+    if not fills and FILL_COLUMN in df.columns:
+        df = df.drop(columns=FILL_COLUMN)
+    return df
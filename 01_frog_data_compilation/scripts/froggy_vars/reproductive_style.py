@@ -3,23 +3,46 @@ https://amphibiaweb.org/api/ws.html
 
 1, 2 in ref sheet = 0, 1 in our sheet
 
+Cascade mode (EGG_STYLE_CASCADE=1, or --cascade here or on stage_runner.py): every page is first classified by the
+cheaper CASCADE_FIRST_MODEL and only re-asked on CASCADE_FINAL_MODEL when the answer
+doesn't parse or its confidence is below CASCADE_THRESHOLD. The first model's answer is
+kept in egg_style_confidence.csv next to the final one, so
+cross_verification/egg_style_cascade_report.py can measure the escalation rate and the
+accuracy impact against the reference sheet.
+
 '''
 
 import os
-import openai
-from openai import OpenAI
+import sys
 import pandas as pd
 from dotenv import load_dotenv
-from egg_analysis import get_url, get_xml
-import time
+from egg_analysis import get_url, get_xml, prefetch_xml
+from journal import journal_path, load_journal, append_record
+from batch_runner import run_batch, make_custom_id
+from amphibiaweb_cache import cache_summary
+from xml_sections import prune, TRAIT_SECTIONS, PRUNE_ENABLED
+from provenance import fingerprint, SOURCE_CHECK_AGE, PLACEHOLDER_PAGE
+from completion_cache import cached_completion, completion_cache_summary
+from metrics import scope
+from fetch_engine import fetch_all
+from llm_engine import complete, is_billing_error, MAX_CONCURRENCY
+from dead_letter import record_failure
 
 load_dotenv()
 
-# Send prompt to LLM to classify reproductive style and return confidence score
-def query_reproductive_style(text):
+MODEL = os.getenv("EGG_STYLE_MODEL", "gpt-4o")
+CASCADE = os.getenv("EGG_STYLE_CASCADE", "0") == "1"
+CASCADE_FIRST_MODEL = os.getenv("EGG_STYLE_CASCADE_FIRST_MODEL", "gpt-4o-mini")
+CASCADE_FINAL_MODEL = os.getenv("EGG_STYLE_CASCADE_FINAL_MODEL", "gpt-4o")
+CASCADE_THRESHOLD = float(os.getenv("EGG_STYLE_CASCADE_THRESHOLD", 80))
 
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+STYLES = {"0", "1", "2"}
+CONFIDENCE_COLUMNS = ["Egg Style", "Confidence", "Model"]
+CASCADE_COLUMNS = CONFIDENCE_COLUMNS + ["Escalated", "First Egg Style", "First Confidence"]
 
+# Build the chat.completions request body classifying one page's reproductive style
+def request_body(text, model=None):
+    text = prune(text, "reproduction") # keep only the life history sections
     prompt = (
         "Extract and return only the reproductive style (where the species lays its eggs) from the following text. "
         "Only respond with ONE WORD: '0' for aquatic reproductive style, '1' for terrestrial reproductive style, "
@@ -35,76 +58,199 @@ def query_reproductive_style(text):
         "Response:"
     )
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+    return {
+        "model": model or MODEL,
+        "messages": [
             {"role": "system", "content": prompt}
         ],
-        temperature=0.0,
-        max_tokens=10
-    )
-    
-    return response.choices[0].message.content.strip()
+        "temperature": 0.0,
+        "max_tokens": 10
+    }
+
+# Split a "style, confidence" answer; anything else becomes ("-", "-")
+def parse_style(result):
+    if result and "," in result:
+        egg_style, confidence = result.split(",", 1)
+        return egg_style.strip(), confidence.strip()
+    return "-", "-"
+
+# Whether a parsed answer can be kept without escalating: a known style with a 0-100
+# confidence of at least `threshold`
+def confident(egg_style, confidence, threshold=None):
+    threshold = CASCADE_THRESHOLD if threshold is None else threshold
+    try:
+        return egg_style in STYLES and threshold <= float(confidence) <= 100
+    except ValueError:
+        return False
+
+# Our styles 0 / 1 are the reference sheet's 1 / 2 (see the note at the top)
+def matches_reference(egg_style, reference_style):
+    return (int(egg_style), int(reference_style)) in {(0, 1), (1, 2)}
+
+# Send prompt to LLM to classify reproductive style and return confidence score
+def query_reproductive_style(text, model=None):
+    with scope(trait="egg_style"):
+        return cached_completion(complete, **request_body(text, model)).strip()
+
+# Classify one page: [egg_style, confidence, model], plus [escalated, first_egg_style,
+# first_confidence] in cascade mode
+def classify_text(text, cascade=False):
+    if not cascade:
+        return [*parse_style(query_reproductive_style(text)), MODEL]
+
+    first = parse_style(query_reproductive_style(text, CASCADE_FIRST_MODEL))
+    if confident(*first):
+        return [*first, CASCADE_FIRST_MODEL, False, *first]
+    return [*parse_style(query_reproductive_style(text, CASCADE_FINAL_MODEL)), CASCADE_FINAL_MODEL, True, *first]
+
+# Record for a species without an AmphibiaWeb page
+def missing_record(cascade=False):
+    return ["-", "-", "-", False, "-", "-"] if cascade else ["-", "-", "-"]
+
+CONFIDENCE_SPREADSHEET = "01_frog_data_compilation/results/egg_style_confidence.csv"
+
+# Classify every species in one OpenAI Batch API job. In cascade mode the low-confidence
+# answers are re-asked on the final model in a second, smaller batch.
+def classify_batch(names, client=None, cascade=False):
+    first_model = CASCADE_FIRST_MODEL if cascade else MODEL
+    requests_list = []
+    for i, name in enumerate(names):
+        genus, species = name.split(' ')
+        print(f"Preparing {i}: {genus} {species}")
+
+        with scope(species=name):
+            xml_data = get_xml(get_url(genus, species))
+        if xml_data and "NONEXISTENT PAGE" not in xml_data:
+            requests_list.append((make_custom_id(name, "egg_style"), request_body(xml_data, first_model)))
+
+    answers = run_batch(requests_list, "egg_style", client=client)
+    asked = {custom_id for custom_id, _ in requests_list}
+
+    done = {}
+    for name in names:
+        custom_id = make_custom_id(name, "egg_style")
+        if custom_id not in asked:
+            done[name] = missing_record(cascade)
+            continue
+        if custom_id not in answers:
+            record_failure("no answer in the Batch API results", species=name)
+        first = parse_style(answers.get(custom_id))
+        done[name] = [*first, first_model, False, *first] if cascade else [*first, first_model]
+
+    if not cascade:
+        return done
+
+    # Pages are re-read from the AmphibiaWeb cache rather than held in memory between batches
+    escalate = [name for name in names if make_custom_id(name, "egg_style") in asked and not confident(*done[name][:2])]
+    requests_list = []
+    for name in escalate:
+        genus, species = name.split(' ')
+        requests_list.append((make_custom_id(name, "egg_style"), request_body(get_xml(get_url(genus, species)), CASCADE_FINAL_MODEL)))
+
+    answers = run_batch(requests_list, "egg_style_escalated", client=client)
+    for name in escalate:
+        done[name][:4] = [*parse_style(answers.get(make_custom_id(name, "egg_style"))), CASCADE_FINAL_MODEL, True]
+    return done
+
+# Retrieve XML + LLM classification for one species (used by classify_sync and by
+# work_queue.py workers)
+def process_species(name, cascade=None):
+    cascade = CASCADE if cascade is None else cascade
+    genus, species = name.split(' ')
+    print(f"Processing {genus} {species}")
+
+    with scope(species=name):
+        xml_data = get_xml(get_url(genus, species))
+        if xml_data and "NONEXISTENT PAGE" not in xml_data:
+            return classify_text(xml_data, cascade)
+    return missing_record(cascade)
+
+# Classify each species, with many species in flight at once through the LLM engine
+# (which paces and retries rate-limited requests itself). Every result is journaled as
+# it completes, so an interrupted run resumes where it stopped (unless the prompt
+# version changed since). A species whose request still fails gets '-' and a dead
+# letter, and is left out of the journal.
+def classify_sync(names, cascade=False):
+    journal = journal_path("egg_style")
+    version = prompt_version(cascade)
+    done = load_journal(journal, version)
+
+    pending = [name for name in dict.fromkeys(names) if name not in done]
+    for name, record, error in fetch_all(lambda name: process_species(name, cascade), pending, MAX_CONCURRENCY):
+        # Billing or quota errors stop the run; the journal keeps progress for the next run
+        if is_billing_error(error):
+            raise RuntimeError(f"Billing error after {len(done)} species; rerun to resume") from error
+        if error is not None:
+            record_failure(error, species=name)
+            done[name] = missing_record(cascade)
+            continue
+
+        done[name] = record
+        append_record(journal, name, record, version)
+
+    return done
+
+def _models(cascade):
+    return [CASCADE_FIRST_MODEL, CASCADE_FINAL_MODEL] if cascade else [MODEL]
+
+# Hash of everything that shapes the classification apart from the page: the prompt on
+# each model, the pruned sections and, in cascade mode, the threshold
+def prompt_version(cascade=None):
+    cascade = CASCADE if cascade is None else cascade
+    return fingerprint({
+        "bodies": [request_body(PLACEHOLDER_PAGE, model) for model in _models(cascade)],
+        "sections": TRAIT_SECTIONS,
+        "prune": PRUNE_ENABLED,
+        "threshold": CASCADE_THRESHOLD if cascade else None,
+    })
+
+# Provenance of one species' row, compared by stage_runner.py --changed-only: hash of its
+# AmphibiaWeb page (revalidated with a conditional request), prompt version and model(s)
+def provenance(name, cascade=None):
+    cascade = CASCADE if cascade is None else cascade
+    genus, species = name.split(' ')
+    with scope(species=name):
+        xml_data = get_xml(get_url(genus, species), max_age=SOURCE_CHECK_AGE)
+    return {"XML SHA-256": fingerprint(xml_data) if xml_data else None, "Prompt Version": prompt_version(cascade), "Model": ",".join(_models(cascade))}
+
+# Write these species' rows to egg_style_confidence.csv, keeping the rows of any other
+# species already in it (a --retry-failed pass only reruns some of them)
+def write_confidence(df):
+    if os.path.exists(CONFIDENCE_SPREADSHEET):
+        existing = pd.read_csv(CONFIDENCE_SPREADSHEET, dtype=str, keep_default_na=False)
+        df = pd.concat([existing[~existing["Name"].isin(df["Name"])], df], ignore_index=True)
+    df.to_csv(CONFIDENCE_SPREADSHEET, index=False)
+
+# One row per species name from {name: record}. The per-species confidence scores (and
+# in cascade mode the first model's answers) are also written to egg_style_confidence.csv.
+def results_frame(names, done, cascade=None):
+    cascade = CASCADE if cascade is None else cascade
+
+    # Journal records from older runs may be shorter, and species not processed have none; pad with "-"
+    columns = CASCADE_COLUMNS if cascade else CONFIDENCE_COLUMNS
+    rows = [[name, *(done.get(name, []) + ["-"] * len(columns))[:len(columns)]] for name in names]
+    egg_style_confidence_df = pd.DataFrame(rows, columns=["Name"] + columns)
+    write_confidence(egg_style_confidence_df)
+    return egg_style_confidence_df
+
+# Egg style stage: reproductive style per species name, with confidence scores
+def run_stage(names, batch=False, cascade=None):
+    cascade = CASCADE if cascade is None else cascade
+    prefetch_xml(names)
+    done = classify_batch(names, cascade=cascade) if batch else classify_sync(names, cascade)
+    egg_style_confidence_df = results_frame(names, done, cascade)
+
+    if cascade:
+        asked = (egg_style_confidence_df["Model"] != "-").sum()
+        escalated = (egg_style_confidence_df["Escalated"] == True).sum()
+        print(f"Egg style cascade: {escalated}/{asked} species escalated from {CASCADE_FIRST_MODEL} to {CASCADE_FINAL_MODEL} "
+              f"at confidence < {CASCADE_THRESHOLD:g} ({escalated / asked if asked else 0:.1%})")
+
+    print(cache_summary())
+    print(completion_cache_summary())
+    return egg_style_confidence_df
 
 if __name__ == "__main__":
-    # Load frog dataset to augment with reproductive style and confidence
-    results_spreadsheet = "01_frog_data_compilation/results/froggy_analysis_results.csv"
-    df_all = pd.read_csv(results_spreadsheet)
-
-    df_all["Egg Style"] = None
-    egg_style_confidence_df = pd.DataFrame(columns=["Name", "Egg Style", "Confidence"])
-
-    # Loop through each species and retrieve XML + LLM classification
-    for i, row in df_all.iterrows():
-
-        genus, species = row["Name"].split(' ')
-
-        while True:
-            print(f"Processing {i}: {genus} {species}")
-
-            try:
-
-                url = get_url(genus, species)
-                xml_data = get_xml(url)
-
-                if xml_data and "NONEXISTENT PAGE" not in xml_data:
-                    result = query_reproductive_style(xml_data)
-                    if "," in result:
-                        egg_style, confidence = result.split(",")
-                        egg_style = egg_style.strip()
-                        confidence = confidence.strip()
-                    else:
-                        egg_style, confidence = "-", "-"
-                else:
-                    egg_style, confidence = "-", "-"
-
-                df_all.at[i, "Egg Style"] = egg_style
-                egg_style_confidence_df.loc[len(egg_style_confidence_df)] = [row["Name"], egg_style, confidence]
-
-                # Auto-save every 100 entries
-                if i % 100 == 0 and i != 0:
-                    print(f"Auto-saving confidence data at row {i}")
-                    egg_style_confidence_df.to_csv("01_frog_data_compilation/results/egg_style_confidence.csv", index=False)
-                
-                break # Exit retry loop on success
-
-            # Handle OpenAI rate limits with wait-and-retry
-            except openai.RateLimitError:
-                print("Rate limit hit. Trying again in 5 seconds")
-                time.sleep(5)
-                continue  # retry same row
-
-            # Handle billing or quota-related errors
-            except openai.AuthenticationError as e:
-                if "billing" in str(e).lower() or "insufficient_quota" in str(e).lower():
-                    print("Billing error: saving progress and exiting.")
-                    egg_style_confidence_df.to_csv("01_frog_data_compilation/results/egg_style_confidence.csv", index=False)
-                    df_all.to_csv("01_frog_data_compilation/results/froggy_analysis_results.csv", index=False)
-                    exit() # end program
-                else:
-                    raise
-
-    # Save final results after loop completion
-    egg_style_confidence_df.to_csv("01_frog_data_compilation/results/egg_style_confidence.csv", index=False)
-    df_all.to_csv("01_frog_data_compilation/results/froggy_analysis_results.csv", index=False)
-    print("All results saved successfully.")
\ No newline at end of file
+    # Run this stage through the stage runner, which stores its columns in the results store
+    from stage_runner import run_stages
+    run_stages(["egg_style"], batch="--batch" in sys.argv, cascade=True if "--cascade" in sys.argv else None)
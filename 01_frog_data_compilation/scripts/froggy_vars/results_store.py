@@ -0,0 +1,119 @@
+'''
+Typed columnar results store for the frog pipeline.
+
+Each stage owns one Parquet file (its column group) under results/store/, so a stage
+replaces only its own columns and never rewrites anyone else's. Missing data is a real
+null rather than the '-' sentinel, so numeric columns keep numeric dtypes. Readers ask
+for just the columns they need and only the files holding them are opened.
+
+CSV/XLSX export of the combined table (with '-' for missing values, as before) is
+available through export().
+'''
+
+import os
+import pandas as pd
+import pyarrow.parquet as pq
+
+STORE_DIR = "01_frog_data_compilation/results/store"
+
+# Values the scripts have historically used to mean "no data"
+MISSING_MARKERS = ["-", ""]
+
+def stage_path(stage):
+    return os.path.join(STORE_DIR, f"{stage}.parquet")
+
+# Stages present in the store, in stage-runner order (root stage first)
+def stored_stages():
+    from stage_runner import STAGES
+    if not os.path.isdir(STORE_DIR):
+        return []
+    stages = [f[:-len(".parquet")] for f in os.listdir(STORE_DIR) if f.endswith(".parquet")]
+    rank = {stage: i for i, stage in enumerate(STAGES)}
+    return sorted(stages, key=lambda s: (rank.get(s, len(rank)), s))
+
+# Replace '-' sentinels with nulls and give each column the narrowest fitting dtype
+def normalize(df):
+    df = df.replace(MISSING_MARKERS, pd.NA)
+    for column in df.columns:
+        if column == "Name":
+            df[column] = df[column].astype("string")
+            continue
+
+        values = df[column]
+        numeric = pd.to_numeric(values, errors="coerce")
+        if numeric.notna().sum() != values.notna().sum(): # genuinely textual column
+            df[column] = values.astype("string")
+        elif numeric.dropna().mod(1).eq(0).all():
+            df[column] = numeric.astype("Int64")
+        else:
+            df[column] = numeric.astype("Float64")
+    return df
+
+# Store (or replace) one stage's column group
+def write_stage(stage, df):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    path = stage_path(stage)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    normalize(df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+# Replace the rows of the species in `df` within a stored stage, keeping every other row
+# where it was (species not stored yet are appended)
+def merge_stage(stage, df):
+    if not os.path.exists(stage_path(stage)):
+        return write_stage(stage, df)
+
+    stored = read_stage(stage).astype(object)
+    new = normalize(df).drop_duplicates("Name").set_index("Name").astype(object)
+    replaced = stored["Name"].isin(new.index)
+
+    updated = new.loc[stored.loc[replaced, "Name"]].reset_index()
+    updated.index = stored.index[replaced]
+    added = new[~new.index.isin(stored["Name"])].reset_index()
+
+    merged = pd.concat([stored[~replaced], updated]).sort_index()
+    write_stage(stage, pd.concat([merged, added], ignore_index=True)[stored.columns])
+
+# Column names held by one stage file, read from the Parquet footer only
+def stage_columns(stage):
+    return pq.read_schema(stage_path(stage)).names
+
+# Read one stage's columns (all of them if columns is None)
+def read_stage(stage, columns=None):
+    if columns is not None:
+        columns = ["Name"] + [c for c in columns if c != "Name"]
+    return pd.read_parquet(stage_path(stage), columns=columns)
+
+# Read just the requested columns, joined on Name across whichever stages hold them.
+# With columns=None every stored column is returned.
+def read_columns(columns=None):
+    frames = []
+    for stage in stored_stages():
+        available = stage_columns(stage)
+        wanted = available if columns is None else [c for c in columns if c in available and c != "Name"]
+        if wanted or not frames:
+            frames.append(read_stage(stage, wanted))
+
+    if not frames:
+        raise FileNotFoundError(f"No stage results found in {STORE_DIR}")
+
+    combined = frames[0]
+    for df in frames[1:]:
+        combined = combined.merge(df.drop_duplicates("Name"), on="Name", how="left")
+
+    if columns is not None:
+        missing = [c for c in columns if c not in combined.columns]
+        if missing:
+            raise KeyError(f"Columns not in the results store: {missing}")
+        combined = combined[["Name"] + [c for c in columns if c != "Name"]]
+    return combined
+
+# Export the combined table (or selected columns) to CSV or XLSX, '-' for missing values
+def export(output_file, columns=None):
+    combined = read_columns(columns)
+    if output_file.endswith(".xlsx"):
+        combined.astype(object).where(combined.notna(), "-").to_excel(output_file, index=False)
+    else:
+        combined.to_csv(output_file, index=False, na_rep="-")
+    print(f"Exported {len(combined.columns) - 1} columns to {output_file}")
+    return combined
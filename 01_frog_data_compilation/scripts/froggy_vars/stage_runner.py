@@ -0,0 +1,248 @@
+'''
+Stage DAG runner for the frog pipeline.
+
+Each stage computes its own columns for the species list and stores them as its own
+column group in the Parquet results store (results_store.py); nothing rewrites another
+stage's output. Stages whose dependencies are satisfied run in parallel worker
+processes. Readers join the column groups on Name, and the combined table can be
+exported to CSV/XLSX on request.
+
+    egg_analysis ──┬── climate ────┐
+                   ├── altitude ───┤
+                   ├── egg_style ──┼── results store ──(--export)──> froggy_analysis_results.csv
+                   └── habitat ────┘
+
+Species whose lookups failed for good are stored with missing values and listed in the
+dead-letter file (dead_letter.py); --retry-failed reruns just those species for each
+stage and merges their rows into the stored column groups.
+
+Each run also records the provenance of every row (IUCN assessment_id, AmphibiaWeb XML
+hash, prompt version, model; see provenance.py). --changed-only checks that metadata
+first and recomputes only the species whose source, prompt or model changed.
+
+Usage (from the repository root):
+    python 01_frog_data_compilation/scripts/froggy_vars/stage_runner.py              # all stages
+    python 01_frog_data_compilation/scripts/froggy_vars/stage_runner.py altitude     # one stage (+ missing deps)
+    python 01_frog_data_compilation/scripts/froggy_vars/stage_runner.py --batch --workers 4
+    python 01_frog_data_compilation/scripts/froggy_vars/stage_runner.py egg_style --cascade # cheaper model first
+    python 01_frog_data_compilation/scripts/froggy_vars/stage_runner.py --retry-failed # failed species only
+    python 01_frog_data_compilation/scripts/froggy_vars/stage_runner.py --changed-only # weekly refresh
+    python 01_frog_data_compilation/scripts/froggy_vars/stage_runner.py --export 01_frog_data_compilation/results/froggy_analysis_results.xlsx
+'''
+
+import os
+import time
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+from journal import journal_path, finish_journal
+from results_store import stage_path, write_stage, merge_stage, read_stage, export
+from dead_letter import failed_species, clear_failures, failure_summary
+from functools import partial
+from fetch_engine import fetch_all
+from assessment_store import prefetch_assessments, assessment_provenance
+from provenance import read_provenance, update_provenance, as_record, SOURCE_CHECK_AGE
+
+SPECIES_FILE = "01_frog_data_compilation/data/Froggy_Spreadsheet.xlsx"
+RESULTS_FILE = "01_frog_data_compilation/results/froggy_analysis_results.csv"
+
+# Stage name -> module providing run_stage(names), upstream stages, columns stored for
+# the stage (None = all it returns), whether it supports the OpenAI Batch API mode and the
+# model cascade, and whether it reads IUCN assessments. Dict order is the column order of
+# the combined table.
+STAGES = {
+    "egg_analysis": {"module": "egg_analysis", "deps": [], "columns": None, "batch": True, "cascade": False, "iucn": False},
+    "climate": {"module": "temp_and_rainfall", "deps": ["egg_analysis"], "columns": None, "batch": False, "cascade": False, "iucn": True},
+    "altitude": {"module": "altitude", "deps": ["egg_analysis"], "columns": None, "batch": False, "cascade": False, "iucn": True},
+    "egg_style": {"module": "reproductive_style", "deps": ["egg_analysis"], "columns": ["Egg Style"], "batch": True, "cascade": True, "iucn": False},
+    "habitat": {"module": "habitat", "deps": ["egg_analysis"], "columns": None, "batch": False, "cascade": False, "iucn": True},
+}
+
+# Species names a stage runs over: the spreadsheet for the root stage, otherwise the
+# names produced by its first dependency
+def stage_species(stage):
+    deps = STAGES[stage]["deps"]
+    if not deps:
+        from egg_analysis import load_species
+        return load_species(SPECIES_FILE)
+    return read_stage(deps[0], [])["Name"].tolist()
+
+# Cascade option for a stage module's functions ({} where the stage has none, or to keep
+# the module's default)
+def cascade_option(stage, cascade):
+    return {"cascade": cascade} if STAGES[stage]["cascade"] and cascade is not None else {}
+
+# Run a stage's module over the names and return the columns stored for the stage;
+# failures inside it are recorded as dead letters under the stage name
+def compute_stage(stage, names, batch=False, cascade=None):
+    module = importlib.import_module(STAGES[stage]["module"])
+    print(f"[{stage}] running on {len(names)} species")
+
+    with metrics.scope(stage=stage):
+        if STAGES[stage]["batch"]:
+            df = module.run_stage(names, batch=batch, **cascade_option(stage, cascade))
+        else:
+            df = module.run_stage(names)
+
+    if STAGES[stage]["columns"]:
+        df = df[["Name"] + STAGES[stage]["columns"]]
+    return df
+
+# Provenance record of each name from the stage module's metadata checks, or None for a
+# species whose check raised (it then counts as changed)
+def collect_provenance(stage, names, cascade=None):
+    module = importlib.import_module(STAGES[stage]["module"])
+    records = {}
+    with metrics.scope(stage=stage):
+        for name, values, error in fetch_all(partial(module.provenance, **cascade_option(stage, cascade)), list(dict.fromkeys(names))):
+            if error is not None:
+                print(f"[{stage}] provenance check for {name} failed ({error})")
+            records[name] = as_record(values) if error is None else None
+    return records
+
+# Record the provenance of the species just computed, except those that failed: without
+# a record, the next --changed-only run picks them up again
+def store_provenance(stage, records):
+    failed = set(failed_species(stage))
+    update_provenance(stage, {name: record for name, record in records.items() if record is not None and name not in failed})
+
+# Run one stage to completion and store its column group (runs in a worker process).
+# With changed_only, only species whose provenance differs from the stored run's (or
+# that have none, or a dead letter) are recomputed and merged into the column group.
+def run_stage(stage, batch=False, changed_only=False, cascade=None):
+    names = stage_species(stage)
+    metrics.reset() # stages sharing a process report separately
+    records = collect_provenance(stage, names, cascade)
+
+    started = time.time()
+    if changed_only and os.path.exists(stage_path(stage)):
+        previous = read_provenance(stage)
+        failed = set(failed_species(stage))
+        names = [name for name, record in records.items() if record is None or previous.get(name) != record or name in failed]
+        print(f"[{stage}] {len(names)}/{len(records)} species changed since the stored run")
+        if names:
+            merge_stage(stage, compute_stage(stage, names, batch, cascade))
+        clear_failures(stage, names, before=started)
+    else:
+        write_stage(stage, compute_stage(stage, names, batch, cascade))
+
+    store_provenance(stage, {name: records[name] for name in names})
+    finish_journal(journal_path(stage))
+    metrics.write_report(stage)
+    print(f"[{stage}] stored {stage_path(stage)}")
+    return stage
+
+# Rerun the species in the dead-letter file for each stage (all stages if None) and
+# merge their rows into the stored column groups. Entries are cleared once their species
+# have been rerun; anything that fails again is recorded afresh for the next pass.
+# Stages run one after another so only one process rewrites the dead-letter file.
+def retry_failed(stages=None, batch=False, cascade=None):
+    for stage in stages or list(STAGES):
+        names = failed_species(stage)
+        if not names:
+            continue
+        if not os.path.exists(stage_path(stage)):
+            print(f"[{stage}] not stored yet; run the stage first")
+            continue
+
+        metrics.reset()
+        records = collect_provenance(stage, names, cascade)
+        started = time.time()
+        merge_stage(stage, compute_stage(stage, names, batch, cascade))
+        finish_journal(journal_path(stage))
+        clear_failures(stage, names, before=started)
+        store_provenance(stage, records)
+        metrics.write_report(f"{stage}_retry")
+        print(f"[{stage}] retried {len(names)} species into {stage_path(stage)}")
+
+    failure_summary()
+
+# Requested stages plus any upstream stage whose output doesn't exist yet
+def resolve_stages(stages):
+    selected = set()
+
+    def add(stage):
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}'. Choose from: {', '.join(STAGES)}")
+        selected.add(stage)
+        for dep in STAGES[stage]["deps"]:
+            if dep not in selected and not os.path.exists(stage_path(dep)):
+                add(dep)
+
+    for stage in stages:
+        add(stage)
+    return selected
+
+# Group stages into waves; every stage in a wave only depends on earlier waves
+def stage_waves(selected):
+    waves, finished = [], set()
+    remaining = [s for s in STAGES if s in selected]
+    while remaining:
+        wave = [s for s in remaining if all(d in finished or d not in selected for d in STAGES[s]["deps"])]
+        waves.append(wave)
+        finished.update(wave)
+        remaining = [s for s in remaining if s not in finished]
+    return waves
+
+# Fill the IUCN store once for a wave's IUCN stages before they start in parallel worker
+# processes. The fetch engine's rate limits are per process, so otherwise each stage
+# would fetch (and provenance-check) the same species at the full IUCN rate. The stages'
+# own prefetches and checks then read the store; anything that failed here is retried there.
+def prefetch_wave(wave):
+    stages = [stage for stage in wave if STAGES[stage]["iucn"]]
+    if len(stages) < 2:
+        return
+    names = list(dict.fromkeys(str(n).strip() for stage in stages for n in stage_species(stage) if len(str(n).split()) >= 2))
+    print(f"Prefetching IUCN assessments of {len(names)} species for {', '.join(stages)}")
+    for _ in fetch_all(partial(assessment_provenance, max_age=SOURCE_CHECK_AGE), names):
+        pass
+    prefetch_assessments(names)
+
+# Run the given stages (all if None) in dependency order, in parallel where possible,
+# optionally exporting the combined table to CSV/XLSX afterwards. With changed_only,
+# stages already stored only recompute species whose provenance changed. cascade turns the
+# egg style model cascade on or off (None: EGG_STYLE_CASCADE decides).
+def run_stages(stages=None, batch=False, workers=None, export_file=None, changed_only=False, cascade=None):
+    selected = resolve_stages(stages or list(STAGES))
+
+    # A fresh (not resumed) full run reprocesses every species, so older dead letters are obsolete
+    for stage in selected:
+        if not changed_only and not os.path.exists(journal_path(stage)):
+            clear_failures(stage, None, before=time.time())
+
+    for wave in stage_waves(selected):
+        if len(wave) == 1 or workers == 1:
+            for stage in wave:
+                run_stage(stage, batch, changed_only, cascade)
+        else:
+            prefetch_wave(wave)
+            with ProcessPoolExecutor(max_workers=workers or len(wave)) as pool:
+                for stage in pool.map(run_stage, wave, [batch] * len(wave), [changed_only] * len(wave), [cascade] * len(wave)):
+                    print(f"[{stage}] done")
+
+    failure_summary()
+    if export_file:
+        export(export_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run frog pipeline stages and join their outputs.")
+    parser.add_argument("stages", nargs="*", help=f"stages to run (default: all of {', '.join(STAGES)})")
+    parser.add_argument("--batch", action="store_true", help="use the OpenAI Batch API for LLM stages")
+    parser.add_argument("--workers", type=int, default=None, help="max stages running at once")
+    parser.add_argument("--export", nargs="?", const=RESULTS_FILE, default=None, metavar="FILE",
+                        help=f"export the combined table to CSV/XLSX (default: {RESULTS_FILE})")
+    parser.add_argument("--export-only", action="store_true", help="only export the combined table")
+    parser.add_argument("--retry-failed", action="store_true", help="rerun only the species in the dead-letter file")
+    parser.add_argument("--changed-only", action="store_true", help="recompute only species whose source, prompt or model changed")
+    parser.add_argument("--cascade", action="store_true", default=None, help="classify egg style with the cheaper model first (see reproductive_style.py)")
+    args = parser.parse_args()
+
+    if args.export_only:
+        export(args.export or RESULTS_FILE)
+    elif args.retry_failed:
+        retry_failed(args.stages, batch=args.batch, cascade=args.cascade)
+        if args.export:
+            export(args.export)
+    else:
+        run_stages(args.stages, batch=args.batch, workers=args.workers, export_file=args.export, changed_only=args.changed_only, cascade=args.cascade)
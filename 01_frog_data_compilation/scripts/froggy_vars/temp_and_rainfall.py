@@ -1,8 +1,11 @@
-import os
 from dotenv import load_dotenv
-import requests
 import pandas as pd
-import time
+from assessment_store import get_assessment_id, get_species_assessment, prefetch_assessments, assessment_provenance # shared local IUCN store
+from provenance import SOURCE_CHECK_AGE
+from geonames_index import find_location # precompiled geonames.xlsx lookup
+from climatology import get_series, prefetch_codes # local CCKP table
+from journal import journal_path, load_journal, append_record
+from metrics import scope
 
 load_dotenv()
 
@@ -14,52 +17,6 @@ CCKP takes loc codes and outputs temp, rainfall
 
 ### PART 1: DERIVING LOCATIONS FROM SPECIES ###
 
-TAXA_API_URL = "https://api.iucnredlist.org/api/v4/taxa/scientific_name"
-ASSESSMENT_API_URL = "https://api.iucnredlist.org/api/v4/assessment"
-
-API_KEY = os.getenv("IUCN_API_KEY")
-
-# Get the latest assessment ID for a given species
-def get_assessment_id(genus, species):
-    url = f"{TAXA_API_URL}?genus_name={genus}&species_name={species}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": API_KEY
-    }
-
-    # Get information for genus and species
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        data = response.json()
-        assessments = data.get("assessments", []) # Locate assessment id
-        if assessments:
-            latest_assessment = next((a for a in assessments if a["latest"]), None)
-            if latest_assessment:
-                return latest_assessment["assessment_id"]
-        print(f"No assessments found for {genus} {species}.")
-    else:
-        print(f"Status code {response.status_code}")
-    
-    return None
-
-# Fetch full assessment data using an assessment ID
-def get_species_assessment(assessment_id):
-    url = f"{ASSESSMENT_API_URL}/{assessment_id}"
-    headers = {
-        "accept": "application/json",
-        "Authorization": API_KEY
-    }
-
-    # Get species info from assessment id
-    response = requests.get(url, headers=headers)
-
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Status code {response.status_code}")
-        return None
-
 # Get textual location descriptions for a species from the IUCN API
 def get_location_info(genus, species):
     assessment_id = get_assessment_id(genus, species)
@@ -80,49 +37,6 @@ def get_location_info(genus, species):
 
 ### PART 2: DERIVING TEMPERATURE AND RAINFALL FROM LOCATIONS ###
 
-# Match IUCN location names to standardized location codes using geonames.xlsx
-def find_location(locations, file_path="01_frog_data_compilation/data/geonames.xlsx"):
-    xls = pd.ExcelFile(file_path) # get geonames excel
-
-    countries_df = pd.read_excel(xls, sheet_name="Countries")
-    subnationals_df = pd.read_excel(xls, sheet_name="Subnationals")
-
-    region_codes = []
-    region_countries = []
-    country_codes = []
-
-    # Match subnational entries (e.g., states or provinces)
-    for name in locations:
-        subnational_match = subnationals_df[subnationals_df["Subnational Name"].str.lower() == name.lower()] # if name in subnationals sheet
-        if not subnational_match.empty:
-            region_codes.append(subnational_match.iloc[0]["Subnational Code"]) # subnationals code
-            region_countries.append(subnational_match.iloc[0]["Country Code"])
-
-    # Match country-level entries (avoid duplicates with subnationals)
-    for name in locations:
-        country_match = countries_df[countries_df["Name"].str.lower() == name.lower()] # if name in countries sheet
-        if not country_match.empty:
-            if not country_match.iloc[0]["ISO3 Code"] in region_countries:
-                country_codes.append(country_match.iloc[0]["ISO3 Code"]) # country code
-    
-    return list(region_codes) + list(country_codes)
-
-# Retrieve climate data from World Bank CCKP API for a given location code
-def get_data(code):
-    url = f"https://cckpapi.worldbank.org/cckp/v1/cmip6-x0.25_climatology_tas,pr_climatology_annual_1995-2014_median_historical_ensemble_all_mean/{code}?_format=json"
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        data = response.json()
-        return data
-    elif response.status_code == 429:
-        print("Rate limit hit. Waiting before retrying...")
-        time.sleep(5)
-        return get_data(code)
-    else:
-        print("Failed to retrieve data. Status code:", response.status_code)
-        return None
-
 # Get latest available temperature and rainfall values for all location codes
 def temp_and_rainfall(locations):
     all_temps = []
@@ -130,70 +44,85 @@ def temp_and_rainfall(locations):
     codes = find_location(locations)
     for code in codes:
         if code:
-            data = get_data(code)
-            if data:
-                all_temps.append(float(list(data["data"]["tas"][code].values())[-1])) # get the last value in KV (most recent year as far as I understand)
-                all_rainfalls.append(float(list(data["data"]["pr"][code].values())[-1]))
+            tas, pr = get_series(code) # local climatology table, filled by prefetch_codes
+            if tas and pr:
+                all_temps.append(float(list(tas.values())[-1])) # get the last value in KV (most recent year as far as I understand)
+                all_rainfalls.append(float(list(pr.values())[-1]))
     return all_temps, all_rainfalls
 
-### PART 3: COMBINE PROCESSES TO GET INFO FOR ALL SPECIES ###
-
-if __name__ == "__main__":
-
-    # Load the results spreadsheet
-    results_spreadsheet = "01_frog_data_compilation/results/froggy_analysis_results.csv"
-    df_ref = pd.read_csv(results_spreadsheet)
-
-    # Add columns for climate statistics
-    df_ref["Min Temperature"] = None
-    df_ref["Max Temperature"] = None
-    df_ref["Mean Temperature"] = None
-    df_ref["Std. Dev. Temperature"] = None
-    df_ref["Min Rainfall"] = None
-    df_ref["Max Rainfall"] = None
-    df_ref["Mean Rainfall"] = None
-    df_ref["Std. Dev. Rainfall"] = None
+# Collect the distinct location codes of every species so each is downloaded once
+def collect_location_codes(names):
+    codes = set()
+    for name in names:
+        parts = str(name).split()
+        if len(parts) < 2:
+            continue
+        locations = get_location_info(parts[0], parts[1])
+        if locations:
+            codes.update(find_location(locations))
+    return codes
 
-    # Process each frog species to extract and calculate climate data
-    for i, row in df_ref.iterrows():
+### PART 3: COMBINE PROCESSES TO GET INFO FOR ALL SPECIES ###
 
-        genus, species = row["Name"].split(' ')
+# Climate statistic columns, in the order returned by climate_stats
+CLIMATE_COLUMNS = ["Min Temperature", "Max Temperature", "Mean Temperature", "Std. Dev. Temperature", "Min Rainfall", "Max Rainfall", "Mean Rainfall", "Std. Dev. Rainfall"]
 
-        print("Processing {}: {} {}".format(i, genus, species))
+# Min / max / mean / std. dev. of temperatures then rainfalls, '-' where missing
+def climate_stats(all_temps, all_rainfalls):
+    stats = []
+    for values in (all_temps, all_rainfalls):
+        if values:
+            stats += [min(values), max(values), sum(values) / len(values), pd.Series(values).std()]
+        else:
+            stats += ['-'] * 4
+    return stats
 
+# Climate statistics of one "Genus species" name (used by run_stage and by work_queue.py workers)
+def process_species(name):
+    genus, species = name.split(' ')
+    with scope(species=name): # failed lookups are recorded against this species
         locations = get_location_info(genus, species)
         if locations:
             all_temps, all_rainfalls = temp_and_rainfall(locations)
         else:
             all_temps, all_rainfalls = None, None
-        
-        # Store calculated temperature stats
-        if all_temps:
-            df_ref.at[i, "Min Temperature"] = min(all_temps)
-            df_ref.at[i, "Max Temperature"] = max(all_temps)
-            df_ref.at[i, "Mean Temperature"] = sum(all_temps) / len(all_temps)
-            df_ref.at[i, "Std. Dev. Temperature"] = pd.Series(all_temps).std()
-        else:
-            df_ref.at[i, "Min Temperature"] = '-'
-            df_ref.at[i, "Max Temperature"] = '-'
-            df_ref.at[i, "Mean Temperature"] = '-'
-            df_ref.at[i, "Std. Dev. Temperature"] = '-'
-
-        # Store calculated rainfall stats
-        if all_rainfalls:
-            df_ref.at[i, "Min Rainfall"] = min(all_rainfalls)
-            df_ref.at[i, "Max Rainfall"] = max(all_rainfalls)
-            df_ref.at[i, "Mean Rainfall"] = sum(all_rainfalls) / len(all_rainfalls)
-            df_ref.at[i, "Std. Dev. Rainfall"] = pd.Series(all_rainfalls).std()
-        else:
-            df_ref.at[i, "Min Rainfall"] = '-'
-            df_ref.at[i, "Max Rainfall"] = '-'
-            df_ref.at[i, "Mean Rainfall"] = '-'
-            df_ref.at[i, "Std. Dev. Rainfall"] = '-'
 
-    # Overwrite old Excel file with updated climate data
-    if os.path.exists("01_frog_data_compilation/results/froggy_analysis_results.csv"):
-        os.remove("01_frog_data_compilation/results/froggy_analysis_results.csv")
+    return climate_stats(all_temps, all_rainfalls)
+
+# Provenance of one species' row, compared by stage_runner.py --changed-only
+def provenance(name):
+    with scope(species=name):
+        return assessment_provenance(name, max_age=SOURCE_CHECK_AGE)
+
+# One row per species name from {name: climate statistics}, '-' for species not processed
+def results_frame(names, done):
+    return pd.DataFrame([[name, *done.get(name, ["-"] * len(CLIMATE_COLUMNS))] for name in names], columns=["Name"] + CLIMATE_COLUMNS)
+
+# Climate stage: temperature and rainfall statistics per species name
+def run_stage(names):
+    # Fill the IUCN store once so the loop below reads assessments locally
+    prefetch_assessments(names)
+
+    # Download each distinct CCKP location code once for the whole species list
+    prefetch_codes(collect_location_codes(names))
 
-    df_ref.to_csv("01_frog_data_compilation/results/froggy_analysis_results.csv", index=False)
-    print("Written to 01_frog_data_compilation/results/froggy_analysis_results.xlsx")
\ No newline at end of file
+    # Journal each species so an interrupted run resumes where it stopped
+    journal = journal_path("climate")
+    done = load_journal(journal)
+
+    # Process each frog species to extract and calculate climate data
+    for i, name in enumerate(names):
+        if name in done:
+            continue
+
+        print("Processing {}: {}".format(i, name))
+
+        done[name] = process_species(name)
+        append_record(journal, name, done[name])
+
+    return results_frame(names, done)
+
+if __name__ == "__main__":
+    # Run this stage through the stage runner, which stores its columns in the results store
+    from stage_runner import run_stages
+    run_stages(["climate"])
@@ -0,0 +1,294 @@
+'''
+SQLite-backed work queue of (stage, species) items, so a full run can be split across
+any number of worker processes, on this machine or on others sharing the filesystem.
+
+Workers claim a batch of items at a time under a lease, run the stage's
+process_species() on each one and commit the result to the queue. Every commit extends
+the leases on the rest of the worker's batch. A worker that dies stops renewing its
+leases; once they expire, the next claim hands its items to another worker. An item
+that raises goes back to pending, up to MAX_ATTEMPTS, and is then marked failed and
+recorded as a dead letter. `merge` builds each stage's table from the committed results
+with the stage's results_frame() and stores it in the results store, as
+stage_runner.py does. It also records each row's provenance (provenance.py), so a later
+`stage_runner.py --changed-only` refresh only recomputes what changed.
+
+Workers on other machines need the queue on a filesystem with working POSIX locks
+(SQLite relies on them); the IUCN store, AmphibiaWeb cache and LLM cache are shared the
+same way if their paths point there too.
+
+Usage (from the repository root):
+    python 01_frog_data_compilation/scripts/froggy_vars/work_queue.py enqueue                  # all stages, spreadsheet species
+    python 01_frog_data_compilation/scripts/froggy_vars/work_queue.py work --processes 4       # on every machine
+    python 01_frog_data_compilation/scripts/froggy_vars/work_queue.py status
+    python 01_frog_data_compilation/scripts/froggy_vars/work_queue.py merge --export
+
+Environment:
+    WORK_QUEUE_PATH   queue file (default 01_frog_data_compilation/cache/work_queue.sqlite)
+'''
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import importlib
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+import metrics
+from fetch_engine import fetch_all
+from llm_engine import is_billing_error
+from dead_letter import record_failure, clear_failures, failed_species
+from provenance import update_provenance, as_record
+from results_store import stage_path, write_stage, export
+from stage_runner import STAGES, SPECIES_FILE, RESULTS_FILE
+
+load_dotenv()
+
+QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", "01_frog_data_compilation/cache/work_queue.sqlite")
+
+BATCH_SIZE = 32 # items claimed at once
+LEASE_SECONDS = 600 # a claimed item is handed to another worker if not committed or renewed within this
+MAX_ATTEMPTS = 3 # attempts before an item that keeps raising is marked failed
+POLL_SECONDS = 10 # how often an idle worker checks for expired leases
+
+# Open the queue, creating it on first use. Transactions are explicit (BEGIN IMMEDIATE),
+# so a claim or commit holds the write lock from its first read.
+def connect(path=None):
+    path = path or QUEUE_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+    conn.execute("""CREATE TABLE IF NOT EXISTS items (
+        stage TEXT, species TEXT, seq INTEGER, status TEXT, owner TEXT, lease_expires REAL,
+        attempts INTEGER, result TEXT, provenance TEXT, error TEXT, updated_at REAL, PRIMARY KEY (stage, species))""")
+    conn.execute("CREATE INDEX IF NOT EXISTS items_claim ON items (status, seq)")
+    if "provenance" not in [row[1] for row in conn.execute("PRAGMA table_info(items)")]: # queues created before provenance
+        conn.execute("ALTER TABLE items ADD COLUMN provenance TEXT")
+    return conn
+
+def _marks(values):
+    return ", ".join("?" * len(values))
+
+### QUEUE OPERATIONS ###
+
+# Add a pending item per stage and species; species already queued keep their state
+# unless reset is set, which starts the stages over (and drops their dead letters)
+def enqueue(conn, stages, names, reset=False):
+    conn.execute("BEGIN IMMEDIATE")
+    for stage in stages:
+        if reset:
+            conn.execute("DELETE FROM items WHERE stage = ?", (stage,))
+        conn.executemany("INSERT OR IGNORE INTO items (stage, species, seq, status, attempts) VALUES (?, ?, ?, 'pending', 0)",
+                         [(stage, name, i) for i, name in enumerate(dict.fromkeys(names))])
+    conn.execute("COMMIT")
+
+    if reset:
+        for stage in stages:
+            clear_failures(stage, None, before=time.time())
+
+# Lease up to `limit` items to a worker: pending ones, and leased ones whose lease has
+# expired (their worker is gone). Items are taken in species order, so the stages of one
+# species tend to share a batch and its IUCN assessment.
+def claim(conn, worker, stages, limit=BATCH_SIZE, lease=LEASE_SECONDS):
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    rows = conn.execute(f"""SELECT stage, species, status FROM items WHERE stage IN ({_marks(stages)})
+        AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) ORDER BY seq, stage LIMIT ?""",
+        (*stages, now, limit)).fetchall()
+    conn.executemany("UPDATE items SET status = 'leased', owner = ?, lease_expires = ? WHERE stage = ? AND species = ?",
+                     [(worker, now + lease, stage, species) for stage, species, _ in rows])
+    conn.execute("COMMIT")
+
+    reclaimed = sum(1 for row in rows if row[2] == "leased")
+    if reclaimed:
+        print(f"Work queue: reclaimed {reclaimed} items from expired leases")
+    return [(stage, species) for stage, species, _ in rows]
+
+# Commit one item's result and provenance and renew the worker's other leases. Returns
+# False if the lease had already expired and the item was handed to someone else (result dropped).
+def commit(conn, worker, stage, species, values, provenance=None, lease=LEASE_SECONDS):
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    updated = conn.execute("""UPDATE items SET status = 'done', result = ?, provenance = ?, owner = NULL, lease_expires = NULL, error = NULL, updated_at = ?
+        WHERE stage = ? AND species = ? AND owner = ? AND status = 'leased'""",
+        (json.dumps(values, default=str), json.dumps(provenance), now, stage, species, worker)).rowcount
+    conn.execute("UPDATE items SET lease_expires = ? WHERE owner = ? AND status = 'leased'", (now + lease, worker))
+    conn.execute("COMMIT")
+    return updated == 1
+
+# Put an item that raised back to pending, or mark it failed after MAX_ATTEMPTS.
+# Returns True when it is now failed for good.
+def fail(conn, worker, stage, species, error):
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT attempts FROM items WHERE stage = ? AND species = ? AND owner = ?", (stage, species, worker)).fetchone()
+    attempts = (row[0] if row else 0) + 1
+    final = attempts >= MAX_ATTEMPTS
+    conn.execute("""UPDATE items SET status = ?, attempts = ?, error = ?, owner = NULL, lease_expires = NULL, updated_at = ?
+        WHERE stage = ? AND species = ? AND owner = ?""",
+        ("failed" if final else "pending", attempts, str(error), time.time(), stage, species, worker))
+    conn.execute("COMMIT")
+    return row is not None and final
+
+# Hand a worker's uncommitted items back (when it stops early)
+def release(conn, worker):
+    conn.execute("UPDATE items SET status = 'pending', owner = NULL, lease_expires = NULL WHERE owner = ? AND status = 'leased'", (worker,))
+
+# {stage: {status: count}}
+def queue_status(conn):
+    counts = {}
+    for stage, status, n in conn.execute("SELECT stage, status, COUNT(*) FROM items GROUP BY stage, status"):
+        counts.setdefault(stage, {})[status] = n
+    return counts
+
+# Whether any of the stages still has pending or leased items
+def outstanding(conn, stages):
+    return conn.execute(f"SELECT 1 FROM items WHERE stage IN ({_marks(stages)}) AND status IN ('pending', 'leased') LIMIT 1", stages).fetchone() is not None
+
+### WORKERS ###
+
+# (values, provenance record) of one item; the metadata is checked before the extraction
+def _run_item(modules, item):
+    stage, name = item
+    with metrics.scope(stage=stage):
+        record = as_record(modules[stage].provenance(name))
+        return modules[stage].process_species(name), record
+
+# Claim and process items of the given stages (all if None) until none are left. A
+# worker whose batch is done waits while other workers still hold leases, so items of
+# a worker that died are picked up once its leases expire.
+def work(stages=None, batch_size=BATCH_SIZE, lease=LEASE_SECONDS):
+    stages = stages or list(STAGES)
+    modules = {stage: importlib.import_module(STAGES[stage]["module"]) for stage in stages}
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"Worker {worker} started on {', '.join(stages)}")
+
+    processed = lost = 0
+    with closing(connect()) as conn:
+        try:
+            while True:
+                items = claim(conn, worker, stages, batch_size, lease)
+                if not items:
+                    if not outstanding(conn, stages):
+                        break
+                    time.sleep(POLL_SECONDS)
+                    continue
+
+                for (stage, name), result, error in fetch_all(lambda item: _run_item(modules, item), items, batch_size):
+                    # Billing or quota errors stop the worker; its uncommitted items go back to the queue
+                    if is_billing_error(error):
+                        raise RuntimeError(f"Billing error after {processed} items") from error
+                    if error is not None:
+                        if fail(conn, worker, stage, name, error):
+                            record_failure(error, species=name, stage=stage)
+                        continue
+                    # The lease ran out and the item was claimed again: its new owner's result counts
+                    if not commit(conn, worker, stage, name, *result, lease=lease):
+                        print(f"Worker {worker}: lease on {stage} {name} expired before its result was committed; result dropped")
+                        lost += 1
+                        continue
+                    processed += 1
+                    if processed % 100 == 0:
+                        print(f"Worker {worker}: {processed} items done")
+        finally:
+            release(conn, worker)
+            metrics.write_report(f"worker_{socket.gethostname()}_{os.getpid()}")
+
+    print(f"Worker {worker} finished: {processed} items done" + (f", {lost} lost to expired leases" if lost else ""))
+    return processed
+
+# Run several workers on this machine, each in its own process
+def work_processes(processes, stages=None, batch_size=BATCH_SIZE, lease=LEASE_SECONDS):
+    if processes <= 1:
+        return work(stages, batch_size, lease)
+    # The fetch engine's per-API limits are per process, so split them between the workers
+    # (unless FETCH_PROCESSES already counts workers on other machines too)
+    os.environ.setdefault("FETCH_PROCESSES", str(processes))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(work, stages, batch_size, lease) for _ in range(processes)]
+        return sum(future.result() for future in futures)
+
+### MERGE ###
+
+# Build each stage's table (all stages if None) from the committed results and store it
+# in the results store. Stages with items still pending or leased are skipped unless
+# partial is set; failed items and unfinished ones get '-' like any other missing value.
+def merge(stages=None, export_file=None, partial=False):
+    with closing(connect()) as conn:
+        for stage in stages or list(STAGES):
+            rows = conn.execute("SELECT species, status, result, provenance FROM items WHERE stage = ? ORDER BY seq", (stage,)).fetchall()
+            if not rows:
+                continue
+
+            unfinished = sum(1 for _, status, _, _ in rows if status in ("pending", "leased"))
+            if unfinished and not partial:
+                print(f"[{stage}] {unfinished} items not done yet; skipped (use --partial to merge anyway)")
+                continue
+
+            names = [species for species, _, _, _ in rows]
+            done = {species: json.loads(result) for species, status, result, _ in rows if status == "done"}
+            df = importlib.import_module(STAGES[stage]["module"]).results_frame(names, done)
+            if STAGES[stage]["columns"]:
+                df = df[["Name"] + STAGES[stage]["columns"]]
+
+            write_stage(stage, df)
+
+            # Rows of species with a dead letter get no provenance, so --changed-only reruns them
+            failed = set(failed_species(stage))
+            update_provenance(stage, {species: json.loads(record) for species, status, _, record in rows
+                                      if status == "done" and record and species not in failed})
+            print(f"[{stage}] merged {len(done)}/{len(names)} species into {stage_path(stage)}")
+
+    if export_file:
+        export(export_file)
+
+# Species names to enqueue: one per line of a text file, or the species spreadsheet
+def read_names(names_file=None):
+    if names_file:
+        with open(names_file, encoding="utf-8") as f:
+            return [line.strip() for line in f if " " in line.strip()]
+    from egg_analysis import load_species
+    return load_species(SPECIES_FILE)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Share the frog pipeline's species list between worker processes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="queue every species for the given stages")
+    enqueue_parser.add_argument("stages", nargs="*", help=f"stages to queue (default: all of {', '.join(STAGES)})")
+    enqueue_parser.add_argument("--names", default=None, metavar="FILE", help=f"species names, one per line (default: {SPECIES_FILE})")
+    enqueue_parser.add_argument("--reset", action="store_true", help="drop the stages' existing items and results first")
+
+    work_parser = commands.add_parser("work", help="process queued items until none are left")
+    work_parser.add_argument("stages", nargs="*", help="only take items of these stages")
+    work_parser.add_argument("--processes", type=int, default=1, help="worker processes to start on this machine")
+    work_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"items claimed at once (default {BATCH_SIZE})")
+    work_parser.add_argument("--lease", type=float, default=LEASE_SECONDS, help=f"lease timeout in seconds (default {LEASE_SECONDS})")
+
+    commands.add_parser("status", help="item counts per stage and status")
+
+    merge_parser = commands.add_parser("merge", help="store the finished stages in the results store")
+    merge_parser.add_argument("stages", nargs="*", help="stages to merge (default: all queued)")
+    merge_parser.add_argument("--partial", action="store_true", help="merge stages that still have unfinished items")
+    merge_parser.add_argument("--export", nargs="?", const=RESULTS_FILE, default=None, metavar="FILE",
+                              help=f"export the combined table to CSV/XLSX (default: {RESULTS_FILE})")
+    args = parser.parse_args()
+
+    for stage in getattr(args, "stages", None) or []:
+        if stage not in STAGES:
+            parser.error(f"Unknown stage '{stage}'. Choose from: {', '.join(STAGES)}")
+
+    if args.command == "enqueue":
+        stages = args.stages or list(STAGES)
+        names = read_names(args.names)
+        with closing(connect()) as conn:
+            enqueue(conn, stages, names, reset=args.reset)
+        print(f"Queued {len(names)} species for {', '.join(stages)} in {QUEUE_PATH}")
+    elif args.command == "work":
+        work_processes(args.processes, args.stages or None, args.batch_size, args.lease)
+    elif args.command == "status":
+        with closing(connect()) as conn:
+            for stage, counts in queue_status(conn).items():
+                print(f"{stage}: " + ", ".join(f"{status}={n}" for status, n in sorted(counts.items())))
+    else:
+        merge(args.stages or None, export_file=args.export, partial=args.partial)
@@ -0,0 +1,92 @@
+'''
+Trait-aware pruning of AmphibiaWeb XML before prompting.
+
+The species XML is parsed once with lxml; only the sections relevant to a trait are
+kept (e.g. description for SVL, life history for eggs and reproduction), markup is
+stripped, and the result is emitted as compact plain text. Token counts before and
+after pruning are logged. Set AMPHIBIAWEB_PRUNE=0 to send the raw XML instead.
+'''
+
+import os
+import re
+from functools import lru_cache
+from lxml import etree, html
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRUNE_ENABLED = os.getenv("AMPHIBIAWEB_PRUNE", "1") == "1"
+
+# AmphibiaWeb account sections to keep for each trait group
+TRAIT_SECTIONS = {
+    "svl": ["description", "comments"],
+    "eggs": ["life_history", "description", "comments"],
+    "reproduction": ["life_history", "comments"],
+}
+TRAIT_SECTIONS["all_traits"] = list(dict.fromkeys(TRAIT_SECTIONS["svl"] + TRAIT_SECTIONS["eggs"]))
+
+# Header fields prepended so the model knows which species the text is about
+HEADER_FIELDS = ["genus", "species", "common_name"]
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except ImportError:
+    _encoding = None
+
+# Token count of a string (tiktoken when installed, otherwise a ~4 chars/token estimate)
+def count_tokens(text):
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4
+
+# Plain text of an element; section bodies are often escaped HTML, so strip that too
+def _element_text(element):
+    text = "".join(element.itertext())
+    if "<" in text:
+        try:
+            text = html.fromstring(text).text_content()
+        except (etree.ParserError, ValueError):
+            text = re.sub(r"<[^>]+>", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+# Parse the XML once into {tag: text} for every top-level field of the species account
+@lru_cache(maxsize=8)
+def parse_sections(xml_text):
+    parser = etree.XMLParser(recover=True, resolve_entities=False)
+    root = etree.fromstring(xml_text.encode("utf-8"), parser)
+    if root is None:
+        return {}
+
+    # The account fields sit under <amphibian> (or the root itself)
+    account = root.find(".//amphibian")
+    if account is None:
+        account = root
+
+    sections = {}
+    for child in account:
+        if isinstance(child.tag, str):
+            text = _element_text(child)
+            if text:
+                sections[child.tag] = text
+    return sections
+
+# Compact text holding only the sections relevant to a trait group
+def prune(xml_text, trait):
+    if not PRUNE_ENABLED:
+        return xml_text
+    return _prune(xml_text, trait)
+
+# Memoized so per-prompt mode prunes (and logs) each trait group once per page
+@lru_cache(maxsize=16)
+def _prune(xml_text, trait):
+    sections = parse_sections(xml_text)
+    header = " ".join(sections[f] for f in HEADER_FIELDS if f in sections)
+    body = [f"{tag.replace('_', ' ').title()}: {sections[tag]}" for tag in TRAIT_SECTIONS[trait] if tag in sections]
+
+    if not body: # unexpected layout, fall back to all text without markup
+        body = [text for tag, text in sections.items() if tag not in HEADER_FIELDS]
+    pruned = "\n\n".join([header] + body if header else body)
+
+    print(f"Pruned XML for {trait}: {count_tokens(xml_text)} -> {count_tokens(pruned)} tokens")
+    return pruned
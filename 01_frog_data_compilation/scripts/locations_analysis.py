@@ -1,56 +1,49 @@
-import pandas as pd
-from froggy_vars.temp_and_rainfall import get_location_info
+import os
+import sys
+
+# froggy_vars modules import each other as siblings, so put that folder on the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "froggy_vars"))
+from location_index import species_locations
+from results_store import read_columns
+from reference_sheet import load_reference
+
+OUTPUT_FILE = "01_frog_data_compilation/results/location_discrepancies.csv"
 
 # Load our rainfall output and reference (ground truth) spreadsheet
-df_ours = pd.read_csv("01_frog_data_compilation/results/temp_and_rainfall.csv")
-df_big = pd.read_excel("01_frog_data_compilation/data/Reference_Froggy_Spreadsheet.xlsx")
-
-missing_data_locs = []
-loc_diffs = {}
-
-# Analyze discrepancies and missing values per location
-for i, row in df_ours.iterrows():
-    try:
-        genus, species = row["Name"].split(' ')
-        print("Processing {}: {} {}".format(i, genus, species))
-    
-        locations = get_location_info(genus, species)
-        if locations:
-
-            # If rainfall is missing for a species, mark all associated locations
-            if row["Min Rainfall"] == "-": # if one's missing, they all are
-                for loc in locations:
-                    if loc not in missing_data_locs:
-                        missing_data_locs.append(loc)
-                continue
-            
-            # Compare mean temperature against reference dataset
-            big_mean_temp = df_big.loc[df_big["Name"] == row["Name"]]["Mean Temperature"].values[0]
-            our_mean_temp = row["Mean Temperature"]
-
-            if not big_mean_temp or not our_mean_temp: # if either is missing, skip
-                continue
-
-            diff = abs(big_mean_temp - our_mean_temp)
-
-            if diff == 0:
-                continue
-
-            # Track the largest discrepancy per location
-            for loc in locations:
-                if loc in loc_diffs:
-                    if diff > loc_diffs[loc]:
-                        loc_diffs[loc] = diff
-                else:
-                    loc_diffs[loc] = diff
-    
-    except Exception as e:
-        print(f"Error processing row {i}: {e}")
-        continue
+df_ours = read_columns(["Min Rainfall", "Mean Temperature"])
+df_big = load_reference(columns=["Mean Temperature"]) # cached parse of Reference_Froggy_Spreadsheet.xlsx
+df_big = df_big.drop_duplicates("Name").rename(columns={"Mean Temperature": "Reference Mean Temperature"})
+
+# Species -> location pairs from the inverted index over the local IUCN store (no network)
+df_locations = species_locations(df_ours["Name"])
+unindexed = df_ours["Name"].nunique() - df_locations["Name"].nunique()
+if unindexed:
+    print(f"{unindexed} species have no stored assessment with locations and are left out; run a stage that prefetches IUCN data to include them")
+
+df = df_ours.merge(df_big, on="Name", how="left").merge(df_locations, on="Name", how="inner")
+
+# If rainfall is missing for a species, every one of its locations counts as missing data
+df["Missing Rainfall"] = df["Min Rainfall"].isna()
+
+# Mean temperature discrepancy against the reference; missing, zero or identical values don't count
+both = df["Mean Temperature"].notna() & df["Reference Mean Temperature"].notna() & (df["Mean Temperature"] != 0) & (df["Reference Mean Temperature"] != 0)
+diff = (df["Mean Temperature"] - df["Reference Mean Temperature"]).abs()
+df["Temperature Diff"] = diff.where(both & ~df["Missing Rainfall"] & (diff != 0))
+
+# One row per location, worst first
+report = df.groupby("Location").agg(
+    Species=("Name", "nunique"),
+    Missing_Rainfall=("Missing Rainfall", "sum"),
+    Discrepant_Species=("Temperature Diff", "count"),
+    Max_Temperature_Diff=("Temperature Diff", "max"),
+    Mean_Temperature_Diff=("Temperature Diff", "mean"),
+)
+report.columns = [c.replace("_", " ") for c in report.columns]
+report = report.sort_values(["Max Temperature Diff", "Missing Rainfall"], ascending=False, na_position="last")
 
 # Output discrepancy and missing-data summaries
-print("Locations with discrepancies in mean rainfall: ")
-print(loc_diffs)
+print("Locations with the largest mean temperature discrepancies / missing rainfall data:")
+print(report.head(25).to_string())
 
-print("Locations with missing rainfall data: ")
-print(missing_data_locs)
\ No newline at end of file
+report.to_csv(OUTPUT_FILE, na_rep="-")
+print(f"Full ranking of {len(report)} locations saved to {OUTPUT_FILE}")
@@ -1,14 +1,19 @@
-import sys
 import os
-import openai
+import sys
 import time
-from openai import OpenAI
 import pandas as pd
 from dotenv import load_dotenv
-from species_info_utils import get_assessment_id, get_species_assessment, find_location, get_data
+from species_info_utils import get_assessment_id, get_species_assessment, get_assessment, prefetch_assessments, find_location, get_climatology, prefetch_codes, cached_completion, completion_cache_summary
+from species_info_utils import journal_path, load_journal, append_record, finish_journal
+from species_info_utils import scope, write_report, fetch_all, complete, engine_status, is_billing_error, MAX_CONCURRENCY
+from species_info_utils import record_failure, failed_species, clear_failures, failure_summary
 
 load_dotenv()
 
+STAGE = "generic_info_retrieval"
+RESULTS_FILE = "02_generic_data_compilation/results/generic_retrieval_results.csv"
+MODEL = "gpt-4o"
+
 # Retrieve CCKP climate data for all associated location codes
 def get_cckp_info(assessment_info):
     cckp_info = None
@@ -19,11 +24,21 @@ def get_cckp_info(assessment_info):
             codes = find_location(locations)
             for code in codes:
                 if code:
-                    data = get_data(code)
+                    data = get_climatology(code) # local table, filled by prefetch_codes
                     if data:
                         cckp_info.append(data)
     return cckp_info
 
+# Distinct CCKP location codes across all species, so each is downloaded once
+def collect_location_codes(animal_list):
+    codes = set()
+    for a in animal_list:
+        genus, species = a.split()
+        assessment_info = get_assessment(genus, species)
+        if assessment_info and "locations" in assessment_info:
+            codes.update(find_location([loc["description"]["en"] for loc in assessment_info["locations"]]))
+    return codes
+
 # Main retrieval function for IUCN and/or CCKP data
 def get_info(genus, species, need_iucn, need_cckp):
     iucn_info, cckp_info = None, None
@@ -43,104 +58,146 @@ def get_info(genus, species, need_iucn, need_cckp):
 
     return iucn_info, cckp_info
 
-# Retry-safe wrapper for OpenAI chat completion
-def safe_openai_chat_completion(client, model, messages, temperature=0.0, max_tokens=150):
-    while True:
-        try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens
-            )
-            return response
-        except openai.RateLimitError as e:
-            print(f"OpenAI RateLimitError: {e}. Waiting before retrying...")
-            time.sleep(60)
-        except Exception as e:
-            print(f"OpenAI API error: {e}")
-            raise e
-
-# Use LLM to extract features based on prompt types and source text
-def query_model(iucn_text, cckp_text, prompts):
-    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    prompt_templates = {
-        "list": "Extract and return only the {var} from the following text. Output the {var} as a single comma-separated list on one line with no line breaks or bullet points. Do not include any explanations, descriptions, or additional information. If not available, respond with '-'.",
-        "number": "Extract and return only the {var} from the following text. If there are multiple values, average them. Do not include any explanations, descriptions, or additional information—just a number and unit. If not available, respond with '-'."
-    }
+PROMPT_TEMPLATES = {
+    "list": "Extract and return only the {var} from the following text. Output the {var} as a single comma-separated list on one line with no line breaks or bullet points. Do not include any explanations, descriptions, or additional information. If not available, respond with '-'.",
+    "number": "Extract and return only the {var} from the following text. If there are multiple values, average them. Do not include any explanations, descriptions, or additional information—just a number and unit. If not available, respond with '-'."
+}
 
+# Use LLM to extract features based on prompt types and source text. Every prompt is
+# submitted to the shared LLM engine at once, which paces and retries rate-limited requests.
+def query_model(iucn_text, cckp_text, prompts):
     results = {}
 
     # Flatten CCKP list into one string block
     if isinstance(cckp_text, list):
         cckp_text = "\n\n".join([str(entry) for entry in cckp_text])
 
-    for var_name, var_type in prompts.items():
-        prompt = prompt_templates[var_type[0]].format(var=var_name)
-        text = iucn_text if var_type[1] == "iucn" else cckp_text
+    def ask(var_name):
+        prompt = PROMPT_TEMPLATES[prompts[var_name][0]].format(var=var_name)
+        text = iucn_text if prompts[var_name][1] == "iucn" else cckp_text
 
         if text is None: # model doesn't have info for this field
-            results[var_name.capitalize()] = "-"
-            continue
-
-        response = safe_openai_chat_completion(
-            client,
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": f"{prompt}\n\nText: {text}"}
-            ],
-            temperature=0.0,
-            max_tokens=150
-        )
+            return "-"
+
+        with scope(trait=var_name):
+            content = cached_completion(
+                complete,
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": f"{prompt}\n\nText: {text}"}
+                ],
+                temperature=0.0,
+                max_tokens=150
+            )
+        return content.strip()
 
-        results[var_name.capitalize()] = response.choices[0].message.content.strip()
+    for var_name, content, error in fetch_all(ask, prompts, workers=len(prompts)):
+        if error is not None:
+            print(f"OpenAI API error: {error}")
+            raise error
+        results[var_name.capitalize()] = content
 
-    return results
+    return {var_name.capitalize(): results[var_name.capitalize()] for var_name in prompts}
 
-# Main script execution
-if __name__ == "__main__":
-    # List of species to query
-    animal_list = ["Mus musculus", "Herichthys cyanoguttatus", "Coris julis", "Lagothrix lagothricha", "Bombus impatiens", "Turdis migratorius", "Ambystoma maculatum"]
+# Prompts with type (list/number) and source (iucn/cckp)
+PROMPTS = {
+    "habitats and specific countries": ("list", "iucn"),
+    "diet": ("list", "iucn"),
+    "size (length or weight)": ("number", "iucn"),
+    "average annual surface temperature (tas)": ("number", "cckp")
+}
 
-    # Prompts with type (list/number) and source (iucn/cckp)
-    prompts = {
-        "habitats and specific countries": ("list", "iucn"),
-        "diet": ("list", "iucn"),
-        "size (length or weight)": ("number", "iucn"),
-        "average annual surface temperature (tas)": ("number", "cckp")
-    }
+# Retrieve every prompted feature for one species
+def retrieve_species(a, prompts=PROMPTS):
+    genus, species = a.split()
 
-    features = [f.capitalize() for f in prompts.keys()]
-    results_df = pd.DataFrame(columns=["Name"] + features)
-
-    for a in animal_list:
-        genus, species = a.split()
-
-        print(f"Processing {genus} {species}")
+    print(f"Processing {genus} {species}")
 
+    with scope(species=a): # token usage and failed lookups are attributed to this species
         prompts_2nd_vals = [item[1] for item in prompts.values()]    
         iucn_info, cckp_info = get_info(genus, species, "iucn" in prompts_2nd_vals, "cckp" in prompts_2nd_vals)
 
         # Handle missing data conditions
-        if ((iucn_info is None) and ("iucn" in prompts_2nd_vals)) and ("cckp" not in prompts_2nd_vals):
-            results_df = pd.concat([results_df, pd.DataFrame([[a] + ["-"] * len(features)], columns=results_df.columns)], ignore_index=True)
-            continue
+        missing = (
+            (((iucn_info is None) and ("iucn" in prompts_2nd_vals)) and ("cckp" not in prompts_2nd_vals)) or
+            (((cckp_info is None) and ("cckp" in prompts_2nd_vals)) and ("iucn" not in prompts_2nd_vals)) or
+            (((iucn_info is None) and ("iucn" in prompts_2nd_vals)) and (cckp_info is None and ("cckp" in prompts_2nd_vals)))
+        )
 
-        if ((cckp_info is None) and ("cckp" in prompts_2nd_vals)) and ("iucn" not in prompts_2nd_vals):
-            results_df = pd.concat([results_df, pd.DataFrame([[a] + ["-"] * len(features)], columns=results_df.columns)], ignore_index=True)
-            continue
+        # Run LLM
+        result_dict = {} if missing else query_model(iucn_info, cckp_info, prompts)
+    return {feature.capitalize(): result_dict.get(feature.capitalize(), "-") for feature in prompts}
 
-        if ((iucn_info is None) and ("iucn" in prompts_2nd_vals)) and (cckp_info is None and ("cckp" in prompts_2nd_vals)):
-            results_df = pd.concat([results_df, pd.DataFrame([[a] + ["-"] * len(features)], columns=results_df.columns)], ignore_index=True)
-            continue
+# Retrieve every prompted feature for each species, many species at once through the
+# shared LLM engine; returns one row per species. A species whose requests still fail
+# gets '-' and a dead letter, and is left out of the journal.
+def retrieve_info(animal_list, prompts=PROMPTS):
+    features = [f.capitalize() for f in prompts.keys()]
+
+    with scope(stage=STAGE):
+        # Fill the shared IUCN store once before the per-species loop
+        prefetch_assessments(animal_list)
+        if "cckp" in [item[1] for item in prompts.values()]:
+            prefetch_codes(collect_location_codes(animal_list))
+
+        # Journal each species as it completes so an interrupted run resumes where it stopped
+        # answers to other prompts or another model are not resumed
+        journal = journal_path(STAGE)
+        version = {"model": MODEL, "templates": PROMPT_TEMPLATES, "prompts": prompts}
+        done = load_journal(journal, version)
+
+        pending = [a for a in dict.fromkeys(animal_list) if a not in done]
+        for i, (a, values, error) in enumerate(fetch_all(lambda a: retrieve_species(a, prompts), pending, MAX_CONCURRENCY), 1):
+            if is_billing_error(error):
+                raise RuntimeError(f"Billing error after {len(done)} species; rerun to resume") from error
+            if error is not None:
+                record_failure(error, species=a)
+                done[a] = {}
+                continue
+            done[a] = values
+            append_record(journal, a, done[a], version)
+            if i % 100 == 0:
+                print(f"{i}/{len(pending)} species done ({engine_status()})")
+
+    return pd.DataFrame([[a] + [done[a].get(feature, "-") for feature in features] for a in animal_list], columns=["Name"] + features)
+
+# Replace the rows of retried species in the results CSV, keeping everyone else's
+def merge_results_csv(results_df, output_file=RESULTS_FILE):
+    existing = pd.read_csv(output_file, dtype=str, keep_default_na=False)
+    if list(existing.columns) != list(results_df.columns): # prompts changed since; nothing to merge into
+        return results_df
+
+    retried = results_df.set_index("Name")
+    for i, name in enumerate(existing["Name"]):
+        if name in retried.index:
+            existing.loc[i, retried.columns] = retried.loc[name].astype(str).values
+    added = results_df[~results_df["Name"].isin(existing["Name"])]
+    return pd.concat([existing, added], ignore_index=True)
+
+# Main script execution
+if __name__ == "__main__":
+    # List of species to query
+    animal_list = ["Mus musculus", "Herichthys cyanoguttatus", "Coris julis", "Lagothrix lagothricha", "Bombus impatiens", "Turdis migratorius", "Ambystoma maculatum"]
 
-        # Run LLM and save results
-        result_dict = query_model(iucn_info, cckp_info, prompts)
-        result_row = [a] + [result_dict.get(feature, "-") for feature in features]
+    # --retry-failed reruns only the species in the dead-letter file
+    started = time.time()
+    retry = "--retry-failed" in sys.argv
+    if retry:
+        animal_list = failed_species(STAGE)
+        print(f"Retrying {len(animal_list)} failed species")
+    elif not os.path.exists(journal_path(STAGE)):
+        clear_failures(STAGE, None, before=started) # a fresh run reprocesses every species
 
-        results_df = pd.concat([results_df, pd.DataFrame([result_row], columns=results_df.columns)], ignore_index=True)
+    results_df = retrieve_info(animal_list, PROMPTS)
 
     # Save final results
-    results_df.to_csv("02_generic_data_compilation/results/generic_retrieval_results.csv", index=False)
\ No newline at end of file
+    if retry and os.path.exists(RESULTS_FILE):
+        results_df = merge_results_csv(results_df)
+    results_df.to_csv(RESULTS_FILE, index=False)
+    finish_journal(journal_path(STAGE))
+    if retry:
+        clear_failures(STAGE, animal_list, before=started)
+    print(completion_cache_summary())
+    failure_summary()
+    write_report(STAGE)